@@ -0,0 +1,68 @@
+"""
+Standalone performance scripts.
+
+Each module is runnable with ``python -m benchmarks.<name>`` from the
+project root. They run against a throwaway test database so the
+development ``db.sqlite3`` is never touched.
+"""
+import os
+import statistics
+import time
+from contextlib import contextmanager
+
+
+def setup_django():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'redcard.settings')
+    import django
+
+    django.setup()
+
+
+@contextmanager
+def temporary_database(name=None):
+    """
+    Creates (and afterwards destroys) an isolated benchmark database.
+    ``name`` overrides the test database name, e.g. to put a SQLite
+    database in a file that several threads can open.
+    """
+    from django.db import connection
+    from django.test.utils import (
+        setup_test_environment,
+        teardown_test_environment,
+    )
+
+    if name is not None:
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = name
+    # Keep DEBUG off so connection.queries does not retain every statement.
+    setup_test_environment(debug=False)
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def measure(func, repeat=20, warmup=2):
+    """Runs ``func`` several times and returns latency stats in ms."""
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        'min': samples[0],
+        'median': statistics.median(samples),
+        'p95': samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        'max': samples[-1],
+    }
+
+
+def format_stats(label, stats):
+    return (
+        f'{label:<40} median {stats["median"]:8.2f} ms   '
+        f'p95 {stats["p95"]:8.2f} ms   min {stats["min"]:8.2f} ms'
+    )
@@ -0,0 +1,72 @@
+"""
+Import time and peak Python memory of AnkiImporterService for synthetic
+packages of increasing size. Each package is imported twice by different
+users; the second import finds all content already in the shared note
+table.
+
+    python -m benchmarks.anki_import --sizes 1000 10000 100000
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks import setup_django, temporary_database
+from benchmarks.apkg import write_apkg
+
+
+def run_import(user, path):
+    from django.core.files import File
+
+    from flashcards.services import AnkiImporterService
+
+    with open(path, 'rb') as fh:
+        upload = File(fh, name=os.path.basename(path))
+        tracemalloc.start()
+        start = time.perf_counter()
+        deck = AnkiImporterService(user).import_deck_from_file(upload)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return deck, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--sizes', type=int, nargs='+', default=[1000, 10000, 100000]
+    )
+    args = parser.parse_args()
+
+    setup_django()
+    with temporary_database(), tempfile.TemporaryDirectory() as tmp:
+        from django.contrib.auth.models import User
+
+        from flashcards.models import Card, Note
+
+        users = [
+            User.objects.create_user(name, password='bench')
+            for name in ('bench', 'bench2')
+        ]
+        print(
+            f'{"notes":>8} {"import":>7} {"seconds":>9} {"notes/s":>10} '
+            f'{"peak MiB":>9} {"cards":>8} {"notes":>8}'
+        )
+        for size in args.sizes:
+            path = write_apkg(os.path.join(tmp, f'synthetic_{size}.apkg'), size)
+            decks = []
+            for attempt, user in enumerate(users, 1):
+                deck, elapsed, peak = run_import(user, path)
+                decks.append(deck)
+                print(
+                    f'{size:>8} {attempt:>7} {elapsed:>9.2f} '
+                    f'{size / elapsed:>10.0f} {peak / 2 ** 20:>9.1f} '
+                    f'{Card.objects.count():>8} {Note.objects.count():>8}'
+                )
+            for deck in decks:
+                deck.delete()
+            Note.objects.unreferenced().delete()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Incremental sync of an updated package into an existing deck, compared
+with importing the updated package from scratch. The deck is synced with
+exports that differ from it by a growing fraction of notes (edited,
+added and removed in equal parts).
+
+    python -m benchmarks.anki_sync --notes 20000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks import setup_django, temporary_database
+from benchmarks.apkg import write_apkg
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--notes', type=int, default=20000)
+    parser.add_argument(
+        '--diffs', type=float, nargs='+', default=[0, 0.01, 0.1, 0.5]
+    )
+    args = parser.parse_args()
+
+    setup_django()
+    with temporary_database(), tempfile.TemporaryDirectory() as tmp:
+        from django.contrib.auth.models import User
+        from django.core.files import File
+
+        from flashcards.services import AnkiImporterService
+
+        user = User.objects.create_user('bench', password='bench')
+        importer = AnkiImporterService(user)
+
+        def load(path, deck=None):
+            with open(path, 'rb') as fh:
+                upload = File(fh, name='synthetic.apkg')
+                start = time.perf_counter()
+                if deck is None:
+                    result = importer.import_deck_from_file(upload)
+                else:
+                    result = importer.sync_deck_from_file(
+                        upload, deck, retire_missing=True
+                    )
+                return result, time.perf_counter() - start
+
+        base = write_apkg(os.path.join(tmp, 'base.apkg'), args.notes)
+        print(
+            f'{"diff":>6} {"sync s":>8} {"full import s":>14} '
+            f'{"created":>8} {"updated":>8} {"unchanged":>10} {"retired":>8}'
+        )
+        for fraction in args.diffs:
+            changed = int(args.notes * fraction / 3)
+            path = write_apkg(
+                os.path.join(tmp, f'update_{fraction}.apkg'),
+                args.notes,
+                edited=range(1, changed + 1),
+                removed=range(changed + 1, 2 * changed + 1),
+                added=changed,
+            )
+            deck, _ = load(base)
+            result, sync_seconds = load(path, deck)
+            fresh, full_seconds = load(path)
+            print(
+                f'{fraction:>6.0%} {sync_seconds:>8.2f} {full_seconds:>14.2f} '
+                f'{result.created:>8} {result.updated:>8} '
+                f'{result.unchanged:>10} {result.retired:>8}'
+            )
+            deck.delete()
+            fresh.delete()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""Synthetic Anki packages for import benchmarks."""
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import zipfile
+
+MODEL_ID = 1342697561419
+DECK_ID = 1
+
+_HANZI = [chr(c) for c in range(0x4E00, 0x4E00 + 2000)]
+_SYLLABLES = ['ma', 'shi', 'zhong', 'guo', 'ren', 'da', 'xue', 'hao', 'ni']
+_TONES = 'āáǎà'
+
+
+def _model():
+    return {
+        str(MODEL_ID): {
+            'name': 'Chinese (Basic)',
+            'flds': [
+                {'name': 'Hanzi'},
+                {'name': 'Pinyin'},
+                {'name': 'English'},
+            ],
+        }
+    }
+
+
+def _note_fields(rng):
+    size = rng.randint(1, 3)
+    hanzi = ''.join(rng.choice(_HANZI) for _ in range(size))
+    pinyin = ' '.join(
+        rng.choice(_SYLLABLES) + rng.choice(_TONES) for _ in range(size)
+    )
+    english = f'meaning of {hanzi} ' + 'x' * rng.randint(5, 60)
+    return '\x1f'.join([hanzi, pinyin, english])
+
+
+def write_collection(
+    db_path, note_count, seed=0, decks=None, edited=(), removed=(), added=0
+):
+    """
+    Writes a minimal Anki collection with ``note_count`` notes. ``decks``
+    maps Anki deck ids to names; notes are spread round-robin across them.
+
+    ``edited``, ``removed`` and ``added`` describe a later export of the
+    same collection: the note ids in ``edited`` get new content and a
+    newer ``mod``, those in ``removed`` are left out and ``added`` new
+    notes follow the original ones.
+    """
+    edited, removed = set(edited), set(removed)
+    decks = decks or {DECK_ID: 'Default'}
+    deck_ids = list(decks)
+    rng = random.Random(seed)
+    conn = sqlite3.connect(db_path)
+    conn.executescript(
+        """
+        CREATE TABLE col (id integer primary key, models text, decks text);
+        CREATE TABLE notes (
+            id integer primary key, guid text, mid integer,
+            mod integer, flds text
+        );
+        CREATE TABLE cards (id integer primary key, nid integer, did integer);
+        """
+    )
+    conn.execute(
+        'INSERT INTO col (id, models, decks) VALUES (1, ?, ?)',
+        (
+            json.dumps(_model()),
+            json.dumps(
+                {str(did): {'name': name} for did, name in decks.items()}
+            ),
+        ),
+    )
+    batch_notes, batch_cards = [], []
+    for nid in range(1, note_count + added + 1):
+        fields = _note_fields(rng)
+        if nid in removed:
+            continue
+        mod = 1
+        if nid in edited:
+            fields, mod = fields + ' (edited)', 2
+        batch_notes.append((nid, f'g{seed}-{nid}', MODEL_ID, mod, fields))
+        batch_cards.append((nid, nid, deck_ids[nid % len(deck_ids)]))
+        if len(batch_notes) >= 5000:
+            conn.executemany('INSERT INTO notes VALUES (?,?,?,?,?)', batch_notes)
+            conn.executemany('INSERT INTO cards VALUES (?,?,?)', batch_cards)
+            batch_notes, batch_cards = [], []
+    conn.executemany('INSERT INTO notes VALUES (?,?,?,?,?)', batch_notes)
+    conn.executemany('INSERT INTO cards VALUES (?,?,?)', batch_cards)
+    conn.commit()
+    conn.close()
+
+
+def write_apkg(path, note_count, seed=0, decks=None, **changes):
+    """
+    Writes a synthetic ``.apkg`` file to ``path``. ``changes`` are passed
+    on to ``write_collection``.
+    """
+    fd, db_path = tempfile.mkstemp(suffix='.anki2')
+    os.close(fd)
+    try:
+        write_collection(
+            db_path, note_count, seed=seed, decks=decks, **changes
+        )
+        with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as package:
+            package.write(db_path, 'collection.anki2')
+            package.writestr('media', '{}')
+    finally:
+        os.unlink(db_path)
+    return path
@@ -0,0 +1,50 @@
+"""
+Throughput of exporting a large deck: CardSerializer (model instances and
+DRF fields per card) against export_cards (values_list() rows), both
+encoded to JSON.
+
+    python -m benchmarks.card_export --cards 30000
+"""
+import argparse
+import json
+
+from benchmarks import format_stats, measure, setup_django, temporary_database
+from benchmarks.due_queries import seed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--cards', type=int, default=30_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    with temporary_database():
+        from flashcards.models import Card
+        from flashcards.serializers import CardSerializer, export_cards
+
+        print(f'Seeding a deck of {args.cards} cards...')
+        _, deck = seed(1, 1, args.cards)
+        cards = Card.objects.filter(deck=deck)
+
+        def model_serializer():
+            data = CardSerializer(
+                cards.select_related('note').order_by('pk'), many=True
+            ).data
+            return json.dumps(data, ensure_ascii=False)
+
+        def values_list():
+            return json.dumps(list(export_cards(cards)), ensure_ascii=False)
+
+        assert json.loads(model_serializer()) == json.loads(values_list())
+        for label, func in (
+            ('CardSerializer(many=True)', model_serializer),
+            ('export_cards()', values_list),
+        ):
+            stats = measure(func, args.repeat, warmup=1)
+            rate = args.cards / stats['median'] * 1000
+            print(f'{format_stats(label, stats)}   {rate:10.0f} cards/s')
+
+
+if __name__ == '__main__':
+    main()
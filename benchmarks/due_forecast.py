@@ -0,0 +1,93 @@
+"""
+Latency of a 90-day due forecast read from the materialized DueForecast
+rows, next to the same histogram grouped from Card.next_review, as the
+number of cards grows.
+
+    python -m benchmarks.due_forecast --decks 20 --cards 10000 100000
+"""
+import argparse
+import time
+from datetime import timedelta
+
+from benchmarks import format_stats, measure, setup_django, temporary_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--decks', type=int, default=20)
+    parser.add_argument(
+        '--cards', type=int, nargs='+', default=[10_000, 100_000, 500_000]
+    )
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    setup_django()
+    with temporary_database() as connection:
+        from django.contrib.auth.models import User
+        from django.db.models import Count, DateField, Value
+        from django.db.models.functions import Greatest, TruncDate
+        from django.utils import timezone
+
+        from benchmarks.due_queries import seed
+        from flashcards.due_forecast import (
+            get_due_forecast,
+            rebuild_due_forecast,
+            today,
+        )
+        from flashcards.models import Card
+
+        for cards in args.cards:
+            User.objects.all().delete()
+            user, _ = seed(1, args.decks, cards)
+            start = time.perf_counter()
+            rebuild_due_forecast(user.id)
+            rebuild_ms = (time.perf_counter() - start) * 1000
+            connection.cursor().execute('ANALYZE')
+
+            def materialized():
+                return get_due_forecast(user.id, args.days)
+
+            def scan():
+                start = today()
+                tz = timezone.get_default_timezone()
+                return dict(
+                    Card.objects.filter(
+                        deck__user=user,
+                        suspended=False,
+                        next_review__lt=timezone.now()
+                        + timedelta(days=args.days),
+                    )
+                    .annotate(
+                        bucket=Greatest(
+                            TruncDate('next_review', tzinfo=tz),
+                            Value(start, output_field=DateField()),
+                        )
+                    )
+                    .values('bucket')
+                    .annotate(total=Count('id'))
+                    .values_list('bucket', 'total')
+                    .order_by()
+                )
+
+            counts = dict(materialized())
+            assert sum(counts.values()) == sum(scan().values())
+            print(
+                f'{cards} cards in {args.decks} decks '
+                f'(rebuild {rebuild_ms:.0f} ms)'
+            )
+            print(
+                format_stats(
+                    '  DueForecast rows', measure(materialized, args.repeat)
+                )
+            )
+            print(
+                format_stats(
+                    '  GROUP BY over Card.next_review',
+                    measure(scan, args.repeat),
+                )
+            )
+
+
+if __name__ == '__main__':
+    main()
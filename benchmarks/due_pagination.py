@@ -0,0 +1,63 @@
+"""
+Deep-page latency of DueFlashcardsView's keyset pagination compared with
+OFFSET pagination over the same ordering.
+
+    python -m benchmarks.due_pagination --cards 1000000
+"""
+import argparse
+
+from benchmarks import format_stats, measure, setup_django, temporary_database
+from benchmarks.due_queries import seed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--cards', type=int, default=1_000_000)
+    parser.add_argument('--page-size', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    setup_django()
+    with temporary_database() as connection:
+        from django.utils import timezone
+
+        from flashcards.models import Card
+        from flashcards.pagination import encode_cursor, keyset_page
+
+        print(f'Seeding {args.cards} cards for one user...')
+        user, _ = seed(1, 20, args.cards)
+        connection.cursor().execute('ANALYZE')
+
+        due = Card.objects.filter(
+            deck__user=user, next_review__lte=timezone.now()
+        )
+        ordered = due.order_by('next_review', 'id')
+        total = due.count()
+        print(f'{total} due cards, page size {args.page_size}\n')
+
+        depth = 0
+        while depth < total:
+            anchor = ordered[depth - 1] if depth else None
+            cursor = encode_cursor(anchor) if anchor else None
+
+            def offset_page(depth=depth):
+                return list(ordered[depth : depth + args.page_size])
+
+            def cursor_page(cursor=cursor):
+                return keyset_page(due, args.page_size, cursor)
+
+            print(
+                format_stats(
+                    f'offset  @ {depth}', measure(offset_page, args.repeat)
+                )
+            )
+            print(
+                format_stats(
+                    f'keyset  @ {depth}', measure(cursor_page, args.repeat)
+                )
+            )
+            depth = depth * 10 if depth else 1000
+
+
+if __name__ == '__main__':
+    main()
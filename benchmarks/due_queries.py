@@ -0,0 +1,129 @@
+"""
+Query plans and latency of the Card scheduling queries, with and without
+the composite indexes from migration 0005.
+
+    python -m benchmarks.due_queries --cards 1000000 --decks 200
+"""
+import argparse
+import random
+from datetime import timedelta
+
+from benchmarks import format_stats, measure, setup_django, temporary_database
+
+
+def seed(users, decks_per_user, cards, batch_size=10000):
+    from django.contrib.auth.models import User
+    from django.utils import timezone
+
+    from flashcards.models import Card, Deck, Note
+
+    now = timezone.now()
+    owners = [
+        User.objects.create_user(f'bench{i}', password='bench')
+        for i in range(users)
+    ]
+    decks = Deck.objects.bulk_create(
+        Deck(user=owner, name=f'Deck {owner.pk}-{i}')
+        for owner in owners
+        for i in range(decks_per_user)
+    )
+    note = Note.objects.intern('字', 'zì', 'character')
+    rng = random.Random(42)
+    batch = []
+    for i in range(cards):
+        seen = rng.random() < 0.6
+        # Seen cards are spread over the next two months with a small
+        # overdue tail; unseen cards keep their creation-time default.
+        offset = rng.uniform(-3, 60) if seen else rng.uniform(-30, 0)
+        batch.append(
+            Card(
+                deck=decks[i % len(decks)],
+                note=note,
+                next_review=now + timedelta(days=offset),
+                seen=seen,
+            )
+        )
+        if len(batch) >= batch_size:
+            Card.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        Card.objects.bulk_create(batch)
+    return owners[0], decks[0]
+
+
+def hot_queries(user, deck):
+    from django.utils import timezone
+
+    from flashcards.models import Card, Deck
+
+    now = timezone.now()
+    return {
+        'Deck.get_due_cards().count()': lambda: deck.get_due_cards().count(),
+        'Deck.next_session()': lambda: deck.next_session(),
+        'due cards for user (limit 10)': lambda: list(
+            Card.objects.filter(deck__user=user, next_review__lte=now)
+            .order_by('next_review')[:10]
+        ),
+        'Deck.objects.with_stats() for user': lambda: list(
+            Deck.objects.filter(user=user).with_stats(now)
+        ),
+    }
+
+
+def explain(qs):
+    return '\n'.join(
+        f'      {line}' for line in qs.explain().splitlines()
+    )
+
+
+def report(title, user, deck, repeat):
+    from django.utils import timezone
+
+    from flashcards.models import Card
+
+    print(f'\n== {title}')
+    now = timezone.now()
+    print('  plan: review cards of a deck')
+    print(explain(deck.cards.filter(next_review__lte=now, seen=True)[:15]))
+    print('  plan: due cards for user')
+    print(
+        explain(
+            Card.objects.filter(deck__user=user, next_review__lte=now)
+            .order_by('next_review')[:10]
+        )
+    )
+    for label, func in hot_queries(user, deck).items():
+        print(format_stats(label, measure(func, repeat=repeat)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--cards', type=int, default=1_000_000)
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--decks', type=int, default=20, help='per user')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_django()
+    with temporary_database() as connection:
+        from flashcards.models import Card
+
+        print(f'Seeding {args.cards} cards...')
+        user, deck = seed(args.users, args.decks, args.cards)
+        indexes = Card._meta.indexes
+
+        with connection.schema_editor() as editor:
+            for index in indexes:
+                editor.remove_index(Card, index)
+        connection.cursor().execute('ANALYZE')
+        report('without composite indexes', user, deck, args.repeat)
+
+        with connection.schema_editor() as editor:
+            for index in indexes:
+                editor.add_index(Card, index)
+        connection.cursor().execute('ANALYZE')
+        report('with composite indexes', user, deck, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Latency of building the all-decks study session (k-way merge of per-deck
+LIMIT streams) as the number of cards grows, next to a single query that
+orders all of the user's due cards.
+
+    python -m benchmarks.global_queue --decks 20 --cards 10000 100000
+"""
+import argparse
+
+from benchmarks import format_stats, measure, setup_django, temporary_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--decks', type=int, default=20)
+    parser.add_argument(
+        '--cards', type=int, nargs='+', default=[10_000, 100_000, 500_000]
+    )
+    parser.add_argument('--session-size', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    setup_django()
+    with temporary_database() as connection:
+        from django.contrib.auth.models import User
+        from django.core.cache import cache
+        from django.utils import timezone
+
+        from benchmarks.due_queries import seed
+        from flashcards.models import Card
+        from flashcards.study_queue import global_queue
+
+        for cards in args.cards:
+            User.objects.all().delete()
+            cache.clear()
+            user, _ = seed(1, args.decks, cards)
+            connection.cursor().execute('ANALYZE')
+            now = timezone.now()
+
+            def merged():
+                return global_queue(
+                    user, daily_limit=args.session_size, now=now
+                )
+
+            def single_query():
+                return list(
+                    Card.objects.filter(
+                        deck__user=user, next_review__lte=now, suspended=False
+                    )
+                    .select_related('note')
+                    .order_by('next_review', 'id')[: args.session_size]
+                )
+
+            print(f'{cards} cards in {args.decks} decks')
+            print(format_stats('  k-way merge', measure(merged, args.repeat)))
+            print(
+                format_stats(
+                    '  ORDER BY over all due cards',
+                    measure(single_query, args.repeat),
+                )
+            )
+
+
+if __name__ == '__main__':
+    main()
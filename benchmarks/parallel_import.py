@@ -0,0 +1,121 @@
+"""
+Batch import of several synthetic packages through the parallel importer,
+for an increasing number of parse processes, next to the sequential
+AnkiImporterService. Every package holds ``--decks`` Anki decks, so each
+one is split into that many decks.
+
+    python -m benchmarks.parallel_import --files 8 --workers 1 2 4
+"""
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from benchmarks import setup_django, temporary_database
+from benchmarks.apkg import write_apkg
+
+
+def run_sequential(user, paths):
+    from django.core.files import File
+
+    from flashcards.services import AnkiImporterService
+
+    start = time.perf_counter()
+    for path in paths:
+        with open(path, 'rb') as fh:
+            AnkiImporterService(user).import_deck_from_file(
+                File(fh, name=os.path.basename(path))
+            )
+    return time.perf_counter() - start
+
+
+def run_parallel(user, paths, workers):
+    from flashcards import parallel_import
+    from flashcards.models import ImportJob
+
+    jobs = [
+        ImportJob.objects.create(
+            user=user, file_name=os.path.basename(path), file_path=path
+        )
+        for path in paths
+    ]
+    pool = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=get_context('spawn'),
+        initializer=parallel_import._init_worker,
+    )
+    # Start the workers before timing, as a long-running server would have.
+    list(pool.map(abs, range(workers)))
+    parallel_import._pool = pool
+    failures = []
+    try:
+        start = time.perf_counter()
+        parallel_import.import_packages(
+            jobs,
+            on_finished=lambda job, decks, error: error
+            and failures.append(error),
+        )
+        elapsed = time.perf_counter() - start
+    finally:
+        parallel_import._pool = None
+        pool.shutdown()
+    if failures:
+        raise failures[0]
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument('--files', type=int, default=8)
+    parser.add_argument('--notes', type=int, default=20000)
+    parser.add_argument('--decks', type=int, default=2)
+    parser.add_argument(
+        '--workers',
+        type=int,
+        nargs='+',
+        default=sorted({1, 2, os.cpu_count() or 1}),
+    )
+    args = parser.parse_args()
+
+    setup_django()
+    with temporary_database(), tempfile.TemporaryDirectory() as tmp:
+        from django.contrib.auth.models import User
+
+        from flashcards.models import Deck, Note
+
+        user = User.objects.create_user('bench', password='bench')
+        paths = [
+            write_apkg(
+                os.path.join(tmp, f'synthetic_{i}.apkg'),
+                args.notes,
+                seed=i,
+                decks={d + 1: f'Deck {d}' for d in range(args.decks)},
+            )
+            for i in range(args.files)
+        ]
+        total = args.files * args.notes
+
+        def reset():
+            Deck.objects.all().delete()
+            Note.objects.unreferenced().delete()
+
+        print(f'{os.cpu_count()} CPUs, {args.files} files, {total} notes')
+        print(f'{"importer":<16}{"seconds":>9}{"notes/s":>10}{"speedup":>9}')
+        baseline = run_sequential(user, paths)
+        print(f'{"sequential":<16}{baseline:>9.2f}{total / baseline:>10.0f}')
+        for workers in args.workers:
+            reset()
+            elapsed = run_parallel(user, paths, workers)
+            print(
+                f'{f"{workers} workers":<16}{elapsed:>9.2f}'
+                f'{total / elapsed:>10.0f}{baseline / elapsed:>8.2f}x'
+            )
+            print(f'{"":<16}{Deck.objects.count()} decks created')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+"""
+Concurrent review load test. Every simulated user runs study sessions in
+its own thread (fetch a page of due cards, answer each one through the
+``update-performance`` endpoint) and the harness reports throughput,
+latency percentiles and failed requests per database configuration.
+
+Each configuration runs in a child process with its own environment, so
+the settings are built exactly as ``redcard/settings.py`` would build
+them in production:
+
+    python -m benchmarks.review_load --users 16 --sessions 5
+    python -m benchmarks.review_load --config sqlite-stock --sync-writes
+
+The ``postgresql`` configuration uses the DB_NAME/DB_USER/DB_PASSWORD/
+DB_HOST/DB_PORT variables of the calling environment.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks import setup_django, temporary_database
+
+CONFIGS = {
+    'sqlite-stock': {
+        'DB_ENGINE': 'sqlite',
+        'SQLITE_TUNED': '0',
+        'DB_CONN_MAX_AGE': '0',
+    },
+    'sqlite-wal': {
+        'DB_ENGINE': 'sqlite',
+        'SQLITE_TUNED': '1',
+        'DB_CONN_MAX_AGE': '0',
+    },
+    'sqlite-wal-persistent': {
+        'DB_ENGINE': 'sqlite',
+        'SQLITE_TUNED': '1',
+        'DB_CONN_MAX_AGE': '60',
+    },
+    'postgresql': {'DB_ENGINE': 'postgresql', 'DB_CONN_MAX_AGE': '60'},
+}
+DEFAULT_CONFIGS = ['sqlite-stock', 'sqlite-wal', 'sqlite-wal-persistent']
+
+
+def percentile(samples, fraction):
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def seed(users, cards):
+    from django.contrib.auth.models import User
+
+    from flashcards.models import Card, Deck, Note
+
+    note_ids = Note.objects.intern_many(
+        [(f'字{n}', 'zì', 'character') for n in range(cards)]
+    )
+    created = []
+    for i in range(users):
+        user = User.objects.create_user(f'load{i}', password='load')
+        deck = Deck.objects.create(user=user, name='Load test')
+        Card.objects.bulk_create(
+            [
+                Card(deck=deck, note_id=note_id)
+                for note_id in note_ids
+            ]
+        )
+        created.append(user)
+    return created
+
+
+def simulate_user(user, sessions, page_size, barrier, timings, errors):
+    from django.db import connections
+    from django.test import Client
+    from django.urls import reverse
+
+    client = Client()
+    client.force_login(user)
+    due_url = reverse('due-flashcards')
+
+    def timed(method, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = method(*args, **kwargs)
+        except Exception as e:
+            errors.append(f'{type(e).__name__}: {e}')
+            return None
+        timings.append((time.perf_counter() - start) * 1000)
+        if response.status_code >= 400:
+            errors.append(f'HTTP {response.status_code}')
+            return None
+        return response
+
+    barrier.wait()
+    try:
+        for _ in range(sessions):
+            response = timed(client.get, due_url, {'limit': page_size})
+            if response is None:
+                continue
+            for card in response.json()['results']:
+                timed(
+                    client.post,
+                    reverse('update-performance', args=[card['id']]),
+                    {'is_correct': 'true'},
+                )
+    finally:
+        connections.close_all()
+
+
+def run_config(args):
+    """Child process: runs the workload once against the configured DB."""
+    setup_django()
+    from django.conf import settings
+    from django.test.utils import override_settings
+
+    db_file = None
+    if settings.DATABASES['default']['ENGINE'].endswith('sqlite3'):
+        # Threads cannot share Django's in-memory test database.
+        db_file = os.path.join(tempfile.mkdtemp(), 'review_load.sqlite3')
+
+    with temporary_database(db_file), override_settings(
+        REVIEW_WRITE_BEHIND=not args.sync_writes,
+        REVIEW_FLUSH_INTERVAL=args.flush_interval,
+    ):
+        users = seed(args.users, args.cards)
+        timings, errors = [], []
+        barrier = threading.Barrier(len(users) + 1)
+        threads = [
+            threading.Thread(
+                target=simulate_user,
+                args=(
+                    user,
+                    args.sessions,
+                    args.page_size,
+                    barrier,
+                    timings,
+                    errors,
+                ),
+            )
+            for user in users
+        ]
+        for thread in threads:
+            thread.start()
+        barrier.wait()
+        start = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+    timings.sort()
+    print(
+        json.dumps(
+            {
+                'requests': len(timings),
+                'errors': len(errors),
+                'error_types': sorted(set(errors)),
+                'throughput': len(timings) / elapsed,
+                'p50': percentile(timings, 0.5) if timings else None,
+                'p99': percentile(timings, 0.99) if timings else None,
+                'max': timings[-1] if timings else None,
+            }
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument(
+        '--config',
+        action='append',
+        choices=sorted(CONFIGS),
+        help='configuration to run (repeatable, default: the SQLite ones)',
+    )
+    parser.add_argument('--users', type=int, default=16)
+    parser.add_argument('--sessions', type=int, default=5)
+    parser.add_argument('--page-size', type=int, default=20)
+    parser.add_argument('--cards', type=int, default=200)
+    parser.add_argument(
+        '--sync-writes',
+        action='store_true',
+        help='update cards inside the request instead of via the log',
+    )
+    parser.add_argument('--flush-interval', type=float, default=0.5)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_config(args)
+        return
+
+    child_args = [
+        '--users', str(args.users),
+        '--sessions', str(args.sessions),
+        '--page-size', str(args.page_size),
+        '--cards', str(args.cards),
+        '--flush-interval', str(args.flush_interval),
+    ]
+    if args.sync_writes:
+        child_args.append('--sync-writes')
+
+    print(
+        f'{"configuration":<24}{"requests":>9}{"errors":>8}'
+        f'{"req/s":>9}{"p50 ms":>9}{"p99 ms":>9}{"max ms":>9}'
+    )
+    for name in args.config or DEFAULT_CONFIGS:
+        env = {**os.environ, **CONFIGS[name]}
+        proc = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.review_load', '--child']
+            + child_args,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        if proc.returncode:
+            print(f'{name:<24}failed: {proc.stderr.strip().splitlines()[-1]}')
+            continue
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        if not result['requests']:
+            print(f'{name:<24}every request failed')
+        else:
+            print(
+                f'{name:<24}{result["requests"]:>9}{result["errors"]:>8}'
+                f'{result["throughput"]:>9.0f}{result["p50"]:>9.2f}'
+                f'{result["p99"]:>9.2f}{result["max"]:>9.2f}'
+            )
+        for error in result['error_types']:
+            print(f'{"":<24}{error}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Throughput of the schedulers in flashcards.scheduling, in cards per
+second, for in-memory batches and for a batch review written to the DB.
+
+    python -m benchmarks.scheduling --cards 100000
+"""
+import argparse
+import random
+import time
+
+from benchmarks import setup_django, temporary_database
+
+
+def synthetic_states(count, rng):
+    from flashcards.scheduling import ReviewStates
+
+    return ReviewStates(
+        [rng.randint(0, 8) for _ in range(count)],
+        [rng.uniform(0, 60) for _ in range(count)],
+        [rng.uniform(1.3, 2.8) for _ in range(count)],
+        [rng.choice([0.0, rng.uniform(0.5, 90)]) for _ in range(count)],
+        [rng.uniform(1, 10) for _ in range(count)],
+    )
+
+
+def bench_in_memory(count):
+    from flashcards.scheduling import SCHEDULERS
+
+    rng = random.Random(1)
+    states = synthetic_states(count, rng)
+    grades = [rng.random() < 0.8 for _ in range(count)]
+    elapsed = [rng.uniform(0, 30) for _ in range(count)]
+    for name, scheduler in SCHEDULERS.items():
+        start = time.perf_counter()
+        scheduler.schedule(states, grades, elapsed)
+        elapsed_s = time.perf_counter() - start
+        print(f'  {name:<10} {count / elapsed_s:>12,.0f} cards/s')
+
+
+def bench_reschedule(count):
+    from django.contrib.auth.models import User
+    from django.utils import timezone
+
+    from flashcards.models import Card, Deck, Note
+    from flashcards.scheduling import SCHEDULERS
+
+    user = User.objects.create_user('bench', password='bench')
+    deck = Deck.objects.create(user=user, name='Bench')
+    now = timezone.now()
+    note = Note.objects.intern('字', 'zì', 'character')
+    Card.objects.bulk_create(
+        [
+            Card(
+                deck=deck,
+                note=note,
+                seen=True,
+                consecutive_correct=i % 6,
+                interval=(i % 6) ** 2 or 1,
+                last_reviewed_at=now,
+            )
+            for i in range(count)
+        ],
+        batch_size=5000,
+    )
+    for name in SCHEDULERS:
+        deck.scheduler = name
+        deck.save(update_fields=['scheduler'])
+        start = time.perf_counter()
+        changed = deck.reschedule()
+        elapsed_s = time.perf_counter() - start
+        print(
+            f'  {name:<10} {count / elapsed_s:>12,.0f} cards/s '
+            f'({changed} due dates changed)'
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--cards', type=int, default=100_000)
+    args = parser.parse_args()
+
+    setup_django()
+    print(f'Scheduling {args.cards} cards in memory:')
+    bench_in_memory(args.cards)
+    with temporary_database():
+        print(f'Rescheduling a {args.cards}-card deck (read + bulk_update):')
+        bench_reschedule(args.cards)
+
+
+if __name__ == '__main__':
+    main()
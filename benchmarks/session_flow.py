@@ -0,0 +1,109 @@
+"""
+Per-answer latency, query count and write count of the HTMX
+study-session flow, measured through the Django test client. Answers of
+prefetched cards go to ``grade_card_view`` in the background; the others
+wait for ``update_card_view`` to render the next cards.
+
+    python -m benchmarks.session_flow --sessions 20
+"""
+import argparse
+import time
+
+from benchmarks import setup_django, temporary_database
+
+
+def seed_deck(user, cards):
+    from flashcards.models import Card, Deck, Note
+
+    deck = Deck.objects.create(user=user, name='Session bench')
+    Card.objects.bulk_create(
+        [
+            Card(deck=deck, note_id=note_id)
+            for note_id in Note.objects.intern_many(
+                [(f'字{i}', 'zì', 'character') for i in range(cards)]
+            )
+        ]
+    )
+    return deck
+
+
+def run_session(client, deck, stats):
+    """
+    Answers a whole session the way the page does: prefetched cards are
+    graded through ``grade_card`` while the next one is already shown, and
+    only the last card of each window waits for ``update_card``.
+    """
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from django.urls import reverse
+
+    response = client.get(reverse('start_session', args=[deck.id]))
+    while response.context and response.context['steps']:
+        steps = response.context['steps']
+        for i, step in enumerate(steps):
+            last = i == len(steps) - 1 and not response.context['finished']
+            url_name = 'update_card' if last else 'grade_card'
+            with CaptureQueriesContext(connection) as ctx:
+                start = time.perf_counter()
+                reply = client.post(
+                    reverse(url_name, args=[step['card']['id']]),
+                    {'is_correct': 'true'},
+                )
+                elapsed = (time.perf_counter() - start) * 1000
+            stats['waited' if last else 'background'].append(elapsed)
+            stats['queries'].append(len(ctx.captured_queries))
+            stats['writes'].append(
+                sum(
+                    not query['sql'].startswith('SELECT')
+                    for query in ctx.captured_queries
+                )
+            )
+        if not last:
+            break
+        response = reply
+
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sessions', type=int, default=20)
+    parser.add_argument('--cards', type=int, default=500)
+    args = parser.parse_args()
+
+    setup_django()
+    with temporary_database():
+        from django.contrib.auth.models import User
+        from django.test import Client
+
+        user = User.objects.create_user('bench', password='bench')
+        client = Client()
+        client.force_login(user)
+        deck = seed_deck(user, args.cards)
+
+        stats = {'waited': [], 'background': [], 'queries': [], 'writes': []}
+        for _ in range(args.sessions):
+            run_session(client, deck, stats)
+
+        answers = len(stats['queries'])
+        print(f'answers:            {answers}')
+        print(f'waited on server:   {len(stats["waited"])}')
+        for label in ('waited', 'background'):
+            samples = stats[label]
+            if samples:
+                print(
+                    f'{label + " latency:":<20}'
+                    f'median {percentile(samples, 0.5):.2f} ms, '
+                    f'p95 {percentile(samples, 0.95):.2f} ms'
+                )
+        # Answers that did not wait on the server flip in no time.
+        perceived = stats['waited'] + [0.0] * len(stats['background'])
+        print(f'perceived mean:     {sum(perceived) / answers:.2f} ms')
+        print(f'queries/answer:     {sum(stats["queries"]) / answers:.1f}')
+        print(f'writes/answer:      {sum(stats["writes"]) / answers:.1f}')
+
+if __name__ == '__main__':
+    main()
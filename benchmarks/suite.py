@@ -0,0 +1,298 @@
+"""
+Benchmark suite for the hot paths: the due-card queries, the review and
+dashboard views and the Anki importer. Data comes from the
+``generate_synthetic_data`` command with a fixed seed, so runs with the
+same arguments are comparable.
+
+Cases are written in the pytest-benchmark style: a function named
+``bench_*`` receives a ``benchmark`` fixture (plus the generated data) and
+calls ``benchmark(func)`` or ``benchmark.pedantic(func, setup=...)``.
+Results are written as JSON and can be compared with an earlier run:
+
+    python -m benchmarks.suite --json before.json
+    python -m benchmarks.suite --json after.json --compare before.json
+    python -m benchmarks.suite -k session --cards-per-deck 20000
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from benchmarks import setup_django, temporary_database
+
+
+class Benchmark:
+    """Times a callable over several rounds, like pytest-benchmark."""
+
+    def __init__(self, rounds, warmup):
+        self.rounds = rounds
+        self.warmup = warmup
+        self.samples = []
+
+    def __call__(self, func):
+        return self.pedantic(func, rounds=self.rounds, warmup=self.warmup)
+
+    def pedantic(self, func, setup=None, rounds=None, warmup=0):
+        """
+        Runs ``func`` ``rounds`` times; ``setup``, if given, runs untimed
+        before every call.
+        """
+        result = None
+        for i in range(warmup + (rounds or self.rounds)):
+            if setup is not None:
+                setup()
+            start = time.perf_counter()
+            result = func()
+            elapsed = time.perf_counter() - start
+            if i >= warmup:
+                self.samples.append(elapsed)
+        return result
+
+    def stats(self):
+        samples = sorted(self.samples)
+        return {
+            'rounds': len(samples),
+            'min': samples[0],
+            'max': samples[-1],
+            'mean': statistics.fmean(samples),
+            'median': statistics.median(samples),
+            'stddev': statistics.stdev(samples) if len(samples) > 1 else 0.0,
+            'p95': samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        }
+
+
+class Data:
+    """The generated dataset, as seen by the benchmark cases."""
+
+    def __init__(self, apkg_path):
+        from django.contrib.auth.models import User
+        from django.test import Client
+
+        self.user = User.objects.filter(username='synthetic0').get()
+        self.deck = self.user.decks.order_by('pk').first()
+        self.apkg_path = apkg_path
+        self.client = Client()
+        self.client.force_login(self.user)
+
+
+def bench_deck_next_session(benchmark, data):
+    benchmark(lambda: list(data.deck.next_session()))
+
+
+def bench_due_flashcards_view(benchmark, data):
+    from django.urls import reverse
+
+    url = reverse('due-flashcards')
+    benchmark(lambda: data.client.get(url, {'limit': 20}))
+
+
+def bench_update_performance_view(benchmark, data):
+    from django.urls import reverse
+
+    card_ids = iter(
+        data.deck.cards.values_list('pk', flat=True).order_by('pk')
+    )
+    benchmark(
+        lambda: data.client.post(
+            reverse('update-performance', args=[next(card_ids)]),
+            {'is_correct': 'true'},
+        )
+    )
+
+
+def bench_deck_export_view(benchmark, data):
+    from django.urls import reverse
+
+    url = reverse('deck-export', args=[data.deck.pk])
+    benchmark(lambda: b''.join(data.client.get(url).streaming_content))
+
+
+def bench_home_view_cold(benchmark, data):
+    from django.core.cache import cache
+    from django.urls import reverse
+
+    url = reverse('home')
+    benchmark.pedantic(
+        lambda: data.client.get(url), setup=cache.clear, warmup=1
+    )
+
+
+def bench_profile_view_warm(benchmark, data):
+    from django.urls import reverse
+
+    url = reverse('profile')
+    benchmark.pedantic(lambda: data.client.get(url), warmup=1)
+
+
+def bench_anki_import(benchmark, data):
+    from django.core.files import File
+
+    from flashcards.models import Deck
+    from flashcards.services import AnkiImporterService
+
+    def run():
+        with open(data.apkg_path, 'rb') as fh:
+            return AnkiImporterService(data.user).import_deck_from_file(
+                File(fh, name='synthetic.apkg')
+            )
+
+    def remove_imported():
+        Deck.objects.filter(user=data.user, name='synthetic').delete()
+
+    benchmark.pedantic(run, setup=remove_imported, rounds=5)
+
+
+CASES = {
+    name[len('bench_'):]: func
+    for name, func in list(globals().items())
+    if name.startswith('bench_')
+}
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path, threshold):
+    """Prints the median change per case; returns the regressed cases."""
+    with open(baseline_path) as fh:
+        baseline = {
+            case['name']: case['stats']
+            for case in json.load(fh)['benchmarks']
+        }
+    regressions = []
+    print(f'\n{"case":<32}{"before ms":>11}{"after ms":>11}{"change":>9}')
+    for case in results['benchmarks']:
+        before = baseline.get(case['name'])
+        if before is None:
+            continue
+        old, new = before['median'] * 1000, case['stats']['median'] * 1000
+        change = (new - old) / old * 100 if old else 0.0
+        flag = ''
+        if change > threshold:
+            flag = '  slower'
+            regressions.append(case['name'])
+        print(
+            f'{case["name"]:<32}{old:>11.2f}{new:>11.2f}'
+            f'{change:>8.1f}%{flag}'
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument('-k', help='only run cases containing this text')
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--users', type=int, default=5)
+    parser.add_argument('--decks-per-user', type=int, default=4)
+    parser.add_argument('--cards-per-deck', type=int, default=2500)
+    parser.add_argument('--apkg-notes', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--compare', help='results file of an earlier run')
+    parser.add_argument(
+        '--fail-over',
+        type=float,
+        default=None,
+        metavar='PERCENT',
+        help='exit with status 1 if a median got this much slower '
+        '(default: only flag cases more than 10%% slower)',
+    )
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.core.management import call_command
+    from django.test.utils import override_settings
+
+    from benchmarks.apkg import write_apkg
+
+    params = {
+        'users': args.users,
+        'decks_per_user': args.decks_per_user,
+        'cards_per_deck': args.cards_per_deck,
+        'apkg_notes': args.apkg_notes,
+        'seed': args.seed,
+        'rounds': args.rounds,
+    }
+    cases = {
+        name: func
+        for name, func in CASES.items()
+        if not args.k or args.k in name
+    }
+    benchmarks = []
+    # Review writes go to the log only; nothing flushes in the background.
+    with temporary_database(), tempfile.TemporaryDirectory() as tmp, (
+        override_settings(REVIEW_WRITE_BEHIND=True, REVIEW_FLUSH_INTERVAL=None)
+    ):
+        start = time.perf_counter()
+        call_command(
+            'generate_synthetic_data',
+            users=args.users,
+            decks_per_user=args.decks_per_user,
+            cards_per_deck=args.cards_per_deck,
+            seed=args.seed,
+            stdout=sys.stderr,
+        )
+        apkg_path = write_apkg(
+            os.path.join(tmp, 'synthetic.apkg'), args.apkg_notes, args.seed
+        )
+        print(
+            f'generated data in {time.perf_counter() - start:.1f} s',
+            file=sys.stderr,
+        )
+        data = Data(apkg_path)
+
+        print(f'{"case":<32}{"median ms":>11}{"p95 ms":>11}{"min ms":>11}')
+        for name, func in cases.items():
+            benchmark = Benchmark(args.rounds, args.warmup)
+            func(benchmark, data)
+            stats = benchmark.stats()
+            benchmarks.append({'name': name, 'stats': stats})
+            print(
+                f'{name:<32}{stats["median"] * 1000:>11.2f}'
+                f'{stats["p95"] * 1000:>11.2f}{stats["min"] * 1000:>11.2f}'
+            )
+        engine = settings.DATABASES['default']['ENGINE']
+
+    results = {
+        'datetime': datetime.now(dt_timezone.utc).isoformat(),
+        'commit': git_revision(),
+        'machine_info': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'database': engine,
+        },
+        'params': params,
+        'benchmarks': benchmarks,
+    }
+    if args.json:
+        with open(args.json, 'w') as fh:
+            json.dump(results, fh, indent=2)
+    if args.compare:
+        threshold = 10.0 if args.fail_over is None else args.fail_over
+        regressions = compare(results, args.compare, threshold)
+        if args.fail_over is not None and regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Template render time per view, as reported by the Server-Timing header of
+QueryProfilingMiddleware. "cold" clears the cache before every request,
+so the deck lists are rendered from scratch; "warm" serves them from the
+fragment cache.
+
+    python -m benchmarks.template_render --decks 30 --cards-per-deck 500
+"""
+import argparse
+import re
+import statistics
+
+from benchmarks import setup_django, temporary_database
+
+VIEWS = ('home', 'due-decks', 'profile', 'start_session')
+
+
+def server_timing(response):
+    return {
+        name: float(duration)
+        for name, duration in re.findall(
+            r'(\w+);dur=([\d.]+)', response['Server-Timing']
+        )
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--decks', type=int, default=30)
+    parser.add_argument('--cards-per-deck', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.test.utils import override_settings
+
+    middleware = [
+        'flashcards.middleware.QueryProfilingMiddleware',
+        *settings.MIDDLEWARE,
+    ]
+    with temporary_database(), override_settings(MIDDLEWARE=middleware):
+        from django.core.cache import cache
+        from django.test import Client
+        from django.urls import reverse
+
+        from benchmarks.due_queries import seed
+
+        user, deck = seed(1, args.decks, args.decks * args.cards_per_deck)
+        client = Client()
+        client.force_login(user)
+        urls = {
+            name: reverse(name, args=[deck.pk] if 'session' in name else [])
+            for name in VIEWS
+        }
+
+        print(f'{"view":<16}{"":<6}{"tpl ms":>10}{"total ms":>10}')
+        for name, url in urls.items():
+            for label, setup in (('cold', cache.clear), ('warm', None)):
+                client.get(url)
+                timings = []
+                for _ in range(args.repeat):
+                    if setup is not None:
+                        setup()
+                    timings.append(server_timing(client.get(url)))
+                tpl = statistics.median(t['tpl'] for t in timings)
+                total = statistics.median(t['total'] for t in timings)
+                print(f'{name:<16}{label:<6}{tpl:>10.2f}{total:>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,90 @@
-from django.contrib import admin
-from .models import Deck, Card
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
+from .models import Deck, Card, ImportJob, Note, ReviewLog
+from .signals import cards_changed
+
+
+class CardForm(forms.ModelForm):
+    """Edits a card's content, which is stored on its shared note."""
+
+    character = forms.CharField(max_length=10)
+    pinyin = forms.CharField(max_length=50)
+    translation = forms.CharField(widget=forms.Textarea)
+
+    class Meta:
+        model = Card
+        exclude = ('note',)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.note_id:
+            for field in ('character', 'pinyin', 'translation'):
+                self.initial.setdefault(
+                    field, getattr(self.instance.note, field)
+                )
+
+    def save(self, commit=True):
+        self.instance.set_content(
+            self.cleaned_data['character'],
+            self.cleaned_data['pinyin'],
+            self.cleaned_data['translation'],
+        )
+        return super().save(commit)
+
+
+class CardActionForm(ActionForm):
+    deck = forms.IntegerField(
+        required=False, label='Target deck id', min_value=1
+    )
+
+
+def _report(modeladmin, request, count, verb):
+    modeladmin.message_user(request, f'{count} cards {verb}.')
+
+
+@admin.action(description='Reset schedule of selected cards')
+def reset_schedule(modeladmin, request, queryset):
+    _report(modeladmin, request, queryset.reset_schedule(), 'reset')
+
+
+@admin.action(description='Suspend selected cards')
+def suspend_cards(modeladmin, request, queryset):
+    _report(modeladmin, request, queryset.suspend(), 'suspended')
+
+
+@admin.action(description='Unsuspend selected cards')
+def unsuspend_cards(modeladmin, request, queryset):
+    _report(modeladmin, request, queryset.unsuspend(), 'unsuspended')
+
+
+def _deck_cards(queryset):
+    # Only the ids of the (annotated) deck changelist queryset are needed.
+    return Card.objects.filter(deck__in=queryset.order_by().values('pk'))
+
+
+@admin.action(description='Reset schedule of all cards in selected decks')
+def reset_deck_schedules(modeladmin, request, queryset):
+    _report(
+        modeladmin, request, _deck_cards(queryset).reset_schedule(), 'reset'
+    )
+
+
+@admin.action(description='Suspend all cards in selected decks')
+def suspend_decks(modeladmin, request, queryset):
+    _report(modeladmin, request, _deck_cards(queryset).suspend(), 'suspended')
+
+
+@admin.action(description='Unsuspend all cards in selected decks')
+def unsuspend_decks(modeladmin, request, queryset):
+    _report(
+        modeladmin, request, _deck_cards(queryset).unsuspend(), 'unsuspended'
+    )
 
 
 class CardInline(admin.TabularInline):
     model = Card
+    form = CardForm
     extra = 1
     fields = (
         'character',
@@ -15,36 +96,54 @@ class CardInline(admin.TabularInline):
     readonly_fields = ('next_review', 'consecutive_correct')
     show_change_link = True
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('note')
+
 
 @admin.register(Deck)
 class DeckAdmin(admin.ModelAdmin):
     list_display = ('name', 'user', 'created_at', 'card_count', 'progress')
-    list_filter = ('created_at', 'user')
+    list_filter = ('created_at', 'user', 'scheduler')
     search_fields = ('name', 'description', 'user__username')
     readonly_fields = ('created_at', 'updated_at')
     inlines = [CardInline]
+    list_select_related = ('user',)
+    actions = [reset_deck_schedules, suspend_decks, unsuspend_decks]
+    # Skip the unfiltered COUNT(*) that the changelist runs on every page.
+    show_full_result_count = False
 
     fieldsets = (
-        (None, {'fields': ('user', 'name', 'description')}),
+        (None, {'fields': ('user', 'name', 'description', 'scheduler')}),
         (
             'Timestamps',
             {'fields': ('created_at', 'updated_at'), 'classes': ('collapse',)},
         ),
     )
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change and 'scheduler' in form.changed_data:
+            obj.reschedule()
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_stats()
+
     def card_count(self, obj):
-        return obj.cards.count()
+        return obj.total_cards
 
     card_count.short_description = 'Cards'
+    card_count.admin_order_field = 'total_cards'
 
     def progress(self, obj):
-        return f'{obj.get_progress()}%'
+        return f'{obj.progress}%'
 
     progress.short_description = 'Progress'
+    progress.admin_order_field = 'progress'
 
 
 @admin.register(Card)
 class CardAdmin(admin.ModelAdmin):
+    form = CardForm
     list_display = (
         'character',
         'pinyin',
@@ -52,9 +151,19 @@ class CardAdmin(admin.ModelAdmin):
         'deck',
         'next_review',
         'consecutive_correct',
+        'suspended',
+    )
+    list_filter = ('suspended', 'deck', 'next_review')
+    list_select_related = ('note', 'deck__user')
+    actions = [reset_schedule, suspend_cards, unsuspend_cards, 'move_to_deck']
+    action_form = CardActionForm
+    show_full_result_count = False
+    search_fields = (
+        'note__character',
+        'note__pinyin',
+        'note__translation',
+        'deck__name',
     )
-    list_filter = ('deck', 'next_review')
-    search_fields = ('character', 'pinyin', 'translation', 'deck__name')
     readonly_fields = ('created_at',)
     date_hierarchy = 'next_review'
 
@@ -63,7 +172,7 @@ class CardAdmin(admin.ModelAdmin):
         (
             'Review Information',
             {
-                'fields': ('next_review', 'consecutive_correct'),
+                'fields': ('next_review', 'consecutive_correct', 'suspended'),
                 'classes': ('collapse',),
             },
         ),
@@ -78,3 +187,89 @@ class CardAdmin(admin.ModelAdmin):
         )
 
     translation_short.short_description = 'Translation'
+
+    def character(self, obj):
+        return obj.character
+
+    character.admin_order_field = 'note__character'
+
+    def pinyin(self, obj):
+        return obj.pinyin
+
+    pinyin.admin_order_field = 'note__pinyin'
+
+    # Card deletions send no model signal (see flashcards.signals).
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        cards_changed.send(sender=Card, user_ids={obj.deck.user_id})
+
+    def delete_queryset(self, request, queryset):
+        user_ids = set(
+            queryset.order_by()
+            .values_list('deck__user_id', flat=True)
+            .distinct()
+        )
+        super().delete_queryset(request, queryset)
+        cards_changed.send(sender=Card, user_ids=user_ids)
+
+    @admin.action(description='Move selected cards to deck (id below)')
+    def move_to_deck(self, request, queryset):
+        deck_id = request.POST.get('deck')
+        deck = (
+            Deck.objects.filter(pk=deck_id).first()
+            if deck_id and deck_id.isdigit()
+            else None
+        )
+        if deck is None:
+            self.message_user(
+                request, 'Enter the id of an existing deck.', messages.ERROR
+            )
+            return
+        selected = queryset.count()
+        moved = queryset.move_to(deck)
+        message = f'{moved} cards moved to {deck}.'
+        if moved < selected:
+            message += ' Cards of other users were left in place.'
+        self.message_user(request, message)
+
+
+@admin.register(Note)
+class NoteAdmin(admin.ModelAdmin):
+    list_display = ('character', 'pinyin', 'translation', 'created_at')
+    search_fields = ('character', 'pinyin', 'translation', 'content_hash')
+    # Notes are shared between cards; edit a card to change its content.
+    show_full_result_count = False
+    readonly_fields = (
+        'content_hash',
+        'character',
+        'pinyin',
+        'translation',
+        'created_at',
+    )
+
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ('file_name', 'user', 'status', 'progress', 'created_at')
+    list_filter = ('status', 'created_at')
+    list_select_related = ('user',)
+    search_fields = ('file_name', 'user__username')
+    readonly_fields = ('created_at', 'updated_at')
+
+
+@admin.register(ReviewLog)
+class ReviewLogAdmin(admin.ModelAdmin):
+    list_display = (
+        'card',
+        'user',
+        'is_correct',
+        'reviewed_at',
+        'old_interval',
+        'new_interval',
+        'applied',
+    )
+    list_filter = ('applied', 'is_correct')
+    list_select_related = ('card__deck', 'user')
+    raw_id_fields = ('card',)
+    show_full_result_count = False
+    date_hierarchy = 'reviewed_at'
@@ -1,6 +1,39 @@
+import os
+import sys
+
 from django.apps import AppConfig
+from django.core.signals import request_started
+
+
+def _serving():
+    """False in management commands other than runserver, tests included."""
+    program = os.path.basename(sys.argv[0]) if sys.argv else ''
+    if program in ('manage.py', 'django-admin', '__main__.py'):
+        return sys.argv[1:2] == ['runserver']
+    return True
+
+
+def _start_background_work(**kwargs):
+    request_started.disconnect(dispatch_uid=__name__)
+    from .jobs import recover_import_jobs
+    from .reviews import ensure_flusher
+
+    # Reviews and imports left pending by an earlier process are picked up
+    # without waiting for new ones.
+    ensure_flusher()
+    recover_import_jobs()
 
 
 class FlashcardsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'flashcards'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+
+        # Started on the first request rather than here, so that it runs
+        # in the worker process after any fork.
+        if _serving():
+            request_started.connect(
+                _start_background_work, dispatch_uid=__name__
+            )
@@ -0,0 +1,110 @@
+"""
+Per-user cache of the dashboard deck statistics.
+
+Counts only change when cards are graded, created, imported or deleted, or
+when the clock passes a card's ``next_review``. Entries therefore store
+the time of the next such crossing and are dropped by the receivers in
+``flashcards.signals`` whenever cards change.
+
+Every change also moves the user's stats version forward, so template
+fragments rendered from the stats can be cached under that version.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Deck
+
+CACHE_KEY = 'deck-stats:{user_id}'
+VERSION_KEY = 'deck-stats-version:{user_id}'
+
+_FIELDS = (
+    'id',
+    'name',
+    'created_at',
+    'total_cards',
+    'due_cards',
+    'reviewed_cards',
+    'progress',
+)
+
+
+def _cache_key(user_id):
+    return CACHE_KEY.format(user_id=user_id)
+
+
+def _bump_version(user_id):
+    key = VERSION_KEY.format(user_id=user_id)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Start from the clock so a version evicted from the cache is not
+        # handed out again.
+        version = time.time_ns()
+        cache.set(key, version, None)
+        return version
+
+
+def get_deck_stats(user_id, now=None):
+    """
+    Returns a list of dicts (``id``, ``name``, ``created_at``,
+    ``total_cards``, ``due_cards``, ``reviewed_cards``, ``progress``), one
+    per deck of the user, ordered by deck id.
+    """
+    return get_versioned_deck_stats(user_id, now)[0]
+
+
+def get_versioned_deck_stats(user_id, now=None):
+    """
+    Returns ``(decks, version)``: the result of ``get_deck_stats`` and a
+    number that changes whenever the stats may have changed, for keying
+    cached fragments rendered from them.
+    """
+    if now is None:
+        now = timezone.now()
+    entry = cache.get(_cache_key(user_id))
+    if entry is not None and (
+        entry['valid_until'] is None or now < entry['valid_until']
+    ):
+        return entry['decks'], entry['version']
+
+    decks = []
+    valid_until = None
+    queryset = Deck.objects.filter(user_id=user_id).with_stats(now)
+    for row in queryset.order_by('id').values(*_FIELDS, 'next_due_at'):
+        next_due_at = row.pop('next_due_at')
+        if next_due_at and (valid_until is None or next_due_at < valid_until):
+            valid_until = next_due_at
+        decks.append(row)
+
+    timeout = getattr(settings, 'DECK_STATS_CACHE_TIMEOUT', 300)
+    if valid_until is not None:
+        seconds_left = (valid_until - now).total_seconds()
+        timeout = max(1, min(timeout, int(seconds_left) + 1))
+    # Counts recomputed after a due time passed differ from the cached
+    # ones too, so every recomputation gets a new version.
+    version = _bump_version(user_id)
+    cache.set(
+        _cache_key(user_id),
+        {'decks': decks, 'valid_until': valid_until, 'version': version},
+        timeout,
+    )
+    return decks, version
+
+
+def get_deck_stats_by_id(user_id, now=None):
+    return {row['id']: row for row in get_deck_stats(user_id, now)}
+
+
+def invalidate_deck_stats(*user_ids):
+    user_ids = set(user_ids)
+    keys = [_cache_key(user_id) for user_id in user_ids]
+    cache.delete_many(keys)
+    for user_id in user_ids:
+        _bump_version(user_id)
+    # Drop again once the change is committed, in case a concurrent request
+    # re-cached the old counts in between.
+    transaction.on_commit(lambda: cache.delete_many(keys))
@@ -0,0 +1,142 @@
+"""
+Materialized histogram of upcoming due dates.
+
+``DueForecast`` holds, per deck and calendar day, the number of
+unsuspended cards whose ``next_review`` falls on that day. Forecast charts
+read at most one row per deck and day instead of scanning the cards.
+
+Reviews and imports know where each card's due date moved from and to, so
+they update the counts in place with ``apply_due_changes`` and send
+``cards_changed`` with ``forecast_updated=True``. Saving a single card
+moves it from the state it was loaded with. Other bulk changes are
+followed by ``rebuild_due_forecast`` for the owners of the cards.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, DateField, Sum, Value
+from django.db.models.functions import Greatest, TruncDate
+from django.utils import timezone
+
+from .models import Card, DueForecast
+
+DEFAULT_FORECAST_DAYS = 30
+MAX_FORECAST_DAYS = 365
+
+
+def forecast_day(value):
+    """The forecast day of a ``next_review`` datetime."""
+    return timezone.localdate(value, timezone.get_default_timezone())
+
+
+def today():
+    return forecast_day(timezone.now())
+
+
+def apply_due_changes(changes):
+    """
+    Moves cards between days. ``changes`` holds ``(user_id, deck_id,
+    old_due, new_due)`` tuples; an ``old_due`` of None adds the card and a
+    ``new_due`` of None removes it. Runs three queries at most, and must
+    run inside the transaction that moved the cards.
+    """
+    owners = {}
+    deltas = Counter()
+    for user_id, deck_id, old_due, new_due in changes:
+        owners[deck_id] = user_id
+        if old_due is not None:
+            deltas[deck_id, forecast_day(old_due)] -= 1
+        if new_due is not None:
+            deltas[deck_id, forecast_day(new_due)] += 1
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    existing = DueForecast.objects.select_for_update().filter(
+        deck_id__in={deck_id for deck_id, _ in deltas},
+        day__in={day for _, day in deltas},
+    )
+    counts, emptied = {}, []
+    for row in existing:
+        delta = deltas.pop((row.deck_id, row.day), 0)
+        if not delta:
+            continue
+        if row.due_count + delta:
+            counts[row.deck_id, row.day] = row.due_count + delta
+        else:
+            emptied.append(row.pk)
+    counts.update(deltas)
+    if emptied:
+        DueForecast.objects.filter(pk__in=emptied).delete()
+    if counts:
+        # One upsert writes both the changed and the new days.
+        DueForecast.objects.bulk_create(
+            [
+                DueForecast(
+                    user_id=owners[deck_id],
+                    deck_id=deck_id,
+                    day=day,
+                    due_count=count,
+                )
+                for (deck_id, day), count in counts.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['deck', 'day'],
+            update_fields=['due_count'],
+        )
+
+
+def rebuild_due_forecast(*user_ids):
+    """Recomputes the forecast of ``user_ids`` from their cards."""
+    rows = (
+        Card.objects.filter(deck__user_id__in=user_ids, suspended=False)
+        .annotate(
+            day=TruncDate(
+                'next_review', tzinfo=timezone.get_default_timezone()
+            )
+        )
+        .values('deck__user_id', 'deck_id', 'day')
+        .annotate(due_count=Count('id'))
+        .order_by()
+    )
+    with transaction.atomic():
+        DueForecast.objects.filter(user_id__in=user_ids).delete()
+        DueForecast.objects.bulk_create(
+            (
+                DueForecast(
+                    user_id=row['deck__user_id'],
+                    deck_id=row['deck_id'],
+                    day=row['day'],
+                    due_count=row['due_count'],
+                )
+                for row in rows.iterator()
+            ),
+            batch_size=500,
+        )
+
+
+def get_due_forecast(user_id, days=DEFAULT_FORECAST_DAYS, deck_id=None):
+    """
+    Returns ``[(day, due_count), ...]`` for the ``days`` days starting
+    today. Overdue cards are counted on today.
+    """
+    start = today()
+    rows = DueForecast.objects.filter(
+        user_id=user_id, day__lt=start + timedelta(days=days)
+    )
+    if deck_id is not None:
+        rows = rows.filter(deck_id=deck_id)
+    counts = dict(
+        rows.annotate(
+            bucket=Greatest('day', Value(start, output_field=DateField()))
+        )
+        .values('bucket')
+        .annotate(total=Sum('due_count'))
+        .values_list('bucket', 'total')
+        .order_by()
+    )
+    return [
+        (day, counts.get(day, 0))
+        for day in (start + timedelta(days=i) for i in range(days))
+    ]
@@ -0,0 +1,148 @@
+"""
+Maps the fields of Anki note types onto card content.
+
+The alias table is compiled into one ``{alias: target}`` lookup and the
+result for each note type is cached by a hash of its field names, so
+repeat imports of the same note types skip resolution entirely.
+"""
+import hashlib
+import re
+import threading
+from functools import lru_cache
+
+from django.conf import settings
+from rapidfuzz import fuzz, process
+
+TARGETS = ('character', 'pinyin', 'translation')
+
+FIELD_ALIASES = {
+    'character': (
+        'hanzi',
+        'character',
+        'simplified',
+        'zi',
+        'chinese',
+        'expression',
+        'front',
+    ),
+    'pinyin': ('pinyin', 'pronunciation', 'reading'),
+    'translation': (
+        'english',
+        'translation',
+        'meaning',
+        'definition',
+        'back',
+    ),
+}
+
+# Minimum rapidfuzz ratio (0-100) for a field name that is not an alias to
+# count as one, e.g. "Meanings" or "Pinyn". None disables fuzzy matching.
+FUZZY_CUTOFF = 85
+
+# Distinct note types remembered per mapper.
+CACHE_SIZE = 1024
+
+
+def normalize(field_name):
+    return re.sub(r'[\W_]+', ' ', field_name).strip().casefold()
+
+
+class FieldMapper:
+    """
+    Resolves the field names of a note type to the field indexes of
+    ``TARGETS``. ``aliases`` maps each target to the names it accepts;
+    ``extra_aliases`` holds ``(target, name)`` pairs that take precedence.
+    """
+
+    def __init__(
+        self,
+        aliases=FIELD_ALIASES,
+        extra_aliases=(),
+        fuzzy_cutoff=FUZZY_CUTOFF,
+    ):
+        pairs = list(extra_aliases) + [
+            (target, name)
+            for target, names in aliases.items()
+            for name in names
+        ]
+        self._lookup = {}
+        for target, name in pairs:
+            if target not in TARGETS:
+                raise ValueError(f'Unknown card field {target!r}.')
+            self._lookup.setdefault(normalize(name), target)
+        self._choices = list(self._lookup)
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self._cache = {}
+        self._cache_lock = threading.Lock()
+
+    @staticmethod
+    def schema_hash(field_names):
+        return hashlib.sha1('\x1f'.join(field_names).encode()).hexdigest()
+
+    def resolve(self, field_names):
+        """
+        Returns the ``(character, pinyin, translation)`` field indexes for
+        a note type with ``field_names``, or None if a target is missing.
+        """
+        key = self.schema_hash(field_names)
+        try:
+            return self._cache[key]
+        except KeyError:
+            pass
+        indexes = self._resolve([normalize(name) for name in field_names])
+        with self._cache_lock:
+            if len(self._cache) >= CACHE_SIZE:
+                self._cache.clear()
+            self._cache[key] = indexes
+        return indexes
+
+    def _resolve(self, names):
+        found = {}
+        unmatched = []
+        for index, name in enumerate(names):
+            target = self._lookup.get(name)
+            if target is None:
+                unmatched.append(index)
+            elif target not in found:
+                found[target] = index
+        if self.fuzzy_cutoff is not None and len(found) < len(TARGETS):
+            for index in unmatched:
+                match = process.extractOne(
+                    names[index],
+                    self._choices,
+                    scorer=fuzz.ratio,
+                    score_cutoff=self.fuzzy_cutoff,
+                )
+                if match is not None:
+                    found.setdefault(self._lookup[match[0]], index)
+        if len(found) < len(TARGETS):
+            return None
+        return tuple(found[target] for target in TARGETS)
+
+
+@lru_cache(maxsize=64)
+def _build_mapper(extra_aliases, fuzzy_cutoff):
+    return FieldMapper(
+        extra_aliases=extra_aliases, fuzzy_cutoff=fuzzy_cutoff
+    )
+
+
+def get_field_mapper(field_mappings=None):
+    """
+    Returns the shared mapper for the built-in aliases, the
+    ``ANKI_FIELD_ALIASES`` setting and ``field_mappings``, a user-defined
+    ``{anki_field_name: target}`` dict. User-defined names take
+    precedence over the built-in aliases.
+    """
+    configured = getattr(settings, 'ANKI_FIELD_ALIASES', {})
+    extra = [
+        (target, name) for name, target in (field_mappings or {}).items()
+    ] + [
+        (target, name)
+        for target, names in configured.items()
+        for name in names
+    ]
+    return _build_mapper(
+        tuple(extra),
+        getattr(settings, 'ANKI_FIELD_FUZZY_CUTOFF', FUZZY_CUTOFF),
+    )
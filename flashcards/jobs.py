@@ -0,0 +1,270 @@
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from .models import Deck, ImportJob
+from .parallel_import import import_packages
+from .services import AnkiImporterService, AnkiImportError
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'IMPORT_JOB_WORKERS', 2),
+                thread_name_prefix='anki-import',
+            )
+        return _executor
+
+
+def _spool(uploaded_file):
+    with tempfile.NamedTemporaryFile(delete=False, suffix='.apkg') as spool:
+        for chunk in uploaded_file.chunks():
+            spool.write(chunk)
+    return spool.name
+
+
+def create_import_job(
+    user, uploaded_file, sync_deck=None, retire_missing=False
+) -> ImportJob:
+    """
+    Spools ``uploaded_file`` to disk and schedules its import, either as a
+    new deck or, with ``sync_deck``, as an update of that existing deck.
+    The job is handed to the worker pool once the surrounding transaction
+    commits.
+    """
+    job = ImportJob.objects.create(
+        user=user,
+        file_name=uploaded_file.name,
+        file_path=_spool(uploaded_file),
+        deck=sync_deck,
+        is_sync=sync_deck is not None,
+        retire_missing=retire_missing,
+    )
+    transaction.on_commit(lambda: _get_executor().submit(_worker, [job.pk]))
+    return job
+
+
+def create_import_batch(user, uploaded_files) -> list:
+    """
+    Schedules one new-deck import job per file in ``uploaded_files``. The
+    jobs run together, so their packages are parsed in parallel.
+    """
+    jobs = [
+        ImportJob.objects.create(
+            user=user,
+            file_name=uploaded_file.name,
+            file_path=_spool(uploaded_file),
+        )
+        for uploaded_file in uploaded_files
+    ]
+    job_ids = [job.pk for job in jobs]
+    transaction.on_commit(lambda: _get_executor().submit(_worker, job_ids))
+    return jobs
+
+
+def _worker(job_ids):
+    close_old_connections()
+    try:
+        if len(job_ids) == 1:
+            run_import_job(job_ids[0])
+        else:
+            run_import_batch(job_ids)
+    finally:
+        # Worker threads own their connection; don't leak it to the pool.
+        connection.close()
+
+
+def _update_job(job_id, **fields):
+    ImportJob.objects.filter(pk=job_id).update(
+        updated_at=timezone.now(), **fields
+    )
+
+
+def _claim(job_ids):
+    """
+    Moves the still pending jobs of ``job_ids`` to running and returns
+    their ids, so a resubmitted job cannot run twice.
+    """
+    claimed = []
+    for job_id in job_ids:
+        if ImportJob.objects.filter(
+            pk=job_id, status=ImportJob.PENDING
+        ).update(status=ImportJob.RUNNING, updated_at=timezone.now()):
+            claimed.append(job_id)
+    return claimed
+
+
+def run_import_job(job_id):
+    """Runs a pending import job to completion in the calling thread."""
+    job = ImportJob.objects.select_related('user', 'deck').get(pk=job_id)
+    if job.status != ImportJob.PENDING:
+        return
+    if not job.is_sync:
+        run_import_batch([job.pk])
+        return
+    if not _claim([job.pk]):
+        return
+
+    def report_progress(notes_read, notes_total):
+        progress = int(notes_read * 100 / notes_total) if notes_total else 0
+        _update_job(
+            job.pk,
+            notes_processed=notes_read,
+            notes_total=notes_total,
+            progress=min(progress, 99),
+        )
+
+    try:
+        if job.deck is None:
+            raise AnkiImportError('The deck to update no longer exists.')
+        importer = AnkiImporterService(job.user)
+        with open(job.file_path, 'rb') as fh:
+            importer.sync_deck_from_file(
+                File(fh, name=job.file_name),
+                job.deck,
+                retire_missing=job.retire_missing,
+                progress_callback=report_progress,
+            )
+    except Exception as e:
+        _fail_job(job, e)
+    else:
+        _update_job(
+            job.pk, status=ImportJob.SUCCEEDED, progress=100, deck=job.deck
+        )
+    finally:
+        _discard_upload(job)
+
+
+def _discard_upload(job):
+    if job.file_path and os.path.exists(job.file_path):
+        os.unlink(job.file_path)
+    _update_job(job.pk, file_path='')
+
+
+def _fail_job(job, error):
+    if isinstance(error, AnkiImportError):
+        logger.warning(f'Anki import job {job.pk} failed: {error}')
+        message = str(error)
+    else:
+        logger.error(
+            f'Unexpected error in Anki import job {job.pk}: {error}',
+            exc_info=error,
+        )
+        message = 'An unexpected server error occurred. Please try again.'
+    _discard_partial_decks(job)
+    _update_job(
+        job.pk, status=ImportJob.FAILED, error=message, partial_deck_ids=[]
+    )
+
+
+def _discard_partial_decks(job):
+    deck_ids = (
+        ImportJob.objects.filter(pk=job.pk)
+        .values_list('partial_deck_ids', flat=True)
+        .first()
+    )
+    if deck_ids:
+        Deck.objects.filter(pk__in=deck_ids, user_id=job.user_id).delete()
+
+
+def run_import_batch(job_ids):
+    """
+    Runs pending new-deck import jobs to completion. Packages are unpacked
+    and parsed by the process pool of ``parallel_import`` while the
+    calling thread writes every deck.
+    """
+    pending = ImportJob.objects.filter(
+        pk__in=job_ids, status=ImportJob.PENDING, is_sync=False
+    ).values_list('pk', flat=True)
+    jobs = list(
+        ImportJob.objects.select_related('user')
+        .filter(pk__in=_claim(pending))
+        .order_by('pk')
+    )
+    if not jobs:
+        return
+
+    def report_progress(job, notes_read, notes_total):
+        progress = int(notes_read * 100 / notes_total) if notes_total else 0
+        _update_job(
+            job.pk,
+            notes_processed=notes_read,
+            notes_total=notes_total,
+            progress=min(progress, 99),
+        )
+
+    finished = set()
+
+    def finish(job, decks, error):
+        finished.add(job.pk)
+        if error is not None:
+            _fail_job(job, error)
+        else:
+            _update_job(
+                job.pk,
+                status=ImportJob.SUCCEEDED,
+                progress=100,
+                deck=decks[0],
+                decks_created=len(decks),
+                partial_deck_ids=[],
+            )
+        _discard_upload(job)
+
+    try:
+        import_packages(
+            jobs, on_progress=report_progress, on_finished=finish
+        )
+    except Exception as e:
+        for job in jobs:
+            if job.pk not in finished:
+                _fail_job(job, e)
+                _discard_upload(job)
+
+
+def recover_import_jobs():
+    """
+    Cleans up after jobs abandoned by a process that stopped: running jobs
+    are failed (deleting the decks they had created and their upload) and
+    pending ones are submitted again. Only jobs not updated for
+    ``IMPORT_JOB_STALE_AFTER`` seconds are touched, which leaves the jobs
+    of live processes alone.
+    """
+    stale_after = getattr(settings, 'IMPORT_JOB_STALE_AFTER', 600)
+    stale = ImportJob.objects.select_related('user').filter(
+        updated_at__lt=timezone.now() - timedelta(seconds=stale_after)
+    )
+    for job in stale.filter(status=ImportJob.RUNNING):
+        _fail_job(
+            job,
+            AnkiImportError(
+                'The import was interrupted. Please upload the file again.'
+            ),
+        )
+        _discard_upload(job)
+
+    pending = list(
+        stale.filter(status=ImportJob.PENDING)
+        .order_by('pk')
+        .values_list('pk', 'is_sync')
+    )
+    new_decks = [pk for pk, is_sync in pending if not is_sync]
+    if new_decks:
+        _get_executor().submit(_worker, new_decks)
+    for pk, is_sync in pending:
+        if is_sync:
+            _get_executor().submit(_worker, [pk])
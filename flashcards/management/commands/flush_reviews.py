@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from flashcards.reviews import flush_review_log
+
+
+class Command(BaseCommand):
+    help = 'Folds all pending review-log entries into their cards.'
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            flushed = flush_review_log()
+            if not flushed:
+                break
+            total += flushed
+        self.stdout.write(f'Applied {total} pending reviews.')
@@ -0,0 +1,148 @@
+import math
+import os
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from flashcards.models import Card, Deck, Note
+from flashcards.signals import cards_changed
+
+BATCH_SIZE = 10000
+
+
+def synthetic_card(rng, deck, note_id, now, new_fraction=0.3):
+    """
+    A card in a plausible review state. New cards are due since their
+    creation. Learned cards have log-normally distributed intervals
+    (median about a week, capped at a year) and were last reviewed at a
+    random point of their interval or somewhat later, which gives the
+    overdue tail of a learner who skips days.
+    """
+    if rng.random() < new_fraction:
+        return Card(
+            deck=deck,
+            note_id=note_id,
+            next_review=now - timedelta(days=rng.uniform(0, 30)),
+        )
+    interval = min(365.0, rng.lognormvariate(math.log(8), 1.1))
+    last_reviewed_at = now - timedelta(days=rng.uniform(0, interval * 1.3))
+    return Card(
+        deck=deck,
+        note_id=note_id,
+        seen=True,
+        last_reviewed_at=last_reviewed_at,
+        next_review=last_reviewed_at + timedelta(days=interval),
+        interval=interval,
+        consecutive_correct=max(1, int(math.log2(interval + 1))),
+        ease_factor=round(rng.uniform(1.6, 2.8), 2),
+        stability=interval,
+        difficulty=round(rng.uniform(3, 8), 2),
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        'Creates synthetic users, decks and cards with realistic review '
+        'schedules, and optionally synthetic .apkg packages, for '
+        'benchmarks.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--decks-per-user', type=int, default=5)
+        parser.add_argument(
+            '--cards-per-deck',
+            type=int,
+            default=1000,
+            help='average deck size; actual sizes vary by +/-50%%',
+        )
+        parser.add_argument(
+            '--notes',
+            type=int,
+            default=5000,
+            help='distinct note contents shared by the cards',
+        )
+        parser.add_argument('--prefix', default='synthetic')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--apkg-dir', help='also write synthetic .apkg files here'
+        )
+        parser.add_argument(
+            '--apkg-notes', type=int, nargs='+', default=[1000, 10000]
+        )
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=prefix).exists():
+            raise CommandError(
+                f'Users named {prefix}* already exist; pick another --prefix.'
+            )
+        rng = random.Random(options['seed'])
+        now = timezone.now()
+
+        note_ids = Note.objects.intern_many(
+            [
+                (f'字{i}', f'zì{i % 400}', f'synthetic meaning {i}')
+                for i in range(options['notes'])
+            ]
+        )
+        # Unusable passwords: hashing real ones dominates large runs.
+        users = User.objects.bulk_create(
+            User(username=f'{prefix}{i}', password=make_password(None))
+            for i in range(options['users'])
+        )
+        decks = Deck.objects.bulk_create(
+            Deck(user=user, name=f'Synthetic deck {i}')
+            for user in users
+            for i in range(options['decks_per_user'])
+        )
+
+        created = 0
+        batch = []
+        for deck in decks:
+            size = int(options['cards_per_deck'] * rng.uniform(0.5, 1.5))
+            for _ in range(size):
+                batch.append(
+                    synthetic_card(rng, deck, rng.choice(note_ids), now)
+                )
+                if len(batch) >= BATCH_SIZE:
+                    created += self._write(batch)
+                    batch = []
+        created += self._write(batch)
+        cards_changed.send(
+            sender=Card, user_ids={user.pk for user in users}
+        )
+        self.stdout.write(
+            f'Created {len(users)} users, {len(decks)} decks and '
+            f'{created} cards.'
+        )
+
+        if options['apkg_dir']:
+            self._write_packages(options)
+
+    def _write(self, batch):
+        with transaction.atomic():
+            Card.objects.bulk_create(batch)
+        if batch and self.verbosity > 1:
+            self.stdout.write(f'  wrote {len(batch)} cards')
+        return len(batch)
+
+    def _write_packages(self, options):
+        try:
+            from benchmarks.apkg import write_apkg
+        except ImportError:
+            raise CommandError(
+                'Writing .apkg files needs the benchmarks package; run '
+                'manage.py from the project root.'
+            )
+        os.makedirs(options['apkg_dir'], exist_ok=True)
+        for size in options['apkg_notes']:
+            path = os.path.join(options['apkg_dir'], f'synthetic_{size}.apkg')
+            write_apkg(path, size, seed=options['seed'])
+            self.stdout.write(f'Wrote {path}')
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from flashcards.models import Note
+
+
+class Command(BaseCommand):
+    help = 'Deletes shared notes that no card refers to any more.'
+
+    def handle(self, *args, **options):
+        deleted, _ = Note.objects.unreferenced().delete()
+        self.stdout.write(f'Deleted {deleted} unreferenced notes.')
@@ -0,0 +1,187 @@
+"""
+In-process instrumentation: counters, histograms and a ``timed`` helper,
+exported in the Prometheus text format by the ``metrics`` view.
+
+Every call checks ``METRICS_ENABLED`` first, so instrumented code costs a
+settings lookup and nothing more when metrics are off. Timings are also
+logged at DEBUG level on the ``flashcards.metrics`` logger, with the
+metric name, labels and duration attached to the record.
+
+Metrics live in the memory of each process; with several server workers
+every worker exposes its own counts.
+"""
+import bisect
+import logging
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+ROW_BUCKETS = (1, 10, 50, 100, 500, 1000, 2000, 5000, 10000)
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_buckets = {}
+
+
+def enabled():
+    return getattr(settings, 'METRICS_ENABLED', True)
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def increment(name, amount=1, **labels):
+    """Adds ``amount`` to the counter ``name``."""
+    if not enabled():
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def observe(name, value, buckets=LATENCY_BUCKETS, **labels):
+    """
+    Records ``value`` in the histogram ``name``. The ``buckets`` of the
+    first observation of a name are used for all of its label sets.
+    """
+    if not enabled():
+        return
+    key = _key(name, labels)
+    with _lock:
+        bounds = _buckets.setdefault(name, tuple(buckets))
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [[0] * len(bounds), 0.0, 0]
+        index = bisect.bisect_left(bounds, value)
+        if index < len(bounds):
+            histogram[0][index] += 1
+        histogram[1] += value
+        histogram[2] += 1
+
+
+class timed:
+    """
+    Records the duration of a block, or of every call when used as a
+    decorator, in the ``<name>_seconds`` histogram::
+
+        with timed('anki_import_phase', phase='write'):
+            ...
+
+        @timed('http_view', view='update_card')
+        def update_card_view(request, pk):
+            ...
+    """
+
+    def __init__(self, name, **labels):
+        self.name = name
+        self.labels = labels
+        self.elapsed = None
+
+    def __call__(self, func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(self.name, **self.labels):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    def __enter__(self):
+        self._start = time.perf_counter() if enabled() else None
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._start is None:
+            return
+        self.elapsed = time.perf_counter() - self._start
+        observe(f'{self.name}_seconds', self.elapsed, **self.labels)
+        if exc_type is not None:
+            increment(f'{self.name}_errors_total', **self.labels)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                '%s %s took %.2f ms',
+                self.name,
+                self.labels,
+                self.elapsed * 1000,
+                extra={
+                    'metric': self.name,
+                    'labels': self.labels,
+                    'duration_ms': self.elapsed * 1000,
+                },
+            )
+
+
+def reset():
+    """Forgets every recorded value."""
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+        _buckets.clear()
+
+
+def _format_labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', r'\\').replace('"', r'\"'))
+        for name, value in pairs
+    )
+    return '{%s}' % ','.join(f'{name}="{value}"' for name, value in escaped)
+
+
+def render():
+    """Returns every metric in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted(
+            (key, (list(counts), total, count))
+            for key, (counts, total, count) in _histograms.items()
+        )
+        buckets = dict(_buckets)
+
+    typed = set()
+    for (name, labels), value in counters:
+        if name not in typed:
+            typed.add(name)
+            lines.append(f'# TYPE {name} counter')
+        lines.append(f'{name}{_format_labels(labels)} {value}')
+    for (name, labels), (counts, total, count) in histograms:
+        if name not in typed:
+            typed.add(name)
+            lines.append(f'# TYPE {name} histogram')
+        cumulative = 0
+        for bound, bucket_count in zip(buckets[name], counts):
+            cumulative += bucket_count
+            lines.append(
+                f'{name}_bucket{_format_labels(labels, le=bound)} '
+                f'{cumulative}'
+            )
+        lines.append(
+            f'{name}_bucket{_format_labels(labels, le="+Inf")} {count}'
+        )
+        lines.append(f'{name}_sum{_format_labels(labels)} {total}')
+        lines.append(f'{name}_count{_format_labels(labels)} {count}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,125 @@
+import logging
+import threading
+import time
+from contextlib import ExitStack
+from functools import wraps
+
+from django.conf import settings
+from django.db import connections
+from django.template.base import Template
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+_templates_instrumented = False
+_instrument_lock = threading.Lock()
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class _RequestProfile:
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+
+
+def _instrument_templates():
+    """Times top-level ``Template.render`` calls of profiled requests."""
+    global _templates_instrumented
+    with _instrument_lock:
+        if _templates_instrumented:
+            return
+        render = Template.render
+
+        @wraps(render)
+        def timed_render(self, context):
+            profile = getattr(_local, 'profile', None)
+            if profile is None:
+                return render(self, context)
+            profile.template_depth += 1
+            start = time.perf_counter()
+            try:
+                return render(self, context)
+            finally:
+                profile.template_depth -= 1
+                if not profile.template_depth:
+                    profile.template_time += time.perf_counter() - start
+
+        Template.render = timed_render
+        _templates_instrumented = True
+
+
+class QueryProfilingMiddleware:
+    """
+    Measures the SQL query count, database time, template render time and
+    wall time of every request and reports them in a ``Server-Timing``
+    header, e.g. ``db;dur=4.1;desc="6 queries", tpl;dur=2.0, total;dur=9.8``.
+    Database and template time are included in ``total``.
+
+    ``QUERY_BUDGETS`` maps URL names to the most queries the view may run
+    (``QUERY_BUDGET_DEFAULT`` applies to the others). Going over budget is
+    logged, or raises ``QueryBudgetExceeded`` with ``QUERY_BUDGET_STRICT``
+    so tests fail.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        _instrument_templates()
+
+    def __call__(self, request):
+        profile = _RequestProfile()
+        _local.profile = profile
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(profile))
+                response = self.get_response(request)
+        finally:
+            _local.profile = None
+        total = time.perf_counter() - start
+
+        response['Server-Timing'] = (
+            f'db;dur={profile.db_time * 1000:.1f};'
+            f'desc="{profile.queries} queries", '
+            f'tpl;dur={profile.template_time * 1000:.1f}, '
+            f'total;dur={total * 1000:.1f}'
+        )
+        match = request.resolver_match
+        view = match.url_name if match and match.url_name else 'unknown'
+        metrics.observe(
+            'http_request_queries',
+            profile.queries,
+            buckets=(0, 1, 2, 5, 10, 20, 50, 100),
+            view=view,
+        )
+        self._check_budget(request, view, profile.queries)
+        return response
+
+    def _check_budget(self, request, view, queries):
+        budget = getattr(settings, 'QUERY_BUDGETS', {}).get(
+            view, getattr(settings, 'QUERY_BUDGET_DEFAULT', None)
+        )
+        if budget is None or queries <= budget:
+            return
+        message = (
+            f'{request.method} {request.path} ({view}) ran {queries} '
+            f'queries, over its budget of {budget}.'
+        )
+        if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
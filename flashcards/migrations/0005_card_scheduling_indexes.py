@@ -0,0 +1,21 @@
+# Generated by Django 5.1.5 on 2026-10-18 11:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashcards', '0004_card_seen'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='card',
+            index=models.Index(fields=['deck', 'seen', 'next_review'], name='card_deck_seen_review_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='card',
+            index=models.Index(fields=['deck', 'next_review'], name='card_deck_review_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.5 on 2026-10-18 12:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashcards', '0006_importjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='card',
+            name='last_reviewed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
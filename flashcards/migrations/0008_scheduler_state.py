@@ -0,0 +1,38 @@
+# Generated by Django 5.1.5 on 2026-10-18 12:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashcards', '0007_card_last_reviewed_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='card',
+            name='difficulty',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='card',
+            name='ease_factor',
+            field=models.FloatField(default=2.5),
+        ),
+        migrations.AddField(
+            model_name='card',
+            name='interval',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='card',
+            name='stability',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='deck',
+            name='scheduler',
+            field=models.CharField(choices=[('quadratic', 'Quadratic (classic)'), ('sm2', 'SM-2'), ('fsrs', 'FSRS')], default='quadratic', max_length=20),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.5 on 2026-10-18 12:08
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashcards', '0008_scheduler_state'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReviewLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('is_correct', models.BooleanField()),
+                ('reviewed_at', models.DateTimeField()),
+                ('old_interval', models.FloatField(blank=True, null=True)),
+                ('new_interval', models.FloatField(blank=True, null=True)),
+                ('applied', models.BooleanField(default=False)),
+                ('card', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='review_logs', to='flashcards.card')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='review_logs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('applied', False)), fields=['reviewed_at'], name='reviewlog_pending_idx'), models.Index(fields=['user', 'reviewed_at'], name='reviewlog_user_reviewed_idx')],
+                'constraints': [models.UniqueConstraint(fields=('card', 'reviewed_at'), name='reviewlog_card_reviewed_at_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,120 @@
+# Generated by Django 5.1.5 on 2026-10-18 13:05
+
+import hashlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+BATCH_SIZE = 2000
+
+
+def _hash_content(character, pinyin, translation):
+    return hashlib.sha1(
+        '\x1f'.join((character, pinyin, translation)).encode()
+    ).hexdigest()
+
+
+def move_content_to_notes(apps, schema_editor):
+    Card = apps.get_model('flashcards', 'Card')
+    Note = apps.get_model('flashcards', 'Note')
+
+    note_ids = {}
+    batch = []
+    cards = Card.objects.only('id', 'character', 'pinyin', 'translation')
+    for card in cards.iterator(chunk_size=BATCH_SIZE):
+        content = (card.character, card.pinyin, card.translation)
+        content_hash = _hash_content(*content)
+        if content_hash not in note_ids:
+            note_ids[content_hash] = Note.objects.create(
+                content_hash=content_hash,
+                character=card.character,
+                pinyin=card.pinyin,
+                translation=card.translation,
+            ).id
+        card.note_id = note_ids[content_hash]
+        batch.append(card)
+        if len(batch) >= BATCH_SIZE:
+            Card.objects.bulk_update(batch, ['note'], batch_size=500)
+            batch = []
+    Card.objects.bulk_update(batch, ['note'], batch_size=500)
+
+
+def copy_content_to_cards(apps, schema_editor):
+    Card = apps.get_model('flashcards', 'Card')
+
+    batch = []
+    for card in Card.objects.select_related('note').iterator(
+        chunk_size=BATCH_SIZE
+    ):
+        card.character = card.note.character
+        card.pinyin = card.note.pinyin
+        card.translation = card.note.translation
+        batch.append(card)
+        if len(batch) >= BATCH_SIZE:
+            Card.objects.bulk_update(
+                batch, ['character', 'pinyin', 'translation'], batch_size=500
+            )
+            batch = []
+    Card.objects.bulk_update(
+        batch, ['character', 'pinyin', 'translation'], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashcards', '0009_reviewlog'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Note',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=40, unique=True)),
+                ('character', models.CharField(max_length=10)),
+                ('pinyin', models.CharField(max_length=50)),
+                ('translation', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='card',
+            name='note',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='cards', to='flashcards.note'),
+        ),
+        migrations.RunPython(move_content_to_notes, copy_content_to_cards),
+        migrations.AlterField(
+            model_name='card',
+            name='note',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='cards', to='flashcards.note'),
+        ),
+        # Defaults only so the columns can be re-added when migrating back.
+        migrations.AlterField(
+            model_name='card',
+            name='character',
+            field=models.CharField(default='', max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='card',
+            name='pinyin',
+            field=models.CharField(default='', max_length=50),
+        ),
+        migrations.AlterField(
+            model_name='card',
+            name='translation',
+            field=models.TextField(default=''),
+        ),
+        migrations.RemoveField(
+            model_name='card',
+            name='character',
+        ),
+        migrations.RemoveField(
+            model_name='card',
+            name='pinyin',
+        ),
+        migrations.RemoveField(
+            model_name='card',
+            name='translation',
+        ),
+    ]
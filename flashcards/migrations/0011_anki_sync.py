@@ -0,0 +1,33 @@
+# Generated by Django 5.1.5 on 2026-10-18 12:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashcards', '0010_note'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='card',
+            name='anki_guid',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='card',
+            name='anki_mod',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='is_sync',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='retire_missing',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.5 on 2026-10-18 12:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashcards', '0011_anki_sync'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='decks_created',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.5 on 2026-10-18 13:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashcards', '0012_importjob_decks_created'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='card',
+            name='suspended',
+            field=models.BooleanField(default=False),
+        ),
+    ]
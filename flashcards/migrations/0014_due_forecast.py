@@ -0,0 +1,63 @@
+# Generated by Django 5.1.5 on 2026-10-18 13:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+
+def build_forecast(apps, schema_editor):
+    Card = apps.get_model('flashcards', 'Card')
+    DueForecast = apps.get_model('flashcards', 'DueForecast')
+
+    rows = (
+        Card.objects.filter(suspended=False)
+        .annotate(
+            day=TruncDate(
+                'next_review', tzinfo=timezone.get_default_timezone()
+            )
+        )
+        .values('deck__user_id', 'deck_id', 'day')
+        .annotate(due_count=Count('id'))
+        .order_by()
+    )
+    DueForecast.objects.bulk_create(
+        (
+            DueForecast(
+                user_id=row['deck__user_id'],
+                deck_id=row['deck_id'],
+                day=row['day'],
+                due_count=row['due_count'],
+            )
+            for row in rows.iterator()
+        ),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashcards', '0013_card_suspended'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DueForecast',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('due_count', models.IntegerField(default=0)),
+                ('deck', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='due_forecast', to='flashcards.deck')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'day'], name='dueforecast_user_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('deck', 'day'), name='dueforecast_deck_day_uniq')],
+            },
+        ),
+        migrations.RunPython(build_forecast, migrations.RunPython.noop),
+    ]
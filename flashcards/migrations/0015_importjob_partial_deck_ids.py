@@ -0,0 +1,18 @@
+# Generated by Django 5.1.5 on 2026-10-18 13:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashcards', '0014_due_forecast'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='partial_deck_ids',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -1,7 +1,48 @@
+import hashlib
+
 from django.db import models
+from django.db.models import Case, Count, F, Min, Q, Value, When
 from django.contrib.auth.models import User
 from django.utils import timezone
-from datetime import timedelta
+
+from .scheduling import (
+    DEFAULT_SCHEDULER,
+    SCHEDULER_CHOICES,
+    get_scheduler,
+    reschedule_cards,
+    schedule_reviews,
+)
+
+
+class DeckQuerySet(models.QuerySet):
+    def with_stats(self, now=None):
+        """
+        Annotates each deck with ``total_cards``, ``due_cards``,
+        ``reviewed_cards``, ``progress`` and ``next_due_at`` (when the next
+        not-yet-due card becomes due) in a single aggregated query.
+        """
+        if now is None:
+            now = timezone.now()
+        return self.annotate(
+            total_cards=Count('cards'),
+            due_cards=Count(
+                'cards',
+                filter=Q(
+                    cards__next_review__lte=now, cards__suspended=False
+                ),
+            ),
+            reviewed_cards=Count('cards', filter=Q(cards__seen=True)),
+            next_due_at=Min(
+                'cards__next_review',
+                filter=Q(cards__next_review__gt=now, cards__suspended=False),
+            ),
+        ).annotate(
+            progress=Case(
+                When(total_cards=0, then=Value(0)),
+                default=F('reviewed_cards') * 100 / F('total_cards'),
+                output_field=models.IntegerField(),
+            )
+        )
 
 
 class Deck(models.Model):
@@ -12,6 +53,11 @@ class Deck(models.Model):
     user = models.ForeignKey(
         User, on_delete=models.CASCADE, related_name='decks'
     )
+    scheduler = models.CharField(
+        max_length=20, choices=SCHEDULER_CHOICES, default=DEFAULT_SCHEDULER
+    )
+
+    objects = DeckQuerySet.as_manager()
 
     @property
     def card_count(self):
@@ -20,7 +66,9 @@ class Deck(models.Model):
 
     def get_due_cards(self):
         """Returns a queryset of cards that are due for review."""
-        return self.cards.filter(next_review__lte=timezone.now())
+        return self.cards.filter(
+            next_review__lte=timezone.now(), suspended=False
+        )
 
     @property
     def due_cards_count(self):
@@ -43,48 +91,432 @@ class Deck(models.Model):
 
     def next_session(self, max_new_cards=10, max_review_cards=15):
         now = timezone.now()
-        review_cards = self.cards.filter(next_review__lte=now, seen=True)[:max_review_cards]
-        new_cards = self.cards.filter(seen=False)[:max_new_cards]
+        cards = self.cards.filter(suspended=False).select_related('note')
+        review_cards = cards.filter(next_review__lte=now, seen=True)[:max_review_cards]
+        new_cards = cards.filter(seen=False)[:max_new_cards]
         return list(review_cards) + list(new_cards)
 
+    def reschedule(self, batch_size=2000):
+        """
+        Recomputes due dates of every reviewed card with the deck's current
+        scheduler. Returns the number of cards whose due date changed.
+        """
+        scheduler = get_scheduler(self.scheduler)
+        reviewed = self.cards.filter(last_reviewed_at__isnull=False)
+        updated = 0
+        batch = []
+        for card in reviewed.iterator(chunk_size=batch_size):
+            batch.append(card)
+            if len(batch) >= batch_size:
+                updated += self._save_rescheduled(scheduler, batch)
+                batch = []
+        if batch:
+            updated += self._save_rescheduled(scheduler, batch)
+        if updated:
+            from .signals import cards_changed
+
+            cards_changed.send(sender=Card, user_ids={self.user_id})
+        return updated
+
+    @staticmethod
+    def _save_rescheduled(scheduler, cards):
+        changed = reschedule_cards(cards, scheduler)
+        Card.objects.bulk_update(
+            changed, fields=['interval', 'next_review'], batch_size=250
+        )
+        return len(changed)
+
     def __str__(self):
         return f'{self.name} ({self.user.username})'
 
 
+class NoteQuerySet(models.QuerySet):
+    def intern(self, character, pinyin, translation):
+        """Returns the note holding this content, creating it if needed."""
+        note, _ = self.get_or_create(
+            content_hash=Note.hash_content(character, pinyin, translation),
+            defaults={
+                'character': character,
+                'pinyin': pinyin,
+                'translation': translation,
+            },
+        )
+        return note
+
+    def intern_many(self, contents, batch_size=500, hashes=None):
+        """
+        Bulk version of ``intern``. ``contents`` is a list of
+        ``(character, pinyin, translation)`` tuples; returns the matching
+        note ids in the same order. Content that is already stored costs
+        one lookup and no insert. ``hashes`` may carry precomputed
+        ``Note.hash_content`` values.
+        """
+        if hashes is None:
+            hashes = [Note.hash_content(*content) for content in contents]
+        ids = dict(
+            self.filter(content_hash__in=set(hashes)).values_list(
+                'content_hash', 'id'
+            )
+        )
+        missing = {
+            content_hash: content
+            for content_hash, content in zip(hashes, contents)
+            if content_hash not in ids
+        }
+        if missing:
+            # Another import may insert the same content concurrently.
+            self.bulk_create(
+                [
+                    Note(
+                        content_hash=content_hash,
+                        character=character,
+                        pinyin=pinyin,
+                        translation=translation,
+                    )
+                    for content_hash, (
+                        character,
+                        pinyin,
+                        translation,
+                    ) in missing.items()
+                ],
+                batch_size=batch_size,
+                ignore_conflicts=True,
+            )
+            ids.update(
+                self.filter(content_hash__in=list(missing)).values_list(
+                    'content_hash', 'id'
+                )
+            )
+        return [ids[content_hash] for content_hash in hashes]
+
+    def unreferenced(self):
+        return self.filter(cards__isnull=True)
+
+
+class Note(models.Model):
+    """
+    Card content, stored once and shared by every card (of any user or
+    deck) with the same text. Notes are never edited in place: changing a
+    card's content points it at another note.
+    """
+
+    content_hash = models.CharField(max_length=40, unique=True)
+    character = models.CharField(max_length=10)
+    pinyin = models.CharField(max_length=50)
+    translation = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = NoteQuerySet.as_manager()
+
+    @staticmethod
+    def hash_content(character, pinyin, translation):
+        return hashlib.sha1(
+            '\x1f'.join((character, pinyin, translation)).encode()
+        ).hexdigest()
+
+    def save(self, *args, **kwargs):
+        self.content_hash = self.hash_content(
+            self.character, self.pinyin, self.translation
+        )
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f'{self.character} ({self.pinyin})'
+
+
+class CardQuerySet(models.QuerySet):
+    """
+    Bulk edits run as one UPDATE each and send ``cards_changed`` for the
+    owners of the affected cards. They return the number of cards updated.
+    """
+
+    def _update_and_notify(self, **fields):
+        user_ids = set(
+            self.order_by()
+            .values_list('deck__user_id', flat=True)
+            .distinct()
+        )
+        updated = self.update(**fields)
+        if updated:
+            from .signals import cards_changed
+
+            cards_changed.send(sender=Card, user_ids=user_ids)
+        return updated
+
+    def reset_schedule(self):
+        """Makes the cards new again, due now."""
+        return self._update_and_notify(
+            seen=False,
+            consecutive_correct=0,
+            next_review=timezone.now(),
+            last_reviewed_at=None,
+            interval=0,
+            ease_factor=2.5,
+            stability=0,
+            difficulty=0,
+        )
+
+    def suspend(self):
+        return self._update_and_notify(suspended=True)
+
+    def unsuspend(self):
+        return self._update_and_notify(suspended=False)
+
+    def move_to(self, deck):
+        """
+        Moves the cards of ``deck``'s owner into ``deck``; cards of other
+        users are left where they are.
+        """
+        return self.filter(deck__user_id=deck.user_id)._update_and_notify(
+            deck=deck
+        )
+
+
 class Card(models.Model):
     deck = models.ForeignKey(
         Deck, on_delete=models.CASCADE, related_name='cards'
     )
-    character = models.CharField(max_length=10)
-    pinyin = models.CharField(max_length=50)
-    translation = models.TextField()
+    note = models.ForeignKey(
+        Note, on_delete=models.PROTECT, related_name='cards'
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     next_review = models.DateTimeField(default=timezone.now)
     consecutive_correct = models.IntegerField(default=0)
     # New field to track whether the user has seen this card before.
     seen = models.BooleanField(default=False)
+    last_reviewed_at = models.DateTimeField(null=True, blank=True)
+    # Scheduler state; which fields matter depends on the deck's algorithm.
+    interval = models.FloatField(default=0)
+    ease_factor = models.FloatField(default=2.5)
+    stability = models.FloatField(default=0)
+    difficulty = models.FloatField(default=0)
+    # Suspended cards keep their schedule but are never due.
+    suspended = models.BooleanField(default=False)
+    # Identity of the source Anki note, used to sync re-imported packages.
+    anki_guid = models.CharField(max_length=64, blank=True, default='')
+    anki_mod = models.BigIntegerField(null=True, blank=True)
+    objects = CardQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Serves next_session() (new/review split) and with_stats().
+            models.Index(
+                fields=['deck', 'seen', 'next_review'],
+                name='card_deck_seen_review_idx',
+            ),
+            # Serves due-card lookups that ignore ``seen``.
+            models.Index(
+                fields=['deck', 'next_review'],
+                name='card_deck_review_idx',
+            ),
+        ]
+
+    # Columns touched when a review is applied.
+    REVIEW_FIELDS = [
+        'seen',
+        'consecutive_correct',
+        'next_review',
+        'last_reviewed_at',
+        'interval',
+        'ease_factor',
+        'stability',
+        'difficulty',
+    ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        card = super().from_db(db, field_names, values)
+        # What the due forecast counts for the stored row, so that a save
+        # can move the card between forecast days without a rebuild.
+        if {'deck_id', 'next_review', 'suspended'} <= set(field_names):
+            card._saved_forecast_state = card.forecast_state()
+        return card
+
+    def forecast_state(self):
+        """
+        ``(deck_id, next_review)`` as counted by the due forecast, with no
+        due date for suspended cards.
+        """
+        return self.deck_id, None if self.suspended else self.next_review
+
+    @property
+    def character(self):
+        return self.note.character
+
+    @property
+    def pinyin(self):
+        return self.note.pinyin
+
+    @property
+    def translation(self):
+        return self.note.translation
+
+    def set_content(self, character, pinyin, translation):
+        """Points the card at the note for this content (not saved)."""
+        self.note = Note.objects.intern(character, pinyin, translation)
+
+    def apply_review(self, is_correct, reviewed_at=None):
+        """
+        Applies a review to the in-memory instance without saving it, using
+        the deck's scheduler. Marks the card as seen if it wasn't already.
+        """
+        if reviewed_at is None:
+            reviewed_at = timezone.now()
+        schedule_reviews([self], [is_correct], [reviewed_at])
 
     def update_performance(self, is_correct):
         """
         Updates the card's scheduling based on the user's performance.
-        Marks the card as seen if it wasn't already.
+        Marks the card as seen if it wasn't already. Answers still waiting
+        in the review log are applied first.
         """
-        now = timezone.now()
-        # Mark card as seen if it's the first time the card is reviewed.
-        if not self.seen:
-            self.seen = True
-
-        if is_correct:
-            self.consecutive_correct += 1
-            interval = self.consecutive_correct ** 2  # Success squared
-        else:
-            self.consecutive_correct = 0
-            interval = 1  # Reset interval to 1 day on failure
-
-        # Ensure the interval does not exceed 60 days.
-        interval = min(interval, 60)
-        self.next_review = now + timedelta(days=interval)
-        self.save()
+        from .reviews import apply_review_batch
+
+        changed, _, _ = apply_review_batch(
+            self.deck.user,
+            [
+                {
+                    'card_id': self.pk,
+                    'is_correct': is_correct,
+                    'reviewed_at': timezone.now(),
+                }
+            ],
+        )
+        for card in changed:
+            for field in self.REVIEW_FIELDS:
+                setattr(self, field, getattr(card, field))
+            self._saved_forecast_state = self.forecast_state()
 
     def __str__(self):
         return f'{self.character} ({self.deck.name})'
+
+
+class ImportJob(models.Model):
+    """Tracks an Anki package import running in the background."""
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='import_jobs'
+    )
+    file_name = models.CharField(max_length=255)
+    # Location of the uploaded package until the worker has consumed it.
+    file_path = models.CharField(max_length=500, blank=True)
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=PENDING
+    )
+    progress = models.PositiveSmallIntegerField(default=0)
+    notes_total = models.PositiveIntegerField(null=True, blank=True)
+    notes_processed = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    # With ``is_sync`` the package is synced into this existing deck;
+    # otherwise it is set to the newly created deck on success.
+    deck = models.ForeignKey(
+        Deck,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='import_jobs',
+    )
+    # Collections holding several Anki decks are split into one deck each.
+    decks_created = models.PositiveSmallIntegerField(default=0)
+    # Decks a running new-deck import has created so far, deleted if the
+    # job fails or is found abandoned.
+    partial_deck_ids = models.JSONField(default=list, blank=True)
+    is_sync = models.BooleanField(default=False)
+    retire_missing = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    @property
+    def is_finished(self):
+        return self.status in (self.SUCCEEDED, self.FAILED)
+
+    def __str__(self):
+        return f'{self.file_name} ({self.status})'
+
+
+class ReviewLog(models.Model):
+    """
+    Append-only record of every graded answer. Rows are written first and
+    folded into the ``Card`` row later by ``reviews.flush_review_log``;
+    ``applied`` marks the ones that have been folded in.
+    """
+
+    card = models.ForeignKey(
+        Card, on_delete=models.CASCADE, related_name='review_logs'
+    )
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='review_logs'
+    )
+    is_correct = models.BooleanField()
+    reviewed_at = models.DateTimeField()
+    old_interval = models.FloatField(null=True, blank=True)
+    new_interval = models.FloatField(null=True, blank=True)
+    applied = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            # A client retrying the same answer must not grade it twice.
+            models.UniqueConstraint(
+                fields=['card', 'reviewed_at'],
+                name='reviewlog_card_reviewed_at_uniq',
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['reviewed_at'],
+                condition=Q(applied=False),
+                name='reviewlog_pending_idx',
+            ),
+            models.Index(
+                fields=['user', 'reviewed_at'],
+                name='reviewlog_user_reviewed_idx',
+            ),
+        ]
+
+    def __str__(self):
+        result = 'correct' if self.is_correct else 'incorrect'
+        return f'{self.card_id} {result} at {self.reviewed_at:%Y-%m-%d %H:%M}'
+
+
+class DueForecast(models.Model):
+    """
+    Number of unsuspended cards of a deck whose ``next_review`` falls on
+    ``day`` (in the default time zone). Maintained by
+    ``flashcards.due_forecast``.
+    """
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    deck = models.ForeignKey(
+        Deck, on_delete=models.CASCADE, related_name='due_forecast'
+    )
+    day = models.DateField()
+    due_count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['deck', 'day'], name='dueforecast_deck_day_uniq'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', 'day'], name='dueforecast_user_day_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.deck_id} {self.day}: {self.due_count}'
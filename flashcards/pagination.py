@@ -0,0 +1,50 @@
+"""
+Keyset (cursor) pagination over ``(next_review, id)``.
+
+Unlike OFFSET pagination the cost of a page does not depend on how deep
+it is: each page is an index range scan starting right after the last
+row of the previous page.
+"""
+import base64
+from datetime import datetime
+
+MAX_PAGE_SIZE = 100
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(card):
+    raw = f'{card.next_review.isoformat()}|{card.pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        next_review, pk = raw.rsplit('|', 1)
+        return datetime.fromisoformat(next_review), int(pk)
+    except (ValueError, UnicodeError) as e:
+        raise InvalidCursor('Invalid cursor.') from e
+
+
+def keyset_page(queryset, page_size, cursor=None):
+    """
+    Returns ``(cards, next_cursor)`` for the page after ``cursor``.
+    ``next_cursor`` is None on the last page.
+    """
+    queryset = queryset.order_by('next_review', 'id')
+    if cursor:
+        next_review, pk = decode_cursor(cursor)
+        # Written as a range on next_review (rather than an OR of two
+        # conditions) so the database can seek the index to the cursor.
+        queryset = queryset.filter(next_review__gte=next_review).exclude(
+            next_review=next_review, id__lte=pk
+        )
+    # One extra row tells whether another page exists.
+    cards = list(queryset[: page_size + 1])
+    if len(cards) > page_size:
+        cards = cards[:page_size]
+        return cards, encode_cursor(cards[-1])
+    return cards, None
@@ -0,0 +1,384 @@
+"""
+Parallel import of several Anki packages.
+
+Unpacking a package and turning its notes into card content runs in a
+process pool shared by the import threads; only those threads write to
+the database, in one short transaction per batch. Packages whose
+collection holds several Anki decks are split into one ``Deck`` each.
+
+Pool workers import this module before Django is set up, so model and
+service imports are deferred to the functions that run after setup.
+"""
+import json
+import os
+import sqlite3
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+
+from django.conf import settings
+
+from .metrics import timed
+
+# Notes per parsing task; also the size of each write batch.
+PARSE_CHUNK_SIZE = 2000
+# Parsed chunks held ahead of the writer, which bounds memory use.
+PARSE_AHEAD = 8
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _init_worker():
+    import django
+
+    django.setup()
+
+
+class _InlineExecutor:
+    """Runs tasks in the calling thread (``IMPORT_PARSE_WORKERS = 0``)."""
+
+    def submit(self, fn, *args):
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+def _get_pool():
+    global _pool
+    workers = getattr(settings, 'IMPORT_PARSE_WORKERS', None)
+    if workers == 0:
+        return _InlineExecutor()
+    with _pool_lock:
+        if _pool is None:
+            # Spawned, not forked: the web process runs other threads.
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=get_context('spawn'),
+                initializer=_init_worker,
+            )
+        return _pool
+
+
+def _discard_pool(pool):
+    """
+    Drops ``pool`` after one of its workers died, so that the next
+    ``_get_pool`` starts a new one instead of failing every import.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def prepare_package(apkg_path):
+    """
+    Pool task: extracts the collection of the package at ``apkg_path`` and
+    plans its parsing. Returns a dict with the extracted ``db_path``, the
+    compatible ``specs``, the note identity ``columns``, the Anki ``decks``
+    to split into (empty for a single-deck collection), ``notes_total``
+    and the note-id ranges (``chunks``) to parse.
+    """
+    from django.core.files import File
+
+    from .services import AnkiImporterService
+
+    importer = AnkiImporterService(user=None)
+    with open(apkg_path, 'rb') as fh:
+        upload = File(fh, name=os.path.basename(apkg_path))
+        with importer._open_collection(upload) as (cursor, specs):
+            model_ids = list(specs)
+            placeholders = ','.join(['?'] * len(model_ids))
+            columns = importer._note_identity_columns(cursor)
+
+            chunks, notes_total, first = [], 0, None
+            cursor.execute(
+                f'SELECT id FROM notes WHERE mid IN ({placeholders}) '
+                'ORDER BY id',
+                model_ids,
+            )
+            for (note_id,) in cursor:
+                if first is None:
+                    first = note_id
+                notes_total += 1
+                if notes_total % PARSE_CHUNK_SIZE == 0:
+                    chunks.append((first, note_id))
+                    first = None
+            if first is not None:
+                chunks.append((first, note_id))
+
+            decks = _anki_decks(cursor, placeholders, model_ids)
+            db_path = importer._tmp_db_path
+            # The caller owns the extracted database from here on.
+            importer._tmp_db_path = None
+    return {
+        'db_path': db_path,
+        'specs': specs,
+        'columns': columns,
+        'decks': decks,
+        'notes_total': notes_total,
+        'chunks': chunks,
+    }
+
+
+def _anki_decks(cursor, placeholders, model_ids):
+    """Names of the Anki decks holding usable notes, if more than one."""
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
+    tables = {row[0] for row in cursor.fetchall()}
+    if 'cards' not in tables:
+        return {}
+    cursor.execute(
+        'SELECT DISTINCT c.did FROM cards c JOIN notes n ON n.id = c.nid '
+        f'WHERE n.mid IN ({placeholders})',
+        model_ids,
+    )
+    deck_ids = [row[0] for row in cursor.fetchall()]
+    if len(deck_ids) < 2:
+        return {}
+    cursor.execute('PRAGMA table_info(col)')
+    names = {}
+    if 'decks' in {row[1] for row in cursor.fetchall()}:
+        cursor.execute('SELECT decks FROM col LIMIT 1')
+        names = {
+            int(deck_id): deck.get('name', '')
+            for deck_id, deck in json.loads(cursor.fetchone()[0]).items()
+        }
+    return {
+        deck_id: names.get(deck_id) or f'Deck {deck_id}'
+        for deck_id in deck_ids
+    }
+
+
+def parse_chunk(db_path, specs, columns, split, first_id, last_id):
+    """
+    Pool task: maps the notes with ids in ``[first_id, last_id]`` to card
+    content. Returns ``(notes_read, rows)`` where each row is
+    ``(anki_deck_id, guid, mod, content, content_hash)``; ``anki_deck_id``
+    is None unless ``split``.
+    """
+    from .models import Note
+    from .services import AnkiImporterService
+
+    importer = AnkiImporterService(user=None)
+    guid, mod = columns
+    model_ids = list(specs)
+    placeholders = ','.join(['?'] * len(model_ids))
+    # A note with cards in several decks goes to the first of them.
+    deck_column, deck_join = 'NULL', ''
+    if split:
+        deck_column = 'c.did'
+        deck_join = (
+            'LEFT JOIN (SELECT nid, MIN(did) AS did FROM cards '
+            'WHERE nid BETWEEN ? AND ? GROUP BY nid) c ON c.nid = n.id'
+        )
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    conn.row_factory = sqlite3.Row
+    try:
+        note_rows = conn.execute(
+            f'SELECT {guid} AS guid, {mod} AS mod, n.mid, n.flds, '
+            f'{deck_column} AS did FROM notes n {deck_join} '
+            f'WHERE n.id BETWEEN ? AND ? AND n.mid IN ({placeholders}) '
+            'ORDER BY n.id',
+            ([first_id, last_id] if split else [])
+            + [first_id, last_id]
+            + model_ids,
+        ).fetchall()
+    finally:
+        conn.close()
+
+    rows = []
+    for note_row in note_rows:
+        content = importer._note_content(note_row, specs)
+        if content is not None:
+            rows.append(
+                (
+                    note_row['did'],
+                    note_row['guid'],
+                    note_row['mod'],
+                    content,
+                    Note.hash_content(*content),
+                )
+            )
+    return len(note_rows), rows
+
+
+class _PackageImport:
+    """Writer-side state of one package (one ``ImportJob``)."""
+
+    def __init__(self, job, plan):
+        self.job = job
+        self.plan = plan
+        self.decks = {}
+        self.notes_read = 0
+        self.cards_created = 0
+        self.failed = False
+
+    @property
+    def deck_name(self):
+        return os.path.splitext(os.path.basename(self.job.file_name))[0]
+
+    def deck_for(self, anki_deck_id):
+        from .models import Deck, ImportJob
+
+        if anki_deck_id not in self.decks:
+            name = self.plan['decks'].get(anki_deck_id) or self.deck_name
+            self.decks[anki_deck_id] = Deck.objects.create(
+                user=self.job.user, name=name[:100]
+            )
+            ImportJob.objects.filter(pk=self.job.pk).update(
+                partial_deck_ids=[deck.pk for deck in self.decks.values()]
+            )
+        return self.decks[anki_deck_id]
+
+    def write(self, notes_read, rows):
+        from django.db import transaction
+
+        from .due_forecast import apply_due_changes
+        from .models import Card, Note
+
+        self.notes_read += notes_read
+        if not rows:
+            return
+        # Create decks outside the batch transaction so a failed batch
+        # cannot leave the writer with references to rolled-back decks.
+        decks = [self.deck_for(row[0]) for row in rows]
+        with transaction.atomic():
+            note_ids = Note.objects.intern_many(
+                [row[3] for row in rows],
+                hashes=[row[4] for row in rows],
+            )
+            cards = Card.objects.bulk_create(
+                [
+                    Card(
+                        deck=deck,
+                        note_id=note_id,
+                        anki_guid=guid,
+                        anki_mod=mod,
+                    )
+                    for deck, note_id, (_, guid, mod, _, _) in zip(
+                        decks, note_ids, rows
+                    )
+                ]
+            )
+            apply_due_changes(
+                (self.job.user_id, card.deck_id, None, card.next_review)
+                for card in cards
+            )
+        self.cards_created += len(rows)
+
+    def discard(self):
+        for deck in self.decks.values():
+            deck.delete()
+        self.decks = {}
+
+
+def import_packages(jobs, on_progress=None, on_finished=None):
+    """
+    Imports the packages of ``jobs`` (pending new-deck ``ImportJob``s)
+    in order, writing from the calling thread while the pool prepares
+    and parses up to ``PARSE_AHEAD`` chunks ahead.
+
+    ``on_progress(job, notes_read, notes_total)`` is called after every
+    written batch and ``on_finished(job, decks, error)`` once per job,
+    with ``error`` set (and ``decks`` empty) if it failed.
+    """
+    from .models import Card
+    from .services import AnkiImportError
+    from .signals import cards_changed
+
+    pool = _get_pool()
+
+    def tasks():
+        for job in jobs:
+            try:
+                plan = plans[job.pk].result()
+            except Exception as e:
+                yield job, None, e
+                continue
+            package = _PackageImport(job, plan)
+            split = bool(plan['decks'])
+            for first_id, last_id in plan['chunks']:
+                future = pool.submit(
+                    parse_chunk,
+                    plan['db_path'],
+                    plan['specs'],
+                    plan['columns'],
+                    split,
+                    first_id,
+                    last_id,
+                )
+                yield job, package, future
+            yield job, package, None
+
+    def finish(job, package, error):
+        if isinstance(error, BrokenProcessPool):
+            _discard_pool(pool)
+        if package is not None:
+            if not error and package.cards_created == 0:
+                error = AnkiImportError(
+                    'No notes found matching the compatible card models.'
+                    if package.notes_read == 0
+                    else f"No cards could be created for deck "
+                    f"'{package.deck_name}'."
+                )
+            if error:
+                package.discard()
+            elif package.cards_created:
+                cards_changed.send(
+                    sender=Card, user_ids={job.user_id}, forecast_updated=True
+                )
+            if package.plan['db_path'] and os.path.exists(
+                package.plan['db_path']
+            ):
+                os.unlink(package.plan['db_path'])
+        if on_finished is not None:
+            decks = [] if error else list(package.decks.values())
+            on_finished(job, decks, error)
+
+    pending = deque()
+    source = tasks()
+    exhausted = False
+    try:
+        plans = {
+            job.pk: pool.submit(prepare_package, job.file_path)
+            for job in jobs
+        }
+        while True:
+            while not exhausted and len(pending) < PARSE_AHEAD:
+                try:
+                    pending.append(next(source))
+                except StopIteration:
+                    exhausted = True
+            if not pending:
+                break
+            job, package, task = pending.popleft()
+            if package is None:
+                finish(job, None, task)
+            elif task is None:
+                if not package.failed:
+                    finish(job, package, None)
+            elif not package.failed:
+                try:
+                    with timed('anki_import_phase', phase='parse_wait'):
+                        result = task.result()
+                    with timed('anki_import_phase', phase='write'):
+                        package.write(*result)
+                except Exception as e:
+                    package.failed = True
+                    finish(job, package, e)
+                    continue
+                if on_progress is not None:
+                    on_progress(
+                        job, package.notes_read, package.plan['notes_total']
+                    )
+    except BrokenProcessPool:
+        # The pool refuses new tasks once broken, failing the rest of
+        # the batch.
+        _discard_pool(pool)
+        raise
@@ -0,0 +1,258 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from .due_forecast import apply_due_changes
+from .metrics import ROW_BUCKETS, observe, timed
+from .models import Card, ReviewLog
+from .scheduling import schedule_reviews
+from .signals import cards_changed
+
+logger = logging.getLogger(__name__)
+
+_flusher = None
+_flusher_lock = threading.Lock()
+
+
+def _apply_in_waves(cards, items):
+    """
+    Applies ``items`` (dicts with ``card_id``, ``is_correct`` and
+    ``reviewed_at``, sorted chronologically) to the loaded ``cards``.
+
+    Items not newer than their card's ``last_reviewed_at`` were already
+    applied and are skipped. The rest are split into waves: the n-th
+    pending review of every card goes into wave n, so each wave is
+    scheduled in one vectorized call. Each applied item gets the card's
+    ``old_interval``/``new_interval`` recorded on it.
+
+    Returns ``(changed_cards, applied_items, skipped_items)``.
+    """
+    waves = []
+    last_seen = {pk: card.last_reviewed_at for pk, card in cards.items()}
+    depth = {}
+    skipped = []
+    for item in items:
+        pk = item['card_id']
+        if pk not in cards:
+            continue
+        reviewed_at = item['reviewed_at']
+        if last_seen[pk] and reviewed_at <= last_seen[pk]:
+            skipped.append(item)
+            continue
+        last_seen[pk] = reviewed_at
+        wave = depth.get(pk, 0)
+        depth[pk] = wave + 1
+        if wave == len(waves):
+            waves.append([])
+        waves[wave].append(item)
+
+    for wave in waves:
+        wave_cards = [cards[item['card_id']] for item in wave]
+        for card, item in zip(wave_cards, wave):
+            item['old_interval'] = card.interval
+        with timed('schedule_reviews'):
+            schedule_reviews(
+                wave_cards,
+                [item['is_correct'] for item in wave],
+                [item['reviewed_at'] for item in wave],
+            )
+        observe('schedule_reviews_rows', len(wave), buckets=ROW_BUCKETS)
+        for card, item in zip(wave_cards, wave):
+            item['new_interval'] = card.interval
+
+    applied = [item for wave in waves for item in wave]
+    return [cards[pk] for pk in depth], applied, skipped
+
+
+def _due_changes(cards, old_due):
+    return [
+        (card.deck.user_id, card.deck_id, old_due[card.pk], card.next_review)
+        for card in cards
+        if not card.suspended
+    ]
+
+
+def _locked_cards(card_ids, user=None):
+    cards = Card.objects.select_for_update().select_related('deck')
+    if user is not None:
+        cards = cards.filter(deck__user=user)
+    return {card.pk: card for card in cards.filter(pk__in=card_ids)}
+
+
+@timed('review_flush')
+def flush_review_log(card_ids=None, limit=None):
+    """
+    Folds pending ``ReviewLog`` rows into their ``Card`` rows in one
+    transaction, oldest first. Returns the number of log rows consumed.
+    """
+    if limit is None:
+        limit = getattr(settings, 'REVIEW_FLUSH_BATCH_SIZE', 1000)
+    with transaction.atomic():
+        pending = ReviewLog.objects.filter(applied=False)
+        if card_ids is not None:
+            pending = pending.filter(card_id__in=card_ids)
+        if connection.features.has_select_for_update_skip_locked:
+            pending = pending.select_for_update(skip_locked=True)
+        logs = list(pending.order_by('reviewed_at', 'id')[:limit])
+        if not logs:
+            return 0
+
+        cards = _locked_cards({log.card_id for log in logs})
+        old_due = {pk: card.next_review for pk, card in cards.items()}
+        items = [
+            {
+                'card_id': log.card_id,
+                'is_correct': log.is_correct,
+                'reviewed_at': log.reviewed_at,
+                'log': log,
+            }
+            for log in logs
+        ]
+        changed, applied, _ = _apply_in_waves(cards, items)
+        for item in applied:
+            item['log'].old_interval = item['old_interval']
+            item['log'].new_interval = item['new_interval']
+        for log in logs:
+            log.applied = True
+
+        if changed:
+            Card.objects.bulk_update(changed, fields=Card.REVIEW_FIELDS)
+            apply_due_changes(_due_changes(changed, old_due))
+            cards_changed.send(
+                sender=Card,
+                user_ids={card.deck.user_id for card in changed},
+                forecast_updated=True,
+            )
+        ReviewLog.objects.bulk_update(
+            logs, fields=['applied', 'old_interval', 'new_interval']
+        )
+    return len(logs)
+
+
+def record_review(card_id, user, is_correct, reviewed_at=None):
+    """
+    Durably queues one graded answer and returns its ``ReviewLog``. The
+    caller is responsible for checking that ``user`` owns the card.
+
+    With ``REVIEW_WRITE_BEHIND`` enabled this is a single INSERT; the card
+    row is updated later by the background flusher. Otherwise the card is
+    updated before returning.
+    """
+    if reviewed_at is None:
+        reviewed_at = timezone.now()
+    log = ReviewLog.objects.create(
+        card_id=card_id,
+        user=user,
+        is_correct=is_correct,
+        reviewed_at=reviewed_at,
+    )
+    if getattr(settings, 'REVIEW_WRITE_BEHIND', False):
+        ensure_flusher()
+    else:
+        flush_review_log(card_ids=[card_id])
+    return log
+
+
+def apply_logged_reviews(card):
+    """
+    Applies to the loaded ``card``, in memory, the logged answers that its
+    row does not include yet, giving the schedule it will have once the
+    flusher has caught up.
+    """
+    logs = ReviewLog.objects.filter(card_id=card.pk)
+    if card.last_reviewed_at is not None:
+        logs = logs.filter(reviewed_at__gt=card.last_reviewed_at)
+    for log in logs.order_by('reviewed_at', 'id'):
+        card.apply_review(log.is_correct, log.reviewed_at)
+
+
+def apply_review_batch(user, entries):
+    """
+    Applies many reviews for ``user``'s cards at once.
+
+    ``entries`` is an iterable of dicts with ``card_id``, ``is_correct`` and
+    ``reviewed_at``. Ownership is checked with a single query, schedules are
+    computed in memory (one scheduler call per wave) and written with one
+    ``bulk_update``; the applied reviews are appended to the review log in
+    the same transaction. An entry whose ``reviewed_at`` is not newer than
+    the card's ``last_reviewed_at`` has already been applied and is
+    skipped, which makes retries idempotent.
+
+    Returns ``(updated_cards, skipped_count, missing_card_ids)``.
+    """
+    entries = sorted(
+        (dict(entry) for entry in entries),
+        key=lambda entry: (entry['reviewed_at'], entry['card_id']),
+    )
+    card_ids = {entry['card_id'] for entry in entries}
+
+    with transaction.atomic():
+        cards = _locked_cards(card_ids, user=user)
+        # Answers still waiting in the log must land before these ones.
+        if ReviewLog.objects.filter(
+            card_id__in=cards, applied=False
+        ).exists():
+            flush_review_log(card_ids=list(cards))
+            cards = _locked_cards(card_ids, user=user)
+
+        old_due = {pk: card.next_review for pk, card in cards.items()}
+        changed, applied, skipped = _apply_in_waves(cards, entries)
+        if changed:
+            Card.objects.bulk_update(changed, fields=Card.REVIEW_FIELDS)
+            apply_due_changes(_due_changes(changed, old_due))
+            ReviewLog.objects.bulk_create(
+                [
+                    ReviewLog(
+                        card_id=entry['card_id'],
+                        user=user,
+                        is_correct=entry['is_correct'],
+                        reviewed_at=entry['reviewed_at'],
+                        old_interval=entry['old_interval'],
+                        new_interval=entry['new_interval'],
+                        applied=True,
+                    )
+                    for entry in applied
+                ],
+                ignore_conflicts=True,
+            )
+            cards_changed.send(
+                sender=Card, user_ids={user.pk}, forecast_updated=True
+            )
+
+    missing = sorted(card_ids - cards.keys())
+    return changed, len(skipped), missing
+
+
+class ReviewFlusher(threading.Thread):
+    """Daemon thread that periodically folds pending reviews into cards."""
+
+    def __init__(self, interval):
+        super().__init__(name='review-flusher', daemon=True)
+        self.interval = interval
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                while flush_review_log():
+                    pass
+            except Exception as e:
+                logger.error(f'Review log flush failed: {e}', exc_info=True)
+            finally:
+                close_old_connections()
+
+
+def ensure_flusher():
+    """Starts the review flusher thread of this process if needed."""
+    global _flusher
+    interval = getattr(settings, 'REVIEW_FLUSH_INTERVAL', None)
+    if not interval:
+        return
+    with _flusher_lock:
+        if _flusher is None or not _flusher.is_alive():
+            _flusher = ReviewFlusher(interval)
+            _flusher.start()
@@ -0,0 +1,314 @@
+"""
+Spaced-repetition schedulers.
+
+Every scheduler works on whole columns of card state at once
+(``ReviewStates``) so grading a batch, rescheduling a deck or running a
+simulation costs one pass over flat arrays instead of one model call per
+card.
+"""
+import math
+from abc import ABC, abstractmethod
+from array import array
+from datetime import timedelta
+
+MAX_INTERVAL_DAYS = 36500
+
+
+class ReviewStates:
+    """Column-oriented scheduling state for a batch of cards."""
+
+    __slots__ = (
+        'consecutive_correct',
+        'interval',
+        'ease_factor',
+        'stability',
+        'difficulty',
+    )
+
+    def __init__(
+        self,
+        consecutive_correct,
+        interval,
+        ease_factor,
+        stability,
+        difficulty,
+    ):
+        self.consecutive_correct = array('l', consecutive_correct)
+        self.interval = array('d', interval)
+        self.ease_factor = array('d', ease_factor)
+        self.stability = array('d', stability)
+        self.difficulty = array('d', difficulty)
+
+    def __len__(self):
+        return len(self.consecutive_correct)
+
+    @classmethod
+    def from_cards(cls, cards):
+        return cls(
+            [card.consecutive_correct for card in cards],
+            [card.interval for card in cards],
+            [card.ease_factor for card in cards],
+            [card.stability for card in cards],
+            [card.difficulty for card in cards],
+        )
+
+    def write_to(self, cards):
+        for i, card in enumerate(cards):
+            card.consecutive_correct = self.consecutive_correct[i]
+            card.interval = self.interval[i]
+            card.ease_factor = self.ease_factor[i]
+            card.stability = self.stability[i]
+            card.difficulty = self.difficulty[i]
+
+
+class Scheduler(ABC):
+    """
+    Base class for schedulers. Subclasses must implement ``schedule``, which
+    returns the states after one review per card, and
+    ``current_intervals``, which re-derives intervals from existing state
+    (used when a deck switches algorithm or parameters).
+    """
+
+    name = None
+    label = None
+
+    @abstractmethod
+    def schedule(self, states, is_correct, elapsed_days):
+        pass
+
+    @abstractmethod
+    def current_intervals(self, states):
+        pass
+
+
+class QuadraticScheduler(Scheduler):
+    """The original rule: ``consecutive_correct ** 2`` days, capped."""
+
+    name = 'quadratic'
+    label = 'Quadratic (classic)'
+
+    def __init__(self, maximum_interval=60):
+        self.maximum_interval = maximum_interval
+
+    def _intervals(self, streaks):
+        cap = self.maximum_interval
+        return [min(streak * streak, cap) if streak else 1 for streak in streaks]
+
+    def schedule(self, states, is_correct, elapsed_days):
+        streaks = [
+            streak + 1 if correct else 0
+            for streak, correct in zip(states.consecutive_correct, is_correct)
+        ]
+        return ReviewStates(
+            streaks,
+            self._intervals(streaks),
+            states.ease_factor,
+            states.stability,
+            states.difficulty,
+        )
+
+    def current_intervals(self, states):
+        return array('d', self._intervals(states.consecutive_correct))
+
+
+class SM2Scheduler(Scheduler):
+    """SuperMemo 2. A correct answer counts as quality 4, a miss as 1."""
+
+    name = 'sm2'
+    label = 'SM-2'
+
+    CORRECT_QUALITY = 4
+    INCORRECT_QUALITY = 1
+    MINIMUM_EASE = 1.3
+
+    def __init__(self, maximum_interval=MAX_INTERVAL_DAYS):
+        self.maximum_interval = maximum_interval
+
+    def schedule(self, states, is_correct, elapsed_days):
+        streaks, intervals, eases = [], [], []
+        cap = self.maximum_interval
+        for streak, interval, ease, correct in zip(
+            states.consecutive_correct,
+            states.interval,
+            states.ease_factor,
+            is_correct,
+        ):
+            quality = self.CORRECT_QUALITY if correct else self.INCORRECT_QUALITY
+            if correct:
+                if streak == 0:
+                    interval = 1
+                elif streak == 1:
+                    interval = 6
+                else:
+                    interval = min(round(interval * ease), cap)
+                streak += 1
+            else:
+                streak, interval = 0, 1
+            miss = 5 - quality
+            ease = max(
+                self.MINIMUM_EASE, ease + 0.1 - miss * (0.08 + miss * 0.02)
+            )
+            streaks.append(streak)
+            intervals.append(interval)
+            eases.append(ease)
+        return ReviewStates(
+            streaks, intervals, eases, states.stability, states.difficulty
+        )
+
+    def current_intervals(self, states):
+        return array(
+            'd',
+            [
+                min(max(interval, 1), self.maximum_interval)
+                for interval in states.interval
+            ],
+        )
+
+
+class FSRSScheduler(Scheduler):
+    """
+    FSRS-style memory model (stability/difficulty, FSRS v4 weights). A
+    correct answer is graded "Good", a miss "Again".
+    """
+
+    name = 'fsrs'
+    label = 'FSRS'
+
+    DEFAULT_WEIGHTS = (
+        0.4, 0.6, 2.4, 5.8, 4.93, 0.94, 0.86, 0.01, 1.49,
+        0.14, 0.94, 2.18, 0.05, 0.34, 1.26, 0.29, 2.61,
+    )
+    AGAIN, GOOD = 1, 3
+
+    def __init__(
+        self,
+        weights=DEFAULT_WEIGHTS,
+        desired_retention=0.9,
+        maximum_interval=MAX_INTERVAL_DAYS,
+    ):
+        self.w = weights
+        self.desired_retention = desired_retention
+        self.maximum_interval = maximum_interval
+        self._interval_factor = 9 * (1 / desired_retention - 1)
+
+    def _initial_difficulty(self, grade):
+        w = self.w
+        return min(max(w[4] - (grade - 3) * w[5], 1.0), 10.0)
+
+    def _interval(self, stability):
+        interval = round(stability * self._interval_factor)
+        return min(max(interval, 1), self.maximum_interval)
+
+    def schedule(self, states, is_correct, elapsed_days):
+        w = self.w
+        mean_difficulty = self._initial_difficulty(self.GOOD)
+        stabilities, difficulties, intervals, streaks = [], [], [], []
+        for streak, stability, difficulty, correct, elapsed in zip(
+            states.consecutive_correct,
+            states.stability,
+            states.difficulty,
+            is_correct,
+            elapsed_days,
+        ):
+            grade = self.GOOD if correct else self.AGAIN
+            if stability <= 0:
+                stability = w[grade - 1]
+                difficulty = self._initial_difficulty(grade)
+            else:
+                retrievability = (1 + max(elapsed, 0) / (9 * stability)) ** -1
+                if correct:
+                    stability *= 1 + math.exp(w[8]) * (11 - difficulty) * (
+                        stability ** -w[9]
+                    ) * (math.exp(w[10] * (1 - retrievability)) - 1)
+                else:
+                    stability = (
+                        w[11]
+                        * difficulty ** -w[12]
+                        * ((stability + 1) ** w[13] - 1)
+                        * math.exp(w[14] * (1 - retrievability))
+                    )
+                difficulty -= w[6] * (grade - 3)
+                difficulty = w[7] * mean_difficulty + (1 - w[7]) * difficulty
+                difficulty = min(max(difficulty, 1.0), 10.0)
+            stabilities.append(stability)
+            difficulties.append(difficulty)
+            intervals.append(self._interval(stability))
+            streaks.append(streak + 1 if correct else 0)
+        return ReviewStates(
+            streaks, intervals, states.ease_factor, stabilities, difficulties
+        )
+
+    def current_intervals(self, states):
+        return array(
+            'd',
+            [
+                self._interval(stability) if stability > 0 else max(interval, 1)
+                for stability, interval in zip(states.stability, states.interval)
+            ],
+        )
+
+
+SCHEDULERS = {
+    scheduler.name: scheduler
+    for scheduler in (QuadraticScheduler(), SM2Scheduler(), FSRSScheduler())
+}
+SCHEDULER_CHOICES = [(name, s.label) for name, s in SCHEDULERS.items()]
+DEFAULT_SCHEDULER = QuadraticScheduler.name
+
+
+def get_scheduler(name):
+    return SCHEDULERS.get(name) or SCHEDULERS[DEFAULT_SCHEDULER]
+
+
+def elapsed_days(cards, reviewed_at):
+    return [
+        (when - card.last_reviewed_at).total_seconds() / 86400
+        if card.last_reviewed_at
+        else 0.0
+        for card, when in zip(cards, reviewed_at)
+    ]
+
+
+def schedule_reviews(cards, is_correct, reviewed_at):
+    """
+    Applies one review to each card in memory, using each card's deck
+    scheduler. ``cards`` must have ``deck`` loaded; nothing is saved.
+    """
+    by_scheduler = {}
+    for i, card in enumerate(cards):
+        by_scheduler.setdefault(card.deck.scheduler, []).append(i)
+
+    for name, positions in by_scheduler.items():
+        group = [cards[i] for i in positions]
+        group_times = [reviewed_at[i] for i in positions]
+        new_states = get_scheduler(name).schedule(
+            ReviewStates.from_cards(group),
+            [is_correct[i] for i in positions],
+            elapsed_days(group, group_times),
+        )
+        new_states.write_to(group)
+        for card, when, interval in zip(
+            group, group_times, new_states.interval
+        ):
+            card.seen = True
+            card.last_reviewed_at = when
+            card.next_review = when + timedelta(days=interval)
+    return cards
+
+
+def reschedule_cards(cards, scheduler):
+    """
+    Recomputes ``next_review`` for already reviewed cards from their
+    stored state, e.g. after a deck switches algorithm. Returns the cards
+    that changed; nothing is saved.
+    """
+    cards = [card for card in cards if card.last_reviewed_at]
+    intervals = scheduler.current_intervals(ReviewStates.from_cards(cards))
+    changed = []
+    for card, interval in zip(cards, intervals):
+        next_review = card.last_reviewed_at + timedelta(days=interval)
+        if next_review != card.next_review:
+            card.interval = interval
+            card.next_review = next_review
+            changed.append(card)
+    return changed
@@ -1,12 +1,42 @@
-from rest_framework import serializers
-from .models import Deck, Card
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+from .deck_stats import get_deck_stats_by_id
+from .models import Deck, Card, Note
 from django.utils import timezone
+from datetime import timedelta
 
 
-class CardSerializer(serializers.ModelSerializer):
+class SparseFieldsMixin:
+    """
+    Accepts a ``fields`` argument that limits the output to the named
+    fields, e.g. from a ``?fields=id,character`` query parameter.
+    """
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is None:
+            return
+        readable = {
+            name
+            for name, field in self.fields.items()
+            if not field.write_only
+        }
+        unknown = [name for name in fields if name not in readable]
+        if unknown:
+            raise serializers.ValidationError(
+                {'fields': [f'Unknown fields: {", ".join(unknown)}.']}
+            )
+        for name in set(self.fields) - set(fields):
+            self.fields.pop(name)
+
+
+class CardSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     deck = serializers.PrimaryKeyRelatedField(
         queryset=Deck.objects.all(), write_only=True
     )
+    character = serializers.CharField(source='note.character', max_length=10)
+    pinyin = serializers.CharField(source='note.pinyin', max_length=50)
+    translation = serializers.CharField(source='note.translation')
 
     class Meta:
         model = Card
@@ -28,8 +58,27 @@ class CardSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("You don't own this deck.")
         return value
 
+    # Content lives in the shared Note table: writes point the card at the
+    # note for the new content instead of editing a note in place.
+    def _intern_note(self, validated_data, instance=None):
+        content = validated_data.pop('note', None)
+        if content is None:
+            return
+        if instance is not None:
+            for field in ('character', 'pinyin', 'translation'):
+                content.setdefault(field, getattr(instance.note, field))
+        validated_data['note'] = Note.objects.intern(**content)
+
+    def create(self, validated_data):
+        self._intern_note(validated_data)
+        return super().create(validated_data)
+
+    def update(self, instance, validated_data):
+        self._intern_note(validated_data, instance)
+        return super().update(instance, validated_data)
+
 
-class DeckSerializer(serializers.ModelSerializer):
+class DeckSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     user = serializers.HiddenField(default=serializers.CurrentUserDefault())
     total_cards = serializers.SerializerMethodField()
     due_cards = serializers.SerializerMethodField()
@@ -56,18 +105,100 @@ class DeckSerializer(serializers.ModelSerializer):
             'progress',
         ]
 
+    # Querysets built with ``Deck.objects.with_stats()`` already carry the
+    # counts; plain instances are looked up in the per-user stats cache.
+    # A deck created after the cached stats were computed is counted on
+    # its own.
+    def _stats(self, obj):
+        if hasattr(obj, 'total_cards'):
+            return {
+                'total_cards': obj.total_cards,
+                'due_cards': obj.due_cards,
+                'progress': obj.progress,
+            }
+        stats = get_deck_stats_by_id(obj.user_id).get(obj.pk)
+        if stats is None:
+            stats = Deck.objects.filter(pk=obj.pk).with_stats().values(
+                'total_cards', 'due_cards', 'progress'
+            ).get()
+            obj.total_cards = stats['total_cards']
+            obj.due_cards = stats['due_cards']
+            obj.progress = stats['progress']
+        return stats
+
     def get_total_cards(self, obj):
-        return obj.cards.count()
+        return self._stats(obj)['total_cards']
 
     def get_due_cards(self, obj):
-        return obj.cards.filter(next_review__lte=timezone.now()).count()
+        return self._stats(obj)['due_cards']
 
     def get_progress(self, obj):
-        return obj.get_progress()
+        return self._stats(obj)['progress']
+
+
+def _iso_datetime(tz):
+    # What ``serializers.DateTimeField`` returns for the ISO 8601 format,
+    # with the timezone looked up once instead of once per value.
+    def convert(value):
+        value = value.astimezone(tz).isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+
+    return convert
 
 
-class DeckDetailSerializer(DeckSerializer):
-    cards = CardSerializer(many=True, read_only=True)
+def export_cards(queryset, fields=None, chunk_size=2000):
+    """
+    Returns an iterator over the cards of ``queryset`` as dicts equal to
+    ``CardSerializer`` output, built from ``values_list()`` rows: no model
+    instances and no serializer fields per card. Meant for bulk exports.
+    Unknown ``fields`` raise ValidationError right away.
+    """
+    iso_datetime = _iso_datetime(timezone.get_current_timezone())
+    names, lookups, converters = [], [], []
+    for name, field in CardSerializer(fields=fields).fields.items():
+        if field.write_only:
+            continue
+        if isinstance(field, serializers.DateTimeField):
+            iso = api_settings.DATETIME_FORMAT == ISO_8601
+            convert = iso_datetime if iso else field.to_representation
+            converters.append((len(names), convert))
+        names.append(name)
+        lookups.append(field.source.replace('.', '__'))
 
-    class Meta(DeckSerializer.Meta):
-        fields = DeckSerializer.Meta.fields + ['cards']
+    rows = queryset.order_by('pk').values_list(*lookups)
+    return _export_rows(rows, names, converters, chunk_size)
+
+
+def _export_rows(rows, names, converters, chunk_size):
+    for row in rows.iterator(chunk_size=chunk_size):
+        if converters:
+            row = list(row)
+            for i, convert in converters:
+                if row[i] is not None:
+                    row[i] = convert(row[i])
+        yield dict(zip(names, row))
+
+
+class ReviewEntrySerializer(serializers.Serializer):
+    card_id = serializers.IntegerField()
+    is_correct = serializers.BooleanField()
+    # Required: retries are recognized by their review time, so a time
+    # filled in by the server would grade a retried answer twice.
+    reviewed_at = serializers.DateTimeField()
+
+    def validate_reviewed_at(self, value):
+        if value > timezone.now() + timedelta(minutes=5):
+            raise serializers.ValidationError(
+                'Review time cannot be in the future.'
+            )
+        return value
+
+
+class ReviewBatchSerializer(serializers.Serializer):
+    MAX_REVIEWS = 500
+
+    reviews = ReviewEntrySerializer(
+        many=True, allow_empty=False, max_length=MAX_REVIEWS
+    )
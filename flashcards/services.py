@@ -1,17 +1,39 @@
 import tempfile
 import os
+import shutil
 import sqlite3
 import zipfile
 import json
+import logging
+from collections import namedtuple
+from contextlib import contextmanager
 from django.db import transaction
-from .models import Deck, Card 
+from .due_forecast import apply_due_changes
+from .field_mapping import get_field_mapper
+from .metrics import ROW_BUCKETS, increment, observe, timed
+from .models import Deck, Card, Note
+from .signals import cards_changed
+
+logger = logging.getLogger(__name__)
 
 class AnkiImportError(Exception):
     pass
 
+SyncResult = namedtuple('SyncResult', 'created updated unchanged retired')
+
 class AnkiImporterService:
-    def __init__(self, user):
+    # Notes are streamed out of the Anki collection and written in batches so
+    # memory use does not grow with the size of the deck.
+    NOTE_FETCH_SIZE = 2000
+    CARD_BATCH_SIZE = 500
+
+    def __init__(self, user, field_mappings=None):
+        """
+        ``field_mappings`` optionally maps Anki field names to ``character``,
+        ``pinyin`` or ``translation`` on top of the built-in aliases.
+        """
         self.user = user
+        self.field_mapper = get_field_mapper(field_mappings)
         self._tmp_apkg_path = None
         self._tmp_db_path = None
 
@@ -21,97 +43,121 @@ class AnkiImporterService:
         if self._tmp_db_path and os.path.exists(self._tmp_db_path):
             os.unlink(self._tmp_db_path)
 
-    def _validate_models_and_get_specs(self, models_json_str: str) -> list:
-        models_data = json.loads(models_json_str)
+    def _validate_models_and_get_specs(self, models_data: dict) -> list:
+        """
+        Returns a ``{'model_id', 'fields'}`` spec per note type whose fields
+        map onto card content; ``fields`` holds the character, pinyin and
+        translation field indexes.
+        """
         valid_model_specs = []
-        
-        required_anki_fields = {
-            'character':   ['hanzi', 'character', 'simplified', 'zi', 'chinese', 'expression', 'front'],
-            'pinyin':      ['pinyin', 'pronunciation', 'reading'],
-            'translation': ['english', 'translation', 'meaning', 'definition', 'back'],
-        }
-
         for anki_model_id_str, anki_model_config in models_data.items():
-            model_field_names = [fld['name'].lower() for fld in anki_model_config.get('flds', [])]
-
             actual_fields = [fld['name'] for fld in anki_model_config.get('flds', [])]
-            print(f"[DEBUG] Checking model {anki_model_id_str}, fields = {actual_fields}")
-
-            current_model_field_map = {}
-            all_required_found = True
-
-            for target_field, variations in required_anki_fields.items():
-                found_variation_for_target = False
-                for anki_field_idx, anki_field_name_lower in enumerate(model_field_names):
-                    if anki_field_name_lower in variations:
-                        current_model_field_map[target_field] = anki_field_idx
-                        found_variation_for_target = True
-                        break
-                if not found_variation_for_target:
-                    all_required_found = False
-                    break
-            
-            if all_required_found:
-                try:
-                    valid_model_specs.append({
-                        'model_id': int(anki_model_id_str),
-                        'field_map': current_model_field_map
-                    })
-                except ValueError:
-                    pass 
-
-        print("[DEBUG] valid_model_specs before returning:", valid_model_specs)
+            fields = self.field_mapper.resolve(actual_fields)
+            if fields is None:
+                logger.debug('Skipping Anki model %s with fields %s', anki_model_id_str, actual_fields)
+                continue
+            try:
+                valid_model_specs.append({'model_id': int(anki_model_id_str), 'fields': fields})
+            except ValueError:
+                pass
         return valid_model_specs
 
-    def _create_card_from_note(self, note_row_data: sqlite3.Row, deck_instance: Deck, valid_model_specs_map: dict):
-        note_fields = note_row_data['flds'].split('\x1f')
-        anki_note_model_id = int(note_row_data['mid'])
-
-        model_spec = valid_model_specs_map.get(anki_note_model_id)
+    def _note_content(self, note_row_data: sqlite3.Row, valid_model_specs_map: dict):
+        """Returns ``(character, pinyin, translation)`` or None if unusable."""
+        model_spec = valid_model_specs_map.get(int(note_row_data['mid']))
         if not model_spec:
             return
 
-        field_map = model_spec['field_map']
+        note_fields = note_row_data['flds'].split('\x1f')
+        character_idx, pinyin_idx, translation_idx = model_spec['fields']
         try:
-            character_val   = note_fields[field_map['character']].strip()
-            pinyin_val      = note_fields[field_map['pinyin']].strip()
-            translation_val = note_fields[field_map['translation']].strip()
-        except (IndexError, KeyError):
+            character_val   = note_fields[character_idx].strip()
+            pinyin_val      = note_fields[pinyin_idx].strip()
+            translation_val = note_fields[translation_idx].strip()
+        except IndexError:
             return
 
         if not character_val or not pinyin_val:
             return
 
-        Card.objects.create(
-            deck=deck_instance,
-            character=character_val,
-            pinyin=pinyin_val,
-            translation=translation_val
-        )
-
-    def import_deck_from_file(self, anki_file_obj) -> Deck:
+        return character_val, pinyin_val, translation_val
+
+    def _import_notes(self, cursor: sqlite3.Cursor, deck_instance: Deck, valid_model_specs_map: dict,
+                      notes_total=None, progress_callback=None):
+        """
+        Streams note rows from ``cursor`` and bulk-inserts the resulting cards.
+        Card content is interned in the shared ``Note`` table, so content
+        that is already stored (e.g. another user imported the same deck)
+        is not written again; only the per-user card rows are inserted.
+        Each batch is committed on its own so the database write lock is
+        released between batches and progress is visible to other requests.
+        Returns a ``(notes_read, cards_created)`` tuple.
+        """
+        notes_read = 0
+        cards_created = 0
+        while True:
+            with timed('anki_import_phase', phase='read'):
+                note_rows = cursor.fetchmany(self.NOTE_FETCH_SIZE)
+            if not note_rows:
+                break
+            notes_read += len(note_rows)
+            contents, keys = [], []
+            with timed('anki_import_phase', phase='map'):
+                for note_row in note_rows:
+                    content = self._note_content(note_row, valid_model_specs_map)
+                    if content is not None:
+                        contents.append(content)
+                        keys.append((note_row['guid'], note_row['mod']))
+            observe('anki_import_batch_rows', len(contents), buckets=ROW_BUCKETS)
+            with timed('anki_import_phase', phase='write'), transaction.atomic():
+                note_ids = Note.objects.intern_many(contents, batch_size=self.CARD_BATCH_SIZE)
+                cards = Card.objects.bulk_create(
+                    [
+                        Card(deck=deck_instance, note_id=note_id, anki_guid=guid, anki_mod=mod)
+                        for note_id, (guid, mod) in zip(note_ids, keys)
+                    ],
+                    batch_size=self.CARD_BATCH_SIZE,
+                )
+                apply_due_changes(self._new_card_changes(deck_instance, cards))
+            cards_created += len(note_ids)
+            if progress_callback is not None:
+                progress_callback(notes_read, notes_total)
+        return notes_read, cards_created
+
+    @staticmethod
+    def _new_card_changes(deck, cards):
+        return [(deck.user_id, deck.pk, None, card.next_review) for card in cards]
+
+    @contextmanager
+    def _open_collection(self, anki_file_obj):
+        """
+        Extracts the collection database from ``anki_file_obj`` and checks
+        its note models. Yields ``(cursor, valid_model_specs_map)``; errors
+        inside the block are reported as ``AnkiImportError`` and the
+        temporary files are removed afterwards.
+        """
         try:
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.apkg') as tmp_apkg:
-                for chunk in anki_file_obj.chunks():
-                    tmp_apkg.write(chunk)
-                self._tmp_apkg_path = tmp_apkg.name
-
-            db_filename_in_zip = None
-            with zipfile.ZipFile(self._tmp_apkg_path, 'r') as zip_ref:
-                for name in zip_ref.namelist():
-                    base = os.path.basename(name)
-                    if base in ("collection.anki2", "collection.anki21"):
-                        db_filename_in_zip = name
-                        break
-                if not db_filename_in_zip:
-                    raise AnkiImportError("Invalid Anki package: Missing the main collection DB (collection.anki2 or .anki21).")
-                
-                print(f"[DEBUG] extracting DB from .apkg → {db_filename_in_zip}")
-                with tempfile.NamedTemporaryFile(delete=False, suffix='.sqlite') as tmp_db:
-                    tmp_db.write(zip_ref.read(db_filename_in_zip))
-                    self._tmp_db_path = tmp_db.name
-
-            print(f"[DEBUG] tmp_db_path = {self._tmp_db_path!r}")
+            with timed('anki_import_phase', phase='unzip'):
+                with tempfile.NamedTemporaryFile(delete=False, suffix='.apkg') as tmp_apkg:
+                    for chunk in anki_file_obj.chunks():
+                        tmp_apkg.write(chunk)
+                    self._tmp_apkg_path = tmp_apkg.name
+
+                db_filename_in_zip = None
+                with zipfile.ZipFile(self._tmp_apkg_path, 'r') as zip_ref:
+                    for name in zip_ref.namelist():
+                        base = os.path.basename(name)
+                        if base in ("collection.anki2", "collection.anki21"):
+                            db_filename_in_zip = name
+                            break
+                    if not db_filename_in_zip:
+                        raise AnkiImportError("Invalid Anki package: Missing the main collection DB (collection.anki2 or .anki21).")
+
+                    with zip_ref.open(db_filename_in_zip) as src, \
+                            tempfile.NamedTemporaryFile(delete=False, suffix='.sqlite') as tmp_db:
+                        self._tmp_db_path = tmp_db.name
+                        shutil.copyfileobj(src, tmp_db)
+            logger.debug('Extracted %s to %s', db_filename_in_zip, self._tmp_db_path)
 
             conn = sqlite3.connect(self._tmp_db_path)
             conn.row_factory = sqlite3.Row
@@ -119,55 +165,34 @@ class AnkiImporterService:
 
             cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
             tables = [tup[0] for tup in cursor.fetchall()]
-            print("[DEBUG] tables in extracted DB:", tables)
-            if "col" in tables:
-                cursor.execute("PRAGMA table_info(col);")
-                print("[DEBUG] col schema:", cursor.fetchall())
-            else:
+            if "col" not in tables:
                 conn.close()
                 raise AnkiImportError("After extraction, no 'col' table was found.")
 
             cursor.execute("SELECT models FROM col LIMIT 1")
             col_table_row = cursor.fetchone()
-            print("[DEBUG] fetched col row:", col_table_row)
-
             if col_table_row is None:
-                print("[DEBUG] col_table_row is None (no rows in col)")
                 conn.close()
                 raise AnkiImportError("Invalid Anki package: 'col' table is empty.")
-            else:
-                print("[DEBUG] col_table_row keys:", list(col_table_row.keys()))
-                try:
-                    raw_models = col_table_row["models"]
-                except KeyError:
-                    print("[DEBUG] 'models' not found in this row at all!")
-                    conn.close()
-                    raise AnkiImportError("Invalid Anki package: 'models' column is missing.")
+            try:
+                raw_models = col_table_row["models"]
+            except IndexError:
+                conn.close()
+                raise AnkiImportError("Invalid Anki package: 'models' column is missing.")
+            if raw_models is None:
+                conn.close()
+                raise AnkiImportError("Invalid Anki package: 'models' column is NULL.")
+            if raw_models == "":
+                conn.close()
+                raise AnkiImportError("Invalid Anki package: 'models' column is empty.")
 
-                if raw_models is None:
-                    print("[DEBUG] col_table_row['models'] is None")
-                    conn.close()
-                    raise AnkiImportError("Invalid Anki package: 'models' column is NULL.")
-                elif raw_models == "":
-                    print("[DEBUG] col_table_row['models'] is an empty string")
+            with timed('anki_import_phase', phase='models'):
+                try:
+                    full_models = json.loads(raw_models)
+                except ValueError:
                     conn.close()
-                    raise AnkiImportError("Invalid Anki package: 'models' column is empty.")
-                else:
-                    print("[DEBUG] col_table_row['models'] (first 200 chars):")
-                    print(raw_models[:200])
-
-                    try:
-                        full_models = json.loads(raw_models)
-                        print("[DEBUG] top‐level model IDs in JSON:", list(full_models.keys())[:5], "…")
-                        for mid_str, model_conf in full_models.items():
-                            actual_fields = [fld["name"] for fld in model_conf.get("flds", [])]
-                            print(f"[DEBUG]  • Model {mid_str} ⇒ fields: {actual_fields}")
-                    except Exception as e:
-                        print(f"[DEBUG] ERROR decoding JSON in 'models': {e}")
-                        conn.close()
-                        raise AnkiImportError("Invalid Anki package: 'models' is not valid JSON.")
-
-            valid_model_specs_list = self._validate_models_and_get_specs(raw_models)
+                    raise AnkiImportError("Invalid Anki package: 'models' is not valid JSON.")
+                valid_model_specs_list = self._validate_models_and_get_specs(full_models)
             if not valid_model_specs_list:
                 conn.close()
                 raise AnkiImportError(
@@ -176,44 +201,174 @@ class AnkiImporterService:
                 )
 
             valid_model_specs_map = {spec['model_id']: spec for spec in valid_model_specs_list}
-            anki_model_ids_to_query = list(valid_model_specs_map.keys())
-
-            placeholders = ','.join(['?'] * len(anki_model_ids_to_query))
-            cursor.execute(
-                f"SELECT mid, flds FROM notes WHERE mid IN ({placeholders})",
-                anki_model_ids_to_query
-            )
-            anki_notes_data = cursor.fetchall()
-            conn.close()
+            try:
+                yield cursor, valid_model_specs_map
+            finally:
+                conn.close()
 
-            if not anki_notes_data:
-                raise AnkiImportError("No notes found matching the compatible card models.")
+        except AnkiImportError:
+            raise
+        except zipfile.BadZipFile:
+            raise AnkiImportError("Invalid Anki package: The uploaded file is not a valid .apkg (zip) file.")
+        except sqlite3.Error as db_err:
+            raise AnkiImportError(f"Database error while processing Anki file: {db_err}")
+        except Exception as e:
+            raise AnkiImportError("An unexpected error occurred while processing the Anki deck.") from e
+        finally:
+            self._cleanup_temp_files()
 
+    @staticmethod
+    def _note_identity_columns(cursor: sqlite3.Cursor):
+        """
+        SQL expressions for a note's GUID and mod time. Notes without a GUID
+        column are identified by their id instead.
+        """
+        cursor.execute("PRAGMA table_info(notes)")
+        columns = {row[1] for row in cursor.fetchall()}
+        guid = 'guid' if 'guid' in columns else 'CAST(id AS TEXT)'
+        mod = 'mod' if 'mod' in columns else 'NULL'
+        return guid, mod
+
+    def _execute_notes_query(self, cursor: sqlite3.Cursor, valid_model_specs_map: dict, count=False):
+        """Selects the usable notes as ``(guid, mod, mid, flds)`` rows."""
+        guid, mod = self._note_identity_columns(cursor)
+        model_ids = list(valid_model_specs_map)
+        placeholders = ','.join(['?'] * len(model_ids))
+        selected = 'COUNT(*)' if count else f"{guid} AS guid, {mod} AS mod, mid, flds"
+        cursor.execute(f"SELECT {selected} FROM notes WHERE mid IN ({placeholders})", model_ids)
+
+    @timed('anki_import', mode='import')
+    def import_deck_from_file(self, anki_file_obj, progress_callback=None) -> Deck:
+        """
+        Imports ``anki_file_obj`` as a new deck. ``progress_callback``, if
+        given, is called as ``progress_callback(notes_read, notes_total)``
+        after every committed batch.
+        """
+        with self._open_collection(anki_file_obj) as (cursor, valid_model_specs_map):
             deck_name = os.path.splitext(os.path.basename(anki_file_obj.name))[0]
             created_deck = None
-            with transaction.atomic():
+            try:
+                notes_total = None
+                if progress_callback is not None:
+                    self._execute_notes_query(cursor, valid_model_specs_map, count=True)
+                    notes_total = cursor.fetchone()[0]
+                    progress_callback(0, notes_total)
+
+                self._execute_notes_query(cursor, valid_model_specs_map)
                 created_deck = Deck.objects.create(user=self.user, name=deck_name)
+                notes_read, cards_created = self._import_notes(
+                    cursor, created_deck, valid_model_specs_map,
+                    notes_total=notes_total, progress_callback=progress_callback,
+                )
 
-                for note_row in anki_notes_data:
-                    self._create_card_from_note(note_row, created_deck, valid_model_specs_map)
-
-                if created_deck.cards.count() == 0:
+                if notes_read == 0:
+                    raise AnkiImportError("No notes found matching the compatible card models.")
+                if cards_created == 0:
                     raise AnkiImportError(
                         f"No cards could be created for deck '{deck_name}'. "
                         "This might be due to all notes missing required fields or an issue with field mappings."
                     )
+                cards_changed.send(sender=Card, user_ids={self.user.pk}, forecast_updated=True)
+                increment('anki_import_cards_total', cards_created, mode='import')
+            except Exception:
+                # Batches are committed individually, so undo a partial import.
+                if created_deck is not None:
+                    created_deck.delete()
+                raise
 
             return created_deck
 
-        except AnkiImportError:
-            raise
-        except zipfile.BadZipFile:
-            raise AnkiImportError("Invalid Anki package: The uploaded file is not a valid .apkg (zip) file.")
-        except sqlite3.Error as db_err:
-            print(f"[DEBUG] SQLite error: {db_err}")
-            raise AnkiImportError(f"Database error while processing Anki file: {db_err}")
-        except Exception as e:
-            print(f"[DEBUG] Unexpected error during Anki import: {e}")
-            raise AnkiImportError("An unexpected error occurred while processing the Anki deck.") from e
-        finally:
-            self._cleanup_temp_files()
+    @timed('anki_import', mode='sync')
+    def sync_deck_from_file(self, anki_file_obj, deck: Deck, retire_missing=False,
+                            progress_callback=None) -> SyncResult:
+        """
+        Brings ``deck`` up to date with a newer export of the same package.
+
+        Notes are matched to cards by Anki GUID (or note id). A note whose
+        ``mod`` time is unchanged is skipped without being parsed; changed
+        notes repoint their card at the new content and new notes get new
+        cards. Scheduling state is never touched. Cards imported before
+        GUIDs were recorded are adopted when their content matches. With
+        ``retire_missing`` the cards whose note is no longer in the package
+        are deleted. Writes are batched, so their number follows the size
+        of the diff rather than the size of the deck.
+        """
+        existing = {
+            guid: (card_id, mod, note_id)
+            for guid, card_id, mod, note_id in deck.cards.exclude(anki_guid='')
+            .values_list('anki_guid', 'id', 'anki_mod', 'note_id')
+            .iterator(chunk_size=self.NOTE_FETCH_SIZE)
+        }
+        legacy = {}
+        for card_id, note_id in deck.cards.filter(anki_guid='').values_list('id', 'note_id'):
+            legacy.setdefault(note_id, []).append(card_id)
+
+        created = updated = unchanged = 0
+        seen = set()
+        with self._open_collection(anki_file_obj) as (cursor, valid_model_specs_map):
+            notes_total = None
+            if progress_callback is not None:
+                self._execute_notes_query(cursor, valid_model_specs_map, count=True)
+                notes_total = cursor.fetchone()[0]
+                progress_callback(0, notes_total)
+
+            self._execute_notes_query(cursor, valid_model_specs_map)
+            notes_read = 0
+            while True:
+                with timed('anki_import_phase', phase='read'):
+                    note_rows = cursor.fetchmany(self.NOTE_FETCH_SIZE)
+                if not note_rows:
+                    break
+                notes_read += len(note_rows)
+                pending = []
+                for note_row in note_rows:
+                    guid, mod = note_row['guid'], note_row['mod']
+                    seen.add(guid)
+                    match = existing.get(guid)
+                    if match and mod is not None and match[1] == mod:
+                        unchanged += 1
+                        continue
+                    content = self._note_content(note_row, valid_model_specs_map)
+                    if content is not None:
+                        pending.append((guid, mod, content, match))
+
+                # Interned notes commit with the cards pointing at them, so
+                # a failed batch leaves no orphaned notes behind.
+                with timed('anki_import_phase', phase='write'), transaction.atomic():
+                    note_ids = Note.objects.intern_many(
+                        [content for _, _, content, _ in pending], batch_size=self.CARD_BATCH_SIZE
+                    )
+                    new_cards, changed_cards = [], []
+                    for (guid, mod, _, match), note_id in zip(pending, note_ids):
+                        if match:
+                            card_id, old_mod, old_note_id = match
+                            if note_id == old_note_id and mod == old_mod:
+                                unchanged += 1
+                                continue
+                            changed_cards.append(Card(pk=card_id, note_id=note_id, anki_guid=guid, anki_mod=mod))
+                        elif legacy.get(note_id):
+                            card_id = legacy[note_id].pop()
+                            changed_cards.append(Card(pk=card_id, note_id=note_id, anki_guid=guid, anki_mod=mod))
+                        else:
+                            new_cards.append(Card(deck=deck, note_id=note_id, anki_guid=guid, anki_mod=mod))
+                    Card.objects.bulk_create(new_cards, batch_size=self.CARD_BATCH_SIZE)
+                    apply_due_changes(self._new_card_changes(deck, new_cards))
+                    Card.objects.bulk_update(
+                        changed_cards, fields=['note', 'anki_guid', 'anki_mod'], batch_size=self.CARD_BATCH_SIZE
+                    )
+                created += len(new_cards)
+                updated += len(changed_cards)
+                if progress_callback is not None:
+                    progress_callback(notes_read, notes_total)
+
+        retired = 0
+        if retire_missing:
+            missing = [card_id for guid, (card_id, _, _) in existing.items() if guid not in seen]
+            for i in range(0, len(missing), self.CARD_BATCH_SIZE):
+                retired += Card.objects.filter(pk__in=missing[i:i + self.CARD_BATCH_SIZE]).delete()[1].get(Card._meta.label, 0)
+
+        if created or updated or retired:
+            # Retired cards are dropped from the forecast by a rebuild.
+            cards_changed.send(sender=Card, user_ids={deck.user_id}, forecast_updated=not retired)
+        increment('anki_import_cards_total', created, mode='sync')
+        return SyncResult(created, updated, unchanged, retired)
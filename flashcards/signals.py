@@ -0,0 +1,79 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from .deck_stats import invalidate_deck_stats
+from .due_forecast import apply_due_changes, rebuild_due_forecast
+from .models import Card, Deck, DueForecast
+
+# Sent by code paths that change cards in bulk (bulk_create, bulk_update,
+# queryset.update), which bypass the model signals.
+# Arguments: user_ids, and forecast_updated (default False): True when the
+# sender already applied its changes to the due forecast.
+cards_changed = Signal()
+
+
+@receiver(cards_changed)
+def _invalidate_after_bulk_change(
+    sender, user_ids, forecast_updated=False, **kwargs
+):
+    invalidate_deck_stats(*user_ids)
+    if not forecast_updated:
+        rebuild_due_forecast(*user_ids)
+
+
+# Deliberately no post_delete receiver for Card: it would stop Django from
+# fast-deleting a deck's cards on cascade. Deck deletion covers that case.
+@receiver(post_save, sender=Card)
+def _invalidate_after_card_change(
+    sender, instance, created, update_fields, **kwargs
+):
+    user_id = (
+        Deck.objects.filter(pk=instance.deck_id)
+        .values_list('user_id', flat=True)
+        .first()
+        if 'deck' not in instance._state.fields_cache
+        else instance.deck.user_id
+    )
+    if user_id is not None:
+        invalidate_deck_stats(user_id)
+        _move_card_in_forecast(instance, user_id, created, update_fields)
+
+
+_FORECAST_FIELDS = {'deck', 'deck_id', 'next_review', 'suspended'}
+
+
+def _move_card_in_forecast(card, user_id, created, update_fields):
+    if update_fields is not None and not _FORECAST_FIELDS & update_fields:
+        return
+    if created:
+        old = (None, None)
+    else:
+        old = getattr(card, '_saved_forecast_state', None)
+    new = card._saved_forecast_state = card.forecast_state()
+    if old is None:
+        # Saved without having been loaded: the stored state is unknown.
+        rebuild_due_forecast(user_id)
+    elif old != new:
+        with transaction.atomic():
+            apply_due_changes(
+                [
+                    (user_id, old[0], old[1], None),
+                    (user_id, new[0], None, new[1]),
+                ]
+            )
+
+
+@receiver([post_save, post_delete], sender=Deck)
+def _invalidate_after_deck_change(sender, instance, **kwargs):
+    invalidate_deck_stats(instance.user_id)
+
+
+@receiver(post_save, sender=Deck)
+def _move_forecast_with_deck(sender, instance, created, **kwargs):
+    # The forecast rows copy the deck's owner, who can be changed in the
+    # admin.
+    if not created:
+        DueForecast.objects.filter(deck=instance).exclude(
+            user_id=instance.user_id
+        ).update(user_id=instance.user_id)
@@ -0,0 +1,113 @@
+"""
+The cross-deck "study everything due" queue.
+
+Every deck contributes two streams, each read with an indexed LIMIT: its
+due reviews and its new cards, both in ``(next_review, id)`` order. The
+review streams are k-way merged by due date, so the most overdue cards
+come first whatever their deck, and the new-card streams likewise. New
+cards are then spread evenly among the reviews.
+
+Decks are taken from the cached deck stats, and only decks with due or
+unseen cards are read. The cost therefore grows with the number of such
+decks and with the session size, not with the number of cards.
+"""
+import heapq
+from datetime import datetime, time
+from itertools import islice
+
+from django.conf import settings
+from django.utils import timezone
+
+from .deck_stats import get_deck_stats
+from .models import Card, ReviewLog
+
+MAX_NEW_PER_DECK = 10
+MAX_REVIEWS_PER_DECK = 20
+
+
+def _due_order(card):
+    return card.next_review, card.pk
+
+
+def reviews_today(user, now=None):
+    """Number of answers ``user`` gave since local midnight."""
+    if now is None:
+        now = timezone.now()
+    midnight = timezone.make_aware(
+        datetime.combine(timezone.localdate(now), time.min)
+    )
+    return ReviewLog.objects.filter(
+        user=user, reviewed_at__gte=midnight
+    ).count()
+
+
+def spread(reviews, new_cards):
+    """Interleaves ``new_cards`` evenly among ``reviews``."""
+    queue = []
+    start = 0
+    for i, card in enumerate(new_cards, 1):
+        end = i * len(reviews) // (len(new_cards) + 1)
+        queue += reviews[start:end]
+        queue.append(card)
+        start = end
+    return queue + reviews[start:]
+
+
+def global_queue(
+    user,
+    max_new_per_deck=MAX_NEW_PER_DECK,
+    max_reviews_per_deck=MAX_REVIEWS_PER_DECK,
+    daily_limit=None,
+    now=None,
+):
+    """
+    Returns the cards of a study session over all of ``user``'s decks.
+
+    Each deck gives at most ``max_reviews_per_deck`` due reviews and
+    ``max_new_per_deck`` new cards. The session is also cut to what is
+    left of ``daily_limit`` (``STUDY_DAILY_LIMIT`` by default; None for
+    no limit) after today's answers, keeping reviews before new cards.
+    """
+    if now is None:
+        now = timezone.now()
+    if daily_limit is None:
+        daily_limit = getattr(settings, 'STUDY_DAILY_LIMIT', None)
+    remaining = None
+    if daily_limit is not None:
+        remaining = max(0, daily_limit - reviews_today(user, now))
+        if not remaining:
+            return []
+        max_new_per_deck = min(max_new_per_deck, remaining)
+        max_reviews_per_deck = min(max_reviews_per_deck, remaining)
+
+    review_streams, new_streams = [], []
+    for deck in get_deck_stats(user.id, now):
+        cards = (
+            Card.objects.filter(deck_id=deck['id'], suspended=False)
+            .select_related('note')
+            .order_by('next_review', 'id')
+        )
+        # ``seen__in`` rather than ``seen=``: Django writes the latter as a
+        # bare boolean column, which SQLite cannot match against the
+        # (deck, seen, next_review) index, so it would scan past the
+        # other kind of card.
+        if deck['due_cards'] and max_reviews_per_deck:
+            review_streams.append(
+                cards.filter(seen__in=[True], next_review__lte=now)[
+                    :max_reviews_per_deck
+                ]
+            )
+        if deck['reviewed_cards'] < deck['total_cards'] and max_new_per_deck:
+            new_streams.append(
+                cards.filter(seen__in=[False])[:max_new_per_deck]
+            )
+
+    reviews = list(
+        islice(heapq.merge(*review_streams, key=_due_order), remaining)
+    )
+    if remaining is not None:
+        remaining -= len(reviews)
+    new_cards = list(
+        islice(heapq.merge(*new_streams, key=_due_order), remaining)
+    )
+    return spread(reviews, new_cards)
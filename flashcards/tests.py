@@ -1,3 +1,1483 @@
-from django.test import TestCase
+import io
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import zipfile
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.core.signals import request_started
+from django.db import connection
+from django.db.models import Count
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .apps import _serving, _start_background_work
+from .deck_stats import get_deck_stats, get_versioned_deck_stats
+from .due_forecast import (
+    forecast_day,
+    get_due_forecast,
+    rebuild_due_forecast,
+    today,
+)
+from .field_mapping import FieldMapper, get_field_mapper
+from . import metrics, parallel_import
+from .jobs import (
+    _claim,
+    _worker,
+    create_import_batch,
+    create_import_job,
+    recover_import_jobs,
+    run_import_batch,
+    run_import_job,
+)
+from .models import Card, Deck, DueForecast, ImportJob, Note, ReviewLog
+from .reviews import apply_review_batch, flush_review_log, record_review
+from .scheduling import SCHEDULERS, ReviewStates, Scheduler, get_scheduler
+from .serializers import CardSerializer, DeckSerializer, export_cards
+from .services import AnkiImporterService, AnkiImportError
+from .study_queue import global_queue, spread
+
+ANKI_MODEL_ID = 1342697561419
+
+
+def make_apkg(notes, name='hsk1.apkg', identities=None, decks=None):
+    """
+    Builds an in-memory ``.apkg`` upload. ``notes`` is a list of
+    ``(hanzi, pinyin, english)`` tuples; ``identities``, if given, holds
+    the matching ``(guid, mod)`` pairs and ``decks`` the name of the Anki
+    deck holding each note's card.
+    """
+    models = {
+        str(ANKI_MODEL_ID): {
+            'flds': [{'name': 'Hanzi'}, {'name': 'Pinyin'}, {'name': 'English'}]
+        }
+    }
+    fd, db_path = tempfile.mkstemp(suffix='.anki2')
+    os.close(fd)
+    try:
+        conn = sqlite3.connect(db_path)
+        conn.execute('CREATE TABLE col (id integer primary key, models text)')
+        conn.execute('INSERT INTO col VALUES (1, ?)', (json.dumps(models),))
+        if identities is None:
+            conn.execute(
+                'CREATE TABLE notes '
+                '(id integer primary key, mid integer, flds text)'
+            )
+            conn.executemany(
+                'INSERT INTO notes (mid, flds) VALUES (?, ?)',
+                [(ANKI_MODEL_ID, '\x1f'.join(note)) for note in notes],
+            )
+        else:
+            conn.execute(
+                'CREATE TABLE notes (id integer primary key, guid text, '
+                'mod integer, mid integer, flds text)'
+            )
+            conn.executemany(
+                'INSERT INTO notes (guid, mod, mid, flds) VALUES (?, ?, ?, ?)',
+                [
+                    (guid, mod, ANKI_MODEL_ID, '\x1f'.join(note))
+                    for note, (guid, mod) in zip(notes, identities)
+                ],
+            )
+        if decks is not None:
+            deck_ids = {deck: i for i, deck in enumerate(dict.fromkeys(decks))}
+            conn.execute('ALTER TABLE col ADD COLUMN decks text')
+            conn.execute(
+                'UPDATE col SET decks = ?',
+                (
+                    json.dumps(
+                        {i: {'name': deck} for deck, i in deck_ids.items()}
+                    ),
+                ),
+            )
+            conn.execute(
+                'CREATE TABLE cards '
+                '(id integer primary key, nid integer, did integer)'
+            )
+            conn.executemany(
+                'INSERT INTO cards (nid, did) VALUES (?, ?)',
+                [(i + 1, deck_ids[deck]) for i, deck in enumerate(decks)],
+            )
+        conn.commit()
+        conn.close()
+        with tempfile.SpooledTemporaryFile() as buffer:
+            with zipfile.ZipFile(buffer, 'w') as package:
+                package.write(db_path, 'collection.anki2')
+            buffer.seek(0)
+            content = buffer.read()
+    finally:
+        os.unlink(db_path)
+    return SimpleUploadedFile(name, content)
+
+
+class DeckWithStatsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('learner', password='pw')
+        self.now = timezone.now()
+
+    def _make_deck(self, due=0, future=0, seen=0, name='Deck'):
+        deck = Deck.objects.create(user=self.user, name=name)
+        for i in range(due):
+            Card.objects.create(
+                deck=deck,
+                note=Note.objects.intern('字', 'zì', 'character'),
+                next_review=self.now - timedelta(hours=1),
+                seen=i < seen,
+            )
+        for _ in range(future):
+            Card.objects.create(
+                deck=deck,
+                note=Note.objects.intern('字', 'zì', 'character'),
+                next_review=self.now + timedelta(days=3),
+                seen=True,
+            )
+        return deck
+
+    def test_annotates_counts_and_progress(self):
+        deck = self._make_deck(due=3, future=1, seen=1)
+        annotated = Deck.objects.with_stats(self.now).get(pk=deck.pk)
+
+        self.assertEqual(annotated.total_cards, 4)
+        self.assertEqual(annotated.due_cards, 3)
+        self.assertEqual(annotated.reviewed_cards, 2)
+        self.assertEqual(annotated.progress, deck.get_progress())
+        self.assertEqual(annotated.due_cards, deck.due_cards_count)
+
+    def test_empty_deck_has_zero_progress(self):
+        deck = self._make_deck()
+        annotated = Deck.objects.with_stats(self.now).get(pk=deck.pk)
+
+        self.assertEqual(annotated.total_cards, 0)
+        self.assertEqual(annotated.progress, 0)
+
+    def test_single_query_regardless_of_deck_count(self):
+        for i in range(5):
+            self._make_deck(due=2, future=1, name=f'Deck {i}')
+
+        with self.assertNumQueries(1):
+            decks = list(
+                Deck.objects.filter(user=self.user).with_stats(self.now)
+            )
+        self.assertEqual(len(decks), 5)
+
+
+class AnkiImporterServiceTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('learner', password='pw')
+
+    def test_imports_notes_in_batches(self):
+        notes = [(f'字{i}', f'zì{i}', f'character {i}') for i in range(25)]
+        importer = AnkiImporterService(self.user)
+        importer.NOTE_FETCH_SIZE = 10
+        importer.CARD_BATCH_SIZE = 4
+
+        deck = importer.import_deck_from_file(make_apkg(notes))
+
+        self.assertEqual(deck.name, 'hsk1')
+        self.assertEqual(deck.cards.count(), 25)
+        self.assertTrue(
+            deck.cards.filter(
+                note__character='字7', note__pinyin='zì7'
+            ).exists()
+        )
+
+    def test_repeat_imports_share_note_content(self):
+        notes = [(f'字{i}', f'zì{i}', f'character {i}') for i in range(5)]
+        other = User.objects.create_user('other', password='pw')
+        AnkiImporterService(self.user).import_deck_from_file(make_apkg(notes))
+
+        with CaptureQueriesContext(connection) as ctx:
+            deck = AnkiImporterService(other).import_deck_from_file(
+                make_apkg(notes)
+            )
+
+        self.assertFalse(
+            [
+                query
+                for query in ctx.captured_queries
+                if query['sql'].startswith('INSERT INTO "flashcards_note"')
+            ]
+        )
+        self.assertEqual(Note.objects.count(), 5)
+        self.assertEqual(Card.objects.count(), 10)
+        self.assertEqual(
+            sorted(card.character for card in deck.cards.all()),
+            [note[0] for note in notes],
+        )
+
+    def test_skips_notes_missing_required_fields(self):
+        notes = [('字', 'zì', 'character'), ('', 'kōng', 'empty')]
+
+        deck = AnkiImporterService(self.user).import_deck_from_file(
+            make_apkg(notes)
+        )
+
+        self.assertEqual(deck.cards.count(), 1)
+
+    def test_no_usable_notes_rolls_back_deck(self):
+        with self.assertRaises(AnkiImportError):
+            AnkiImporterService(self.user).import_deck_from_file(
+                make_apkg([('', 'kōng', 'empty')])
+            )
+        self.assertFalse(Deck.objects.exists())
+
+    def test_rejects_non_zip_upload(self):
+        upload = SimpleUploadedFile('broken.apkg', b'not a zip')
+        with self.assertRaises(AnkiImportError):
+            AnkiImporterService(self.user).import_deck_from_file(upload)
+
+
+class FieldMapperTests(TestCase):
+    def test_aliases_resolve_to_field_indexes(self):
+        mapper = FieldMapper()
+        self.assertEqual(
+            mapper.resolve(['Audio', 'English', 'Pinyin', 'Hanzi']), (3, 2, 1)
+        )
+        self.assertIsNone(mapper.resolve(['Front', 'Back']))
+
+    def test_near_misses_are_matched_fuzzily(self):
+        fields = ['Hanzi_', 'Pinyn', 'Meanings']
+        self.assertEqual(FieldMapper().resolve(fields), (0, 1, 2))
+        self.assertIsNone(FieldMapper(fuzzy_cutoff=None).resolve(fields))
+
+    def test_user_mappings_take_precedence(self):
+        mappings = {'Front': 'translation', 'Word': 'character'}
+        mapper = get_field_mapper(mappings)
+        self.assertEqual(
+            mapper.resolve(['Word', 'Pinyin', 'Front']), (0, 1, 2)
+        )
+        self.assertIs(mapper, get_field_mapper(dict(mappings)))
+        with override_settings(ANKI_FIELD_ALIASES={'translation': ['gloss']}):
+            self.assertEqual(
+                get_field_mapper().resolve(['Hanzi', 'Pinyin', 'Gloss']),
+                (0, 1, 2),
+            )
+
+    def test_resolution_is_cached_by_schema(self):
+        mapper = FieldMapper()
+        with mock.patch.object(
+            mapper, '_resolve', wraps=mapper._resolve
+        ) as resolve:
+            mapper.resolve(['Hanzi', 'Pinyin', 'English'])
+            mapper.resolve(['Hanzi', 'Pinyin', 'English'])
+            mapper.resolve(['Hanzi', 'Pinyin', 'Meaning'])
+        self.assertEqual(resolve.call_count, 2)
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+
+    def test_timed_records_histogram_and_errors(self):
+        @metrics.timed('job', kind='demo')
+        def fail():
+            raise ValueError
+
+        with metrics.timed('job', kind='demo'):
+            pass
+        with self.assertRaises(ValueError):
+            fail()
+        metrics.increment('rows_total', 5)
+
+        text = metrics.render()
+        self.assertIn('# TYPE job_seconds histogram', text)
+        self.assertIn('job_seconds_bucket{kind="demo",le="+Inf"} 2', text)
+        self.assertIn('job_seconds_count{kind="demo"} 2', text)
+        self.assertIn('job_errors_total{kind="demo"} 1', text)
+        self.assertIn('rows_total 5', text)
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_disabled_metrics_record_nothing(self):
+        with metrics.timed('job') as timer:
+            pass
+        metrics.increment('rows_total')
+        self.assertIsNone(timer.elapsed)
+        self.assertEqual(metrics.render(), '\n')
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+
+    def test_import_phases_are_exported(self):
+        user = User.objects.create_user('learner', password='pw')
+        AnkiImporterService(user).import_deck_from_file(
+            make_apkg([('字', 'zì', 'character')])
+        )
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+
+        user.is_staff = True
+        user.save()
+        self.client.force_login(user)
+        response = self.client.get(reverse('metrics'))
+        for phase in ('unzip', 'models', 'read', 'map', 'write'):
+            self.assertContains(
+                response, f'anki_import_phase_seconds_count{{phase="{phase}"}}'
+            )
+        self.assertContains(
+            response, 'anki_import_cards_total{mode="import"} 1'
+        )
+
+    @override_settings(METRICS_TOKEN='s3cret')
+    def test_token_authorizes_scrapes(self):
+        url = reverse('metrics')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        response = self.client.get(url, HTTP_AUTHORIZATION='Bearer s3cret')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+
+
+class NoteTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user('learner', password='pw')
+        self.deck = Deck.objects.create(user=user, name='HSK 1')
+
+    def test_intern_many_only_inserts_new_content(self):
+        existing = Note.objects.intern('字', 'zì', 'character')
+
+        with self.assertNumQueries(3):
+            ids = Note.objects.intern_many(
+                [('新', 'xīn', 'new'), ('字', 'zì', 'character')]
+            )
+
+        self.assertEqual(ids[1], existing.pk)
+        self.assertEqual(Note.objects.count(), 2)
+
+    def test_changing_content_does_not_touch_other_cards(self):
+        note = Note.objects.intern('字', 'zì', 'character')
+        card = Card.objects.create(deck=self.deck, note=note)
+        other = Card.objects.create(deck=self.deck, note=note)
+
+        card.set_content('字', 'zì', 'written character')
+        card.save()
+
+        other.refresh_from_db()
+        self.assertEqual(other.translation, 'character')
+        self.assertEqual(card.translation, 'written character')
+        self.assertEqual(Note.objects.count(), 2)
+
+    def test_unreferenced_notes(self):
+        kept = Note.objects.intern('字', 'zì', 'character')
+        Card.objects.create(deck=self.deck, note=kept)
+        orphan = Note.objects.intern('未', 'wèi', 'not yet')
+
+        self.assertEqual(list(Note.objects.unreferenced()), [orphan])
+
+
+class AnkiSyncTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('learner', password='pw')
+        self.notes = {
+            'g1': ('一', 'yī', 'one'),
+            'g2': ('二', 'èr', 'two'),
+            'g3': ('三', 'sān', 'three'),
+        }
+        self.deck = AnkiImporterService(self.user).import_deck_from_file(
+            self._package({guid: 1 for guid in self.notes})
+        )
+
+    def _package(self, mods):
+        guids = list(mods)
+        return make_apkg(
+            [self.notes[guid] for guid in guids],
+            identities=[(guid, mods[guid]) for guid in guids],
+        )
+
+    def _sync(self, mods, retire_missing=False):
+        return AnkiImporterService(self.user).sync_deck_from_file(
+            self._package(mods), self.deck, retire_missing=retire_missing
+        )
+
+    def _card(self, guid):
+        return self.deck.cards.select_related('note').get(anki_guid=guid)
+
+    def test_applies_only_the_diff_and_keeps_scheduling(self):
+        reviewed = self._card('g2')
+        reviewed.consecutive_correct = 3
+        reviewed.save()
+        self.notes['g2'] = ('二', 'èr', 'two (number)')
+        self.notes['g4'] = ('四', 'sì', 'four')
+
+        result = self._sync({'g1': 1, 'g2': 2, 'g4': 1})
+
+        self.assertEqual(result, (1, 1, 1, 0))
+        card = self._card('g2')
+        self.assertEqual(card.translation, 'two (number)')
+        self.assertEqual(card.consecutive_correct, 3)
+        self.assertEqual(self.deck.cards.count(), 4)
+
+    def test_retires_notes_missing_from_the_package(self):
+        result = self._sync({'g1': 1, 'g2': 1}, retire_missing=True)
+
+        self.assertEqual(result.retired, 1)
+        self.assertFalse(self.deck.cards.filter(anki_guid='g3').exists())
+
+    def test_unchanged_package_writes_nothing(self):
+        with CaptureQueriesContext(connection) as ctx:
+            result = self._sync({guid: 1 for guid in self.notes})
+
+        self.assertEqual(result, (0, 0, 3, 0))
+        self.assertFalse(
+            [
+                query
+                for query in ctx.captured_queries
+                if query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))
+            ]
+        )
+
+    def test_adopts_cards_imported_without_guid(self):
+        legacy = Card.objects.create(
+            deck=self.deck, note=Note.objects.intern('五', 'wǔ', 'five')
+        )
+        self.notes['g5'] = ('五', 'wǔ', 'five')
+
+        result = self._sync({guid: 1 for guid in self.notes})
+
+        self.assertEqual(result.created, 0)
+        legacy.refresh_from_db()
+        self.assertEqual(legacy.anki_guid, 'g5')
+
+
+@override_settings(IMPORT_PARSE_WORKERS=0)
+class ImportJobTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('learner', password='pw')
+
+    def test_job_is_dispatched_on_commit_and_completes(self):
+        notes = [(f'字{i}', f'zì{i}', f'character {i}') for i in range(5)]
+        with self.captureOnCommitCallbacks() as callbacks:
+            job = create_import_job(self.user, make_apkg(notes))
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(job.status, ImportJob.PENDING)
+
+        run_import_job(job.pk)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.SUCCEEDED)
+        self.assertEqual(job.progress, 100)
+        self.assertEqual(job.notes_processed, 5)
+        self.assertEqual(job.deck.cards.count(), 5)
+        self.assertFalse(job.file_path)
+        self.assertEqual(job.partial_deck_ids, [])
+
+    def test_sync_job_updates_the_existing_deck(self):
+        deck = Deck.objects.create(user=self.user, name='HSK 1')
+        with self.captureOnCommitCallbacks():
+            job = create_import_job(
+                self.user, make_apkg([('字', 'zì', 'c')]), sync_deck=deck
+            )
+
+        run_import_job(job.pk)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.SUCCEEDED)
+        self.assertEqual(job.deck, deck)
+        self.assertEqual(deck.cards.count(), 1)
+        self.assertEqual(Deck.objects.count(), 1)
+
+    def test_failed_import_records_error(self):
+        with self.captureOnCommitCallbacks():
+            job = create_import_job(
+                self.user, SimpleUploadedFile('broken.apkg', b'not a zip')
+            )
+
+        run_import_job(job.pk)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.FAILED)
+        self.assertIn('not a valid .apkg', job.error)
+        self.assertFalse(Deck.objects.exists())
+
+    def test_batch_imports_every_file(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            jobs = create_import_batch(
+                self.user,
+                [
+                    make_apkg([('一', 'yī', 'one')], name='first.apkg'),
+                    SimpleUploadedFile('broken.apkg', b'not a zip'),
+                    make_apkg([('二', 'èr', 'two')], name='second.apkg'),
+                ],
+            )
+        self.assertEqual(len(callbacks), 1)
+
+        run_import_batch([job.pk for job in jobs])
+
+        first, broken, second = ImportJob.objects.order_by('pk')
+        self.assertEqual(first.status, ImportJob.SUCCEEDED)
+        self.assertEqual(first.deck.name, 'first')
+        self.assertEqual(broken.status, ImportJob.FAILED)
+        self.assertEqual(second.deck.cards.get().character, '二')
+        self.assertFalse(any(job.file_path for job in (first, second)))
+
+    def test_multi_deck_collection_is_split(self):
+        notes = [(f'字{i}', f'zì{i}', f'character {i}') for i in range(4)]
+        with self.captureOnCommitCallbacks():
+            job = create_import_job(
+                self.user,
+                make_apkg(notes, decks=['HSK 1', 'HSK 2', 'HSK 1', 'HSK 1']),
+            )
+
+        run_import_job(job.pk)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.SUCCEEDED)
+        self.assertEqual(job.decks_created, 2)
+        counts = dict(
+            Deck.objects.annotate(n=Count('cards')).values_list('name', 'n')
+        )
+        self.assertEqual(counts, {'HSK 1': 3, 'HSK 2': 1})
+
+    def test_a_job_is_claimed_once(self):
+        with self.captureOnCommitCallbacks():
+            job = create_import_job(self.user, make_apkg([('字', 'zì', 'c')]))
+
+        self.assertEqual(_claim([job.pk, job.pk]), [job.pk])
+        run_import_job(job.pk)
+
+        self.assertFalse(Deck.objects.exists())
+        os.unlink(job.file_path)
+
+    def test_abandoned_jobs_are_recovered(self):
+        with self.captureOnCommitCallbacks():
+            running, pending, live = [
+                create_import_job(self.user, make_apkg([('字', 'zì', 'c')]))
+                for _ in range(3)
+            ]
+        partial = Deck.objects.create(user=self.user, name='hsk1')
+        ImportJob.objects.filter(pk__in=[running.pk, live.pk]).update(
+            status=ImportJob.RUNNING, partial_deck_ids=[partial.pk]
+        )
+        ImportJob.objects.exclude(pk=live.pk).update(
+            updated_at=timezone.now() - timedelta(hours=1)
+        )
+
+        with mock.patch('flashcards.jobs._get_executor') as executor:
+            recover_import_jobs()
+
+        executor.return_value.submit.assert_called_once_with(
+            _worker, [pending.pk]
+        )
+        running.refresh_from_db()
+        self.assertEqual(running.status, ImportJob.FAILED)
+        self.assertIn('interrupted', running.error)
+        self.assertFalse(running.file_path)
+        self.assertFalse(Deck.objects.filter(pk=partial.pk).exists())
+        live.refresh_from_db()
+        self.assertEqual(live.status, ImportJob.RUNNING)
+        self.assertTrue(os.path.exists(live.file_path))
+        for job in (pending, live):
+            os.unlink(ImportJob.objects.get(pk=job.pk).file_path)
+
+
+    @override_settings(IMPORT_PARSE_WORKERS=2)
+    def test_broken_parse_pool_is_replaced(self):
+        with self.captureOnCommitCallbacks():
+            job = create_import_job(self.user, make_apkg([('字', 'zì', 'c')]))
+        broken = mock.Mock()
+        broken.submit.side_effect = BrokenProcessPool('worker died')
+
+        with mock.patch.object(parallel_import, '_pool', broken):
+            run_import_job(job.pk)
+            self.assertIsNone(parallel_import._pool)
+
+        broken.shutdown.assert_called_once_with(
+            wait=False, cancel_futures=True
+        )
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.FAILED)
+        self.assertFalse(job.file_path)
+
+class ReviewBatchViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('learner', password='pw')
+        self.client.force_login(self.user)
+        self.deck = Deck.objects.create(user=self.user, name='HSK 1')
+        self.cards = [
+            Card.objects.create(
+                deck=self.deck, note=Note.objects.intern('字', 'zì', 'c')
+            )
+            for _ in range(3)
+        ]
+        self.reviewed_at = timezone.now() - timedelta(hours=2)
+
+    def _post(self, reviews):
+        return self.client.post(
+            reverse('review-batch'),
+            {'reviews': reviews},
+            content_type='application/json',
+        )
+
+    def _entry(self, card, is_correct, minutes=0):
+        reviewed_at = self.reviewed_at + timedelta(minutes=minutes)
+        return {
+            'card_id': card.pk,
+            'is_correct': is_correct,
+            'reviewed_at': reviewed_at.isoformat(),
+        }
+
+    def test_applies_all_reviews_with_constant_queries(self):
+        reviews = [self._entry(card, True) for card in self.cards]
+        # Session, user, savepoint, ownership SELECT, pending-log check,
+        # bulk UPDATE, forecast SELECT, DELETE of emptied days and upsert,
+        # review-log INSERT, release.
+        with self.assertNumQueries(11):
+            response = self._post(reviews)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['applied'], 3)
+        for card in self.cards:
+            card.refresh_from_db()
+            self.assertTrue(card.seen)
+            self.assertEqual(card.consecutive_correct, 1)
+            self.assertEqual(
+                card.next_review, self.reviewed_at + timedelta(days=1)
+            )
+
+    def test_reviews_of_one_card_are_applied_in_order(self):
+        card = self.cards[0]
+        response = self._post(
+            [
+                self._entry(card, True, minutes=2),
+                self._entry(card, True, minutes=1),
+            ]
+        )
+
+        self.assertEqual(response.json()['applied'], 1)
+        card.refresh_from_db()
+        self.assertEqual(card.consecutive_correct, 2)
+
+    def test_retry_is_idempotent(self):
+        reviews = [self._entry(card, True) for card in self.cards]
+        self._post(reviews)
+
+        response = self._post(reviews)
+
+        self.assertEqual(response.json()['applied'], 0)
+        self.assertEqual(response.json()['skipped'], 3)
+        self.cards[0].refresh_from_db()
+        self.assertEqual(self.cards[0].consecutive_correct, 1)
+
+    def test_retry_without_review_times_is_rejected(self):
+        reviews = [
+            {'card_id': card.pk, 'is_correct': True} for card in self.cards
+        ]
+
+        for _ in range(2):
+            response = self._post(reviews)
+            self.assertEqual(response.status_code, 400)
+        self.assertIn('reviewed_at', response.json()['reviews'][0])
+        self.cards[0].refresh_from_db()
+        self.assertEqual(self.cards[0].consecutive_correct, 0)
+
+    def test_foreign_cards_are_reported_missing(self):
+        other = User.objects.create_user('other', password='pw')
+        foreign_deck = Deck.objects.create(user=other, name='Theirs')
+        foreign = Card.objects.create(
+            deck=foreign_deck, note=Note.objects.intern('字', 'zì', 'c')
+        )
+
+        response = self._post([self._entry(foreign, True)])
+
+        self.assertEqual(response.json()['missing'], [foreign.pk])
+        foreign.refresh_from_db()
+        self.assertFalse(foreign.seen)
+
+    def test_rejects_empty_batch(self):
+        response = self._post([])
+
+        self.assertEqual(response.status_code, 400)
+
+
+class SchedulerTests(TestCase):
+    def _states(self, count=1, **overrides):
+        columns = {
+            'consecutive_correct': [0] * count,
+            'interval': [0.0] * count,
+            'ease_factor': [2.5] * count,
+            'stability': [0.0] * count,
+            'difficulty': [0.0] * count,
+        }
+        columns.update(overrides)
+        return ReviewStates(**columns)
+
+    def _run(self, name, grades):
+        scheduler = get_scheduler(name)
+        states = self._states()
+        intervals = []
+        for correct in grades:
+            states = scheduler.schedule(states, [correct], [states.interval[0]])
+            intervals.append(states.interval[0])
+        return intervals
+
+    def test_incomplete_scheduler_cannot_be_instantiated(self):
+        class Incomplete(Scheduler):
+            def schedule(self, states, is_correct, elapsed_days):
+                return states
+
+        with self.assertRaises(TypeError):
+            Incomplete()
+
+    def test_quadratic_matches_legacy_rule(self):
+        self.assertEqual(
+            self._run('quadratic', [True] * 9 + [False]),
+            [1, 4, 9, 16, 25, 36, 49, 60, 60, 1],
+        )
+
+    def test_sm2_progression(self):
+        self.assertEqual(self._run('sm2', [True, True, True]), [1, 6, 15])
+        self.assertEqual(self._run('sm2', [True, True, False]), [1, 6, 1])
+
+    def test_fsrs_grows_on_success_and_shrinks_on_lapse(self):
+        intervals = self._run('fsrs', [True, True, True, False])
+        self.assertLess(intervals[0], intervals[1])
+        self.assertLess(intervals[1], intervals[2])
+        self.assertLess(intervals[3], intervals[2])
+
+    def test_schedulers_work_on_whole_batches(self):
+        for scheduler in SCHEDULERS.values():
+            states = self._states(
+                count=3,
+                consecutive_correct=[0, 2, 5],
+                interval=[0, 4, 25],
+                stability=[0, 3, 20],
+                difficulty=[0, 5, 4],
+            )
+            result = scheduler.schedule(
+                states, [True, False, True], [0, 4, 25]
+            )
+            self.assertEqual(len(result), 3)
+            self.assertEqual(result.consecutive_correct[1], 0)
+
+    def test_deck_setting_selects_algorithm(self):
+        user = User.objects.create_user('learner', password='pw')
+        deck = Deck.objects.create(user=user, name='SM2', scheduler='sm2')
+        card = Card.objects.create(
+            deck=deck, note=Note.objects.intern('字', 'zì', 'c')
+        )
+        for _ in range(3):
+            card.update_performance(True)
+
+        card.refresh_from_db()
+        self.assertEqual(card.interval, 15)
+        self.assertLess(
+            abs(card.next_review - card.last_reviewed_at - timedelta(days=15)),
+            timedelta(seconds=1),
+        )
+
+    def test_reschedule_after_algorithm_change(self):
+        user = User.objects.create_user('learner', password='pw')
+        deck = Deck.objects.create(user=user, name='Deck')
+        card = Card.objects.create(
+            deck=deck, note=Note.objects.intern('字', 'zì', 'c')
+        )
+        card.update_performance(True)
+        card.update_performance(True)
+
+        deck.scheduler = 'sm2'
+        deck.save()
+        deck.reschedule()
+
+        card.refresh_from_db()
+        self.assertEqual(
+            card.next_review, card.last_reviewed_at + timedelta(days=4)
+        )
+
+
+class BackgroundStartTests(TestCase):
+    def test_only_server_processes_start_background_work(self):
+        for argv, serving in (
+            (['manage.py', 'test'], False),
+            (['manage.py', 'migrate'], False),
+            (['manage.py', 'runserver'], True),
+            (['/usr/bin/gunicorn', 'redcard.wsgi'], True),
+        ):
+            with mock.patch.object(sys, 'argv', argv):
+                self.assertEqual(_serving(), serving, argv)
+
+    def test_first_request_starts_the_flusher(self):
+        request_started.connect(
+            _start_background_work, dispatch_uid='flashcards.apps'
+        )
+        with mock.patch(
+            'flashcards.reviews.ensure_flusher'
+        ) as ensure, mock.patch(
+            'flashcards.jobs.recover_import_jobs'
+        ) as recover:
+            self.client.get(reverse('login'))
+            self.client.get(reverse('login'))
+
+        ensure.assert_called_once_with()
+        recover.assert_called_once_with()
+
+
+@override_settings(REVIEW_WRITE_BEHIND=True, REVIEW_FLUSH_INTERVAL=None)
+class ReviewLogTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('learner', password='pw')
+        self.client.force_login(self.user)
+        self.deck = Deck.objects.create(user=self.user, name='HSK 1')
+        self.card = Card.objects.create(
+            deck=self.deck, note=Note.objects.intern('字', 'zì', 'c')
+        )
+        self.start = timezone.now() - timedelta(days=10)
+
+    def test_review_is_queued_then_flushed(self):
+        record_review(self.card.pk, self.user, True)
+
+        self.card.refresh_from_db()
+        self.assertFalse(self.card.seen)
+
+        self.assertEqual(flush_review_log(), 1)
+
+        self.card.refresh_from_db()
+        self.assertTrue(self.card.seen)
+        log = ReviewLog.objects.get()
+        self.assertTrue(log.applied)
+        self.assertEqual((log.old_interval, log.new_interval), (0, 1))
+
+    def test_flush_replays_pending_reviews_in_order(self):
+        for day, correct in enumerate([True, True, False, True]):
+            record_review(
+                self.card.pk,
+                self.user,
+                correct,
+                reviewed_at=self.start + timedelta(days=day),
+            )
+
+        flush_review_log()
+
+        self.card.refresh_from_db()
+        self.assertEqual(self.card.consecutive_correct, 1)
+        self.assertEqual(
+            self.card.last_reviewed_at, self.start + timedelta(days=3)
+        )
+        self.assertEqual(
+            list(
+                ReviewLog.objects.order_by('reviewed_at').values_list(
+                    'new_interval', flat=True
+                )
+            ),
+            [1, 4, 1, 1],
+        )
+
+    def test_update_performance_applies_pending_reviews_first(self):
+        record_review(self.card.pk, self.user, True, reviewed_at=self.start)
+
+        self.card.update_performance(True)
+        flush_review_log()
+
+        self.card.refresh_from_db()
+        self.assertEqual(self.card.consecutive_correct, 2)
+        self.assertFalse(
+            ReviewLog.objects.filter(new_interval__isnull=True).exists()
+        )
+
+    def test_batch_applies_pending_reviews_first(self):
+        record_review(self.card.pk, self.user, True, reviewed_at=self.start)
+
+        self.client.post(
+            reverse('review-batch'),
+            {
+                'reviews': [
+                    {
+                        'card_id': self.card.pk,
+                        'is_correct': True,
+                        'reviewed_at': (
+                            self.start + timedelta(days=1)
+                        ).isoformat(),
+                    }
+                ]
+            },
+            content_type='application/json',
+        )
+
+        self.card.refresh_from_db()
+        self.assertEqual(self.card.consecutive_correct, 2)
+        self.assertFalse(ReviewLog.objects.filter(applied=False).exists())
+
+    def test_update_performance_endpoint_returns_projected_schedule(self):
+        response = self.client.post(
+            reverse('update-performance', args=[self.card.pk]),
+            {'is_correct': 'true'},
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['consecutive_correct'], 1)
+        self.assertTrue(ReviewLog.objects.filter(applied=False).exists())
+
+    def test_projection_includes_answers_not_flushed_yet(self):
+        for _ in range(3):
+            response = self.client.post(
+                reverse('update-performance', args=[self.card.pk]),
+                {'is_correct': 'true'},
+            )
+
+        projected = response.json()
+        self.assertEqual(projected['consecutive_correct'], 3)
+        flush_review_log()
+        self.card.refresh_from_db()
+        self.assertEqual(self.card.consecutive_correct, 3)
+        self.assertEqual(
+            projected['next_review'],
+            CardSerializer(self.card).data['next_review'],
+        )
+
+
+class DeckStatsCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('learner', password='pw')
+        self.deck = Deck.objects.create(user=self.user, name='HSK 1')
+        self.now = timezone.now()
+        self.card = Card.objects.create(
+            deck=self.deck,
+            note=Note.objects.intern('字', 'zì', 'c'),
+            next_review=self.now + timedelta(hours=1),
+        )
+
+    def test_second_read_is_a_cache_hit(self):
+        get_deck_stats(self.user.pk, self.now)
+
+        with self.assertNumQueries(0):
+            stats = get_deck_stats(self.user.pk, self.now)
+
+        self.assertEqual(stats[0]['total_cards'], 1)
+        self.assertEqual(stats[0]['due_cards'], 0)
+
+    def test_entry_expires_when_a_card_becomes_due(self):
+        get_deck_stats(self.user.pk, self.now)
+
+        later = self.now + timedelta(hours=2)
+        with self.assertNumQueries(1):
+            stats = get_deck_stats(self.user.pk, later)
+
+        self.assertEqual(stats[0]['due_cards'], 1)
+
+    def test_card_save_invalidates(self):
+        get_deck_stats(self.user.pk, self.now)
+
+        Card.objects.create(
+            deck=self.deck, note=Note.objects.intern('字', 'zì', 'c')
+        )
+
+        self.assertEqual(get_deck_stats(self.user.pk)[0]['total_cards'], 2)
+
+    @override_settings(REVIEW_WRITE_BEHIND=True, REVIEW_FLUSH_INTERVAL=None)
+    def test_review_flush_invalidates(self):
+        self.card.next_review = self.now - timedelta(minutes=1)
+        self.card.save()
+        self.assertEqual(get_deck_stats(self.user.pk)[0]['due_cards'], 1)
+
+        record_review(self.card.pk, self.user, True)
+        flush_review_log()
+
+        self.assertEqual(get_deck_stats(self.user.pk)[0]['due_cards'], 0)
+
+    def test_version_changes_with_the_stats(self):
+        _, version = get_versioned_deck_stats(self.user.pk, self.now)
+        self.assertEqual(
+            get_versioned_deck_stats(self.user.pk, self.now)[1], version
+        )
+
+        later = self.now + timedelta(hours=2)
+        _, expired = get_versioned_deck_stats(self.user.pk, later)
+        Card.objects.create(
+            deck=self.deck, note=Note.objects.intern('字', 'zì', 'c')
+        )
+        _, changed = get_versioned_deck_stats(self.user.pk, later)
+
+        self.assertEqual(len({version, expired, changed}), 3)
+
+    def test_import_invalidates(self):
+        get_deck_stats(self.user.pk)
+
+        AnkiImporterService(self.user).import_deck_from_file(
+            make_apkg([('字', 'zì', 'character')])
+        )
+
+        self.assertEqual(len(get_deck_stats(self.user.pk)), 2)
+
+    def test_serializer_counts_a_deck_missing_from_the_cache(self):
+        get_deck_stats(self.user.pk)
+        # bulk_create sends no signals, so the cached stats go stale.
+        (deck,) = Deck.objects.bulk_create(
+            [Deck(user=self.user, name='HSK 2')]
+        )
+
+        with self.assertNumQueries(1):
+            data = DeckSerializer(deck).data
+
+        self.assertEqual(data['total_cards'], 0)
+        self.assertEqual(data['due_cards'], 0)
+        self.assertEqual(data['progress'], 0)
+
+
+class GlobalQueueTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('learner', password='pw')
+        self.now = timezone.now()
+        self.decks = [
+            Deck.objects.create(user=self.user, name=f'HSK {i}')
+            for i in range(3)
+        ]
+        # Deck i has reviews overdue by i, i+3, i+6 ... hours, so merged by
+        # due date the decks alternate; deck 2 has no new cards.
+        for i, deck in enumerate(self.decks):
+            for j in range(4):
+                self._card(deck, f'{i}-{j}', seen=True, hours=-(i + 3 * j))
+            if i < 2:
+                for j in range(3):
+                    self._card(deck, f'new {i}-{j}', hours=-j)
+        self._card(self.decks[2], 'later', seen=True, hours=5)
+        self.finished = Deck.objects.create(user=self.user, name='Done')
+        self._card(self.finished, 'done', seen=True, hours=5)
+
+    def _card(self, deck, text, hours, seen=False):
+        return Card.objects.create(
+            deck=deck,
+            note=Note.objects.intern(text, 'zì', 'c'),
+            seen=seen,
+            next_review=self.now + timedelta(hours=hours),
+        )
+
+    def test_merges_decks_by_due_date_within_quotas(self):
+        queue = global_queue(
+            self.user,
+            max_new_per_deck=2,
+            max_reviews_per_deck=3,
+            daily_limit=None,
+            now=self.now,
+        )
+
+        reviews = [card for card in queue if card.seen]
+        new_cards = [card for card in queue if not card.seen]
+        self.assertEqual(len(reviews), 9)
+        self.assertEqual(
+            [card.next_review for card in reviews],
+            sorted(card.next_review for card in reviews),
+        )
+        self.assertEqual(reviews[0].deck_id, self.decks[2].pk)
+        self.assertEqual(len(new_cards), 4)
+        self.assertTrue(queue[0].seen)
+        self.assertTrue(queue[-1].seen)
+
+    def test_reads_only_decks_with_cards_to_study(self):
+        get_deck_stats(self.user.pk, self.now)
+
+        # Answers today, then a review and a new-card stream for the two
+        # decks with new cards and a review stream for the third.
+        with self.assertNumQueries(6):
+            global_queue(self.user, daily_limit=100, now=self.now)
+
+    @override_settings(REVIEW_WRITE_BEHIND=True, REVIEW_FLUSH_INTERVAL=None)
+    def test_daily_limit_counts_todays_answers_and_keeps_reviews(self):
+        answered = self.finished.cards.get()
+        for _ in range(3):
+            record_review(answered.pk, self.user, True)
+
+        queue = global_queue(self.user, daily_limit=8, now=self.now)
+
+        self.assertEqual(len(queue), 5)
+        self.assertTrue(all(card.seen for card in queue))
+        self.assertEqual(
+            global_queue(self.user, daily_limit=3, now=self.now), []
+        )
+
+    def test_spread(self):
+        self.assertEqual(
+            spread([1, 2, 3, 4, 5], ['a', 'b']), [1, 'a', 2, 3, 'b', 4, 5]
+        )
+        self.assertEqual(spread([], ['a']), ['a'])
+
+
+class DueFlashcardsViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('learner', password='pw')
+        self.client.force_login(self.user)
+        deck = Deck.objects.create(user=self.user, name='HSK 1')
+        past = timezone.now() - timedelta(days=1)
+        # Pairs share a next_review so pages must break ties on id.
+        self.cards = [
+            Card.objects.create(
+                deck=deck,
+                note=Note.objects.intern(f'字{i}', 'zì', 'c'),
+                next_review=past + timedelta(minutes=i // 2),
+            )
+            for i in range(7)
+        ]
+        Card.objects.create(
+            deck=deck,
+            note=Note.objects.intern('未', 'wèi', 'not yet'),
+            next_review=timezone.now() + timedelta(days=1),
+        )
+
+    def _get(self, **params):
+        return self.client.get(reverse('due-flashcards'), params)
+
+    def test_walks_all_pages_without_gaps_or_repeats(self):
+        ids, cursor = [], None
+        while True:
+            params = {'limit': 3}
+            if cursor:
+                params['cursor'] = cursor
+            data = self._get(**params).json()
+            ids += [card['id'] for card in data['results']]
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+
+        self.assertEqual(ids, [card.pk for card in self.cards])
+
+    def test_page_metadata_comes_from_the_page(self):
+        with self.assertNumQueries(3):
+            data = self._get(limit=2).json()
+
+        self.assertEqual(data['count'], 2)
+        self.assertNotIn('total', data)
+        self.assertEqual(
+            data['next_review'], data['results'][0]['next_review']
+        )
+
+    def test_total_only_on_request(self):
+        data = self._get(limit=2, total='true').json()
+
+        self.assertEqual(data['total'], 7)
+
+    def test_page_size_is_capped(self):
+        with mock.patch('flashcards.views.MAX_PAGE_SIZE', 5):
+            response = self._get(limit=100000)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], 5)
+
+    def test_rejects_bad_cursor(self):
+        response = self._get(cursor='not-a-cursor')
+
+        self.assertEqual(response.status_code, 400)
+
+
+class DeckApiTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('learner', password='pw')
+        self.client.force_login(self.user)
+        self.deck = Deck.objects.create(user=self.user, name='HSK 1')
+        now = timezone.now()
+        self.cards = [
+            Card.objects.create(
+                deck=self.deck,
+                note=Note.objects.intern(f'字{i}', 'zì', 'character'),
+                next_review=now + timedelta(hours=i - 2),
+            )
+            for i in range(5)
+        ]
+        other = User.objects.create_user('other', password='pw')
+        self.other_deck = Deck.objects.create(user=other, name='Theirs')
+
+    def test_deck_list_and_detail_with_sparse_fields(self):
+        decks = self.client.get(reverse('deck-list')).json()
+        detail = self.client.get(
+            reverse('deck-detail', args=[self.deck.pk]),
+            {'fields': 'id,due_cards'},
+        ).json()
+
+        self.assertEqual([deck['id'] for deck in decks], [self.deck.pk])
+        self.assertEqual(decks[0]['total_cards'], 5)
+        self.assertNotIn('cards', decks[0])
+        self.assertEqual(detail, {'id': self.deck.pk, 'due_cards': 3})
+
+    def test_cards_are_paged_with_sparse_fields(self):
+        url = reverse('deck-cards', args=[self.deck.pk])
+        first = self.client.get(url, {'limit': 3, 'fields': 'id'}).json()
+        second = self.client.get(
+            url, {'limit': 3, 'fields': 'id', 'cursor': first['next_cursor']}
+        ).json()
+
+        self.assertEqual(first['results'][0], {'id': self.cards[0].pk})
+        self.assertIsNone(second['next_cursor'])
+        self.assertEqual(
+            [card['id'] for card in first['results'] + second['results']],
+            [card.pk for card in self.cards],
+        )
+
+    def test_unknown_fields_are_rejected(self):
+        for name in ('deck-cards', 'deck-export', 'deck-detail'):
+            response = self.client.get(
+                reverse(name, args=[self.deck.pk]), {'fields': 'id,deck'}
+            )
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('deck', response.json()['fields'][0])
+
+    def test_other_users_decks_are_not_found(self):
+        for name in ('deck-detail', 'deck-cards', 'deck-export'):
+            response = self.client.get(
+                reverse(name, args=[self.other_deck.pk])
+            )
+            self.assertEqual(response.status_code, 404)
+
+    def test_export_matches_the_serializer(self):
+        cards = Card.objects.filter(deck=self.deck).select_related('note')
+        expected = CardSerializer(cards.order_by('pk'), many=True).data
+
+        # Session, user, deck ownership and one query for every card.
+        with self.assertNumQueries(4):
+            response = self.client.get(
+                reverse('deck-export', args=[self.deck.pk])
+            )
+            exported = json.loads(b''.join(response.streaming_content))
+        sparse = list(export_cards(cards, ['id', 'created_at']))
+
+        self.assertEqual(exported, json.loads(json.dumps(expected)))
+        self.assertEqual(
+            sparse[0],
+            {'id': self.cards[0].pk, 'created_at': expected[0]['created_at']},
+        )
+
+
+class CardAdminActionTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', password='pw')
+        self.client.force_login(self.admin)
+        self.user = User.objects.create_user('learner', password='pw')
+        self.deck = Deck.objects.create(user=self.user, name='HSK 1')
+        past = timezone.now() - timedelta(days=1)
+        self.cards = Card.objects.bulk_create(
+            [
+                Card(
+                    deck=self.deck,
+                    note=Note.objects.intern(f'字{i}', 'zì', 'c'),
+                    next_review=past,
+                    seen=True,
+                    interval=12,
+                    consecutive_correct=3,
+                )
+                for i in range(3)
+            ]
+        )
+
+    def _run(self, url_name, action, objects, **extra):
+        return self.client.post(
+            reverse(url_name),
+            {
+                'action': action,
+                '_selected_action': [obj.pk for obj in objects],
+                **extra,
+            },
+        )
+
+    def test_suspended_cards_are_not_due(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self._run(
+                'admin:flashcards_card_changelist',
+                'suspend_cards',
+                self.cards[:2],
+            )
+        updates = [
+            q for q in ctx.captured_queries if q['sql'].startswith('UPDATE')
+        ]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(self.deck.get_due_cards().count(), 1)
+        deck = Deck.objects.with_stats().get()
+        self.assertEqual((deck.total_cards, deck.due_cards), (3, 1))
+
+        self._run(
+            'admin:flashcards_deck_changelist', 'unsuspend_decks', [self.deck]
+        )
+        self.assertEqual(self.deck.get_due_cards().count(), 3)
+
+    def test_reset_schedule(self):
+        self._run(
+            'admin:flashcards_deck_changelist',
+            'reset_deck_schedules',
+            [self.deck],
+        )
+        card = Card.objects.get(pk=self.cards[0].pk)
+        self.assertFalse(card.seen)
+        self.assertEqual((card.interval, card.consecutive_correct), (0, 0))
+
+    def test_move_to_deck_keeps_cards_with_their_owner(self):
+        target = Deck.objects.create(user=self.user, name='HSK 2')
+        foreign = Deck.objects.create(
+            user=User.objects.create_user('other', password='pw'), name='X'
+        )
+        self._run(
+            'admin:flashcards_card_changelist',
+            'move_to_deck',
+            self.cards[:2],
+            deck=target.pk,
+        )
+        self.assertEqual(target.cards.count(), 2)
+
+        self._run(
+            'admin:flashcards_card_changelist',
+            'move_to_deck',
+            self.cards,
+            deck=foreign.pk,
+        )
+        self.assertFalse(foreign.cards.exists())
+
+
+class GenerateSyntheticDataTests(TestCase):
+    def test_generates_due_and_future_cards(self):
+        call_command(
+            'generate_synthetic_data',
+            users=2,
+            decks_per_user=2,
+            cards_per_deck=100,
+            notes=50,
+            stdout=io.StringIO(),
+        )
+
+        self.assertEqual(Deck.objects.count(), 4)
+        now = timezone.now()
+        due = Card.objects.filter(next_review__lte=now).count()
+        upcoming = Card.objects.filter(next_review__gt=now).count()
+        self.assertGreater(due, 0)
+        self.assertGreater(upcoming, due)
+        self.assertFalse(
+            Card.objects.filter(seen=True, last_reviewed_at=None).exists()
+        )
+        self.assertLessEqual(Note.objects.count(), 50)
+
+        with self.assertRaises(CommandError):
+            call_command('generate_synthetic_data', users=1)
+
+
+@override_settings(REVIEW_WRITE_BEHIND=True, REVIEW_FLUSH_INTERVAL=None)
+class DueForecastTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('learner', password='pw')
+        self.client.force_login(self.user)
+        self.deck = Deck.objects.create(user=self.user, name='HSK 1')
+        now = timezone.now()
+        self.cards = [
+            Card.objects.create(
+                deck=self.deck,
+                note=Note.objects.intern(f'字{i}', 'zì', 'c'),
+                next_review=now + timedelta(days=offset),
+                seen=offset > 0,
+            )
+            for i, offset in enumerate([-3, 0, 2, 2, 40])
+        ]
+
+    def _stored(self):
+        return {
+            (row.deck_id, row.day): row.due_count
+            for row in DueForecast.objects.filter(user=self.user)
+        }
+
+    def _scanned(self):
+        counts = {}
+        cards = Card.objects.filter(deck__user=self.user, suspended=False)
+        for card in cards:
+            key = (card.deck_id, forecast_day(card.next_review))
+            counts[key] = counts.get(key, 0) + 1
+        return counts
+
+    def test_overdue_cards_are_counted_today(self):
+        forecast = get_due_forecast(self.user.id, days=30)
+
+        self.assertEqual(len(forecast), 30)
+        self.assertEqual(forecast[0], (today(), 2))
+        self.assertEqual(forecast[2][1], 2)
+        self.assertEqual(sum(count for _, count in forecast), 4)
+
+    def test_reviews_move_cards_between_days(self):
+        reviewed_at = timezone.now()
+        apply_review_batch(
+            self.user,
+            [
+                {
+                    'card_id': card.pk,
+                    'is_correct': True,
+                    'reviewed_at': reviewed_at,
+                }
+                for card in self.cards[:3]
+            ],
+        )
+        record_review(self.cards[4].pk, self.user, False)
+        flush_review_log()
+
+        self.assertEqual(self._stored(), self._scanned())
+        self.assertNotIn(0, self._stored().values())
+
+    def test_imported_cards_are_added(self):
+        deck = AnkiImporterService(self.user).import_deck_from_file(
+            make_apkg([('一', 'yī', 'one'), ('二', 'èr', 'two')])
+        )
+
+        self.assertEqual(self._stored()[deck.pk, today()], 2)
+        self.assertEqual(self._stored(), self._scanned())
+
+    def test_update_performance_runs_constant_queries(self):
+        def answer(card):
+            card = Card.objects.select_related('deck__user').get(pk=card.pk)
+            with CaptureQueriesContext(connection) as ctx:
+                card.update_performance(True)
+            return len(ctx.captured_queries)
+
+        # Savepoint, locking SELECT, pending-log check, card UPDATE,
+        # forecast SELECT and upsert, log INSERT, release.
+        self.assertEqual(answer(self.cards[2]), 8)
+        Card.objects.bulk_create(
+            Card(
+                deck=self.deck,
+                note=self.cards[0].note,
+                next_review=self.cards[3].next_review,
+            )
+            for _ in range(200)
+        )
+        rebuild_due_forecast(self.user.id)
+        self.assertEqual(answer(self.cards[3]), 8)
+        self.assertEqual(self._stored(), self._scanned())
+
+    def test_card_saves_move_the_card_without_a_rebuild(self):
+        other = Deck.objects.create(user=self.user, name='HSK 2')
+        with CaptureQueriesContext(connection) as ctx:
+            card = Card.objects.get(pk=self.cards[4].pk)
+            card.next_review = timezone.now() + timedelta(days=5)
+            card.save()
+            card.deck = other
+            card.save()
+            card = Card.objects.get(pk=self.cards[2].pk)
+            card.suspended = True
+            card.save()
+            Card.objects.create(deck=other, note=card.note)
+
+        self.assertEqual(self._stored(), self._scanned())
+        self.assertFalse(
+            [q for q in ctx.captured_queries if 'GROUP BY' in q['sql']]
+        )
+
+    def test_bulk_edits_rebuild_the_forecast(self):
+        Card.objects.filter(pk__in=[c.pk for c in self.cards[2:4]]).suspend()
+        self.assertEqual(self._stored(), self._scanned())
+
+        other = Deck.objects.create(user=self.user, name='HSK 2')
+        Card.objects.filter(pk=self.cards[0].pk).move_to(other)
+        self.assertEqual(self._stored(), self._scanned())
+
+        self.deck.delete()
+        self.assertEqual(self._stored(), self._scanned())
+
+    def test_api(self):
+        response = self.client.get(
+            reverse('due-forecast'), {'days': 90, 'deck': self.deck.pk}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(len(data['days']), 90)
+        self.assertEqual(data['total'], 5)
+        self.assertEqual(data['days'][0]['due'], 2)
+
+        for days in ('0', '1000', 'x'):
+            response = self.client.get(reverse('due-forecast'), {'days': days})
+            self.assertEqual(response.status_code, 400)
@@ -1,15 +1,48 @@
 from django.urls import path
-from .views import DueFlashcardsView, UpdatePerformanceView
+from .views import (
+    DeckCardsView,
+    DeckDetailView,
+    DeckExportView,
+    DeckListView,
+    DueFlashcardsView,
+    DueForecastView,
+    ReviewBatchView,
+    UpdatePerformanceView,
+    metrics_view,
+)
 
 urlpatterns = [
+    path('api/decks/', DeckListView.as_view(), name='deck-list'),
+    path('api/decks/<int:pk>/', DeckDetailView.as_view(), name='deck-detail'),
+    path(
+        'api/decks/<int:pk>/cards/',
+        DeckCardsView.as_view(),
+        name='deck-cards',
+    ),
+    path(
+        'api/decks/<int:pk>/export/',
+        DeckExportView.as_view(),
+        name='deck-export',
+    ),
     path(
         'api/flashcards/due/',
         DueFlashcardsView.as_view(),
         name='due-flashcards',
     ),
+    path(
+        'api/flashcards/forecast/',
+        DueForecastView.as_view(),
+        name='due-forecast',
+    ),
     path(
         'api/flashcards/<int:pk>/update/',
         UpdatePerformanceView.as_view(),
         name='update-performance',
     ),
+    path(
+        'api/flashcards/reviews/batch/',
+        ReviewBatchView.as_view(),
+        name='review-batch',
+    ),
+    path('metrics', metrics_view, name='metrics'),
 ]
@@ -1,44 +1,272 @@
+import hmac
+import json
+from itertools import islice
+
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
+from django.conf import settings
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.utils import timezone
+from . import metrics
+from .due_forecast import (
+    DEFAULT_FORECAST_DAYS,
+    MAX_FORECAST_DAYS,
+    get_due_forecast,
+)
+from .metrics import timed
 from .models import Deck, Card
-from .serializers import CardSerializer
+from .pagination import MAX_PAGE_SIZE, InvalidCursor, keyset_page
+from .reviews import (
+    apply_logged_reviews,
+    apply_review_batch,
+    record_review,
+)
+from .serializers import (
+    CardSerializer,
+    DeckSerializer,
+    ReviewBatchSerializer,
+    export_cards,
+)
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+def requested_fields(request):
+    """The names in a ``?fields=a,b`` query parameter, or None."""
+    value = request.query_params.get('fields')
+    if not value:
+        return None
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+def parse_limit(request, default=10):
+    """
+    The 'limit' query parameter capped at MAX_PAGE_SIZE, or an error
+    Response.
+    """
+    limit = request.query_params.get('limit', str(default))
+    try:
+        limit = int(limit)
+    except ValueError:
+        return Response(
+            {'error': 'Limit must be an integer.'},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    if limit < 1:
+        return Response(
+            {'error': 'Limit must be positive.'},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    return min(limit, MAX_PAGE_SIZE)
 
 
 class DueFlashcardsView(APIView):
     """
-    GET endpoint that returns cards due for review from user's decks
-    Accepts 'limit' query parameter to limit results (default: 10)
+    GET endpoint that returns cards due for review from user's decks,
+    oldest first, one page at a time.
+    Accepts 'limit' (page size, default 10, max 100), 'cursor' (the
+    'next_cursor' of the previous page) and 'total=true' to also count
+    every due card.
     """
 
     permission_classes = [IsAuthenticated]
 
+    @timed('http_view', view='due_flashcards')
     def get(self, request):
-        # Get and validate limit parameter
-        limit = request.query_params.get('limit', '10')
+        limit = parse_limit(request)
+        if isinstance(limit, Response):
+            return limit
+
+        # Get due cards from user's decks
+        due_cards = Card.objects.filter(
+            deck__user=request.user,
+            next_review__lte=timezone.now(),
+            suspended=False,
+        )
         try:
-            limit = int(limit)
-        except ValueError:
+            cards, next_cursor = keyset_page(
+                due_cards.select_related('note'),
+                limit,
+                request.query_params.get('cursor'),
+            )
+        except InvalidCursor as e:
             return Response(
-                {'error': 'Limit must be an integer.'},
-                status=status.HTTP_400_BAD_REQUEST,
+                {'error': str(e)}, status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Get due cards from user's decks
-        due_cards = Card.objects.filter(
-            deck__user=request.user, next_review__lte=timezone.now()
-        ).order_by('next_review')[:limit]
+        data = {
+            'count': len(cards),
+            'next_review': cards[0].next_review if cards else None,
+            'next_cursor': next_cursor,
+            'results': CardSerializer(cards, many=True).data,
+        }
+        if request.query_params.get('total', '').lower() in ['true', '1']:
+            data['total'] = due_cards.count()
+        return Response(data, status=status.HTTP_200_OK)
+
 
-        serializer = CardSerializer(due_cards, many=True)
+class DeckListView(APIView):
+    """
+    GET endpoint that lists the user's decks with their card counts.
+    Accepts 'fields' (comma-separated) to return only some fields.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    @timed('http_view', view='deck_list')
+    def get(self, request):
+        decks = Deck.objects.filter(user=request.user).with_stats()
+        serializer = DeckSerializer(
+            decks.order_by('pk'), many=True, fields=requested_fields(request)
+        )
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class DeckDetailView(APIView):
+    """
+    GET endpoint for one deck and its card counts. The cards themselves
+    are paged by DeckCardsView. Accepts 'fields' like DeckListView.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    @timed('http_view', view='deck_detail')
+    def get(self, request, pk):
+        deck = (
+            Deck.objects.filter(pk=pk, user=request.user).with_stats().first()
+        )
+        if deck is None:
+            return Response(
+                {'error': 'Deck not found.'}, status=status.HTTP_404_NOT_FOUND
+            )
+        serializer = DeckSerializer(deck, fields=requested_fields(request))
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class DeckCardsView(APIView):
+    """
+    GET endpoint that pages through the cards of a deck in review order.
+    Accepts 'limit' and 'cursor' like DueFlashcardsView, and 'fields'
+    (comma-separated) to return only some card fields.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    @timed('http_view', view='deck_cards')
+    def get(self, request, pk):
+        limit = parse_limit(request)
+        if isinstance(limit, Response):
+            return limit
+        if not Deck.objects.filter(pk=pk, user=request.user).exists():
+            return Response(
+                {'error': 'Deck not found.'}, status=status.HTTP_404_NOT_FOUND
+            )
+        # Validate the fields before running the page query.
+        fields = requested_fields(request)
+        child = CardSerializer(fields=fields)
+
+        cards = Card.objects.filter(deck_id=pk)
+        if any(f.source.startswith('note.') for f in child.fields.values()):
+            cards = cards.select_related('note')
+        try:
+            cards, next_cursor = keyset_page(
+                cards, limit, request.query_params.get('cursor')
+            )
+        except InvalidCursor as e:
+            return Response(
+                {'error': str(e)}, status=status.HTTP_400_BAD_REQUEST
+            )
         return Response(
             {
-                'count': due_cards.count(),
-                'next_review': due_cards.first().next_review
-                if due_cards
-                else None,
-                'results': serializer.data,
+                'count': len(cards),
+                'next_cursor': next_cursor,
+                'results': CardSerializer(
+                    cards, many=True, fields=fields
+                ).data,
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class DeckExportView(APIView):
+    """
+    GET endpoint that streams every card of a deck as a JSON array, in
+    the format of CardSerializer but built straight from database rows.
+    Accepts 'fields' like DeckCardsView.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    @timed('http_view', view='deck_export')
+    def get(self, request, pk):
+        if not Deck.objects.filter(pk=pk, user=request.user).exists():
+            return Response(
+                {'error': 'Deck not found.'}, status=status.HTTP_404_NOT_FOUND
+            )
+        cards = export_cards(
+            Card.objects.filter(deck_id=pk),
+            requested_fields(request),
+            chunk_size=EXPORT_CHUNK_SIZE,
+        )
+        response = StreamingHttpResponse(
+            _json_array(cards), content_type='application/json'
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="deck-{pk}.json"'
+        )
+        return response
+
+
+def _json_array(items):
+    # Encodes a chunk of items per call to keep json.dumps overhead low.
+    yield '['
+    separator = ''
+    while chunk := list(islice(items, EXPORT_CHUNK_SIZE)):
+        encoded = json.dumps(
+            chunk, ensure_ascii=False, separators=(',', ':')
+        )
+        yield separator + encoded[1:-1]
+        separator = ','
+    yield ']'
+
+
+class DueForecastView(APIView):
+    """
+    GET endpoint that returns how many cards fall due on each of the next
+    'days' days (default 30, max 365), overdue cards counted on today.
+    Accepts 'deck' to count a single deck.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    @timed('http_view', view='due_forecast')
+    def get(self, request):
+        try:
+            days = int(request.query_params.get('days', DEFAULT_FORECAST_DAYS))
+            deck_id = request.query_params.get('deck')
+            deck_id = None if deck_id is None else int(deck_id)
+        except ValueError:
+            return Response(
+                {'error': "'days' and 'deck' must be integers."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if not 1 <= days <= MAX_FORECAST_DAYS:
+            return Response(
+                {
+                    'error': f"'days' must be between 1 and "
+                    f'{MAX_FORECAST_DAYS}.'
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        forecast = get_due_forecast(request.user.id, days, deck_id)
+        return Response(
+            {
+                'total': sum(count for _, count in forecast),
+                'days': [
+                    {'date': day, 'due': count} for day, count in forecast
+                ],
             },
             status=status.HTTP_200_OK,
         )
@@ -52,10 +280,13 @@ class UpdatePerformanceView(APIView):
 
     permission_classes = [IsAuthenticated]
 
+    @timed('http_view', view='update_performance')
     def post(self, request, pk):
         try:
             # Get card ensuring it belongs to the user
-            card = Card.objects.get(pk=pk, deck__user=request.user)
+            card = Card.objects.select_related('deck', 'note').get(
+                pk=pk, deck__user=request.user
+            )
         except Card.DoesNotExist:
             return Response(
                 {'error': 'Card not found.'}, status=status.HTTP_404_NOT_FOUND
@@ -78,7 +309,69 @@ class UpdatePerformanceView(APIView):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        # Update and return response
-        card.update_performance(is_correct)
+        # Queue the review and return the projected schedule; the card row
+        # itself is updated by the review log flusher. Earlier answers may
+        # still be waiting in the log too, so all of them are replayed.
+        record_review(card.pk, request.user, is_correct)
+        apply_logged_reviews(card)
         serializer = CardSerializer(card)
         return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class ReviewBatchView(APIView):
+    """
+    POST endpoint that applies a batch of reviews in one request.
+    Body: {"reviews": [{"card_id", "is_correct", "reviewed_at"}, ...]}
+    Re-sending a batch is safe: already applied reviews are skipped.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    @timed('http_view', view='review_batch')
+    def post(self, request):
+        serializer = ReviewBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                serializer.errors, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        cards, skipped, missing = apply_review_batch(
+            request.user, serializer.validated_data['reviews']
+        )
+        return Response(
+            {
+                'applied': len(cards),
+                'skipped': skipped,
+                'missing': missing,
+                'results': [
+                    {
+                        'card_id': card.pk,
+                        'next_review': card.next_review,
+                        'consecutive_correct': card.consecutive_correct,
+                    }
+                    for card in cards
+                ],
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint. Requires ``Authorization: Bearer
+    <METRICS_TOKEN>`` when that setting is set, a staff session otherwise.
+    """
+    if not metrics.enabled():
+        raise Http404
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token:
+        authorized = hmac.compare_digest(
+            request.headers.get('Authorization', ''), f'Bearer {token}'
+        )
+    else:
+        authorized = request.user.is_staff
+    if not authorized:
+        return HttpResponse(status=status.HTTP_403_FORBIDDEN)
+    return HttpResponse(
+        metrics.render(), content_type='text/plain; version=0.0.4'
+    )
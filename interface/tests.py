@@ -1,3 +1,541 @@
-from django.test import TestCase
+from datetime import timedelta
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from flashcards.middleware import QueryBudgetExceeded
+from flashcards.models import Card, Deck, ImportJob, Note, ReviewLog
+from flashcards.reviews import flush_review_log
+from flashcards.tests import make_apkg
+
+
+class DashboardQueryCountTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('learner', password='pw')
+        self.client.force_login(self.user)
+
+    def _add_decks(self, count):
+        past = timezone.now() - timedelta(hours=1)
+        for i in range(count):
+            deck = Deck.objects.create(user=self.user, name=f'Deck {i}')
+            Card.objects.create(
+                deck=deck,
+                note=Note.objects.intern('字', 'zì', 'character'),
+                next_review=past,
+            )
+
+    def _count_queries(self, url_name):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse(url_name))
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def assertConstantQueries(self, url_name):
+        self._add_decks(1)
+        baseline = self._count_queries(url_name)
+        self._add_decks(10)
+        self.assertEqual(self._count_queries(url_name), baseline)
+
+    def test_home_query_count_is_constant(self):
+        self.assertConstantQueries('home')
+
+    def test_due_decks_query_count_is_constant(self):
+        self.assertConstantQueries('due-decks')
+
+    def test_profile_query_count_is_constant(self):
+        self.assertConstantQueries('profile')
+
+    def test_repeat_dashboard_load_skips_the_stats_query(self):
+        self._add_decks(3)
+        first = self._count_queries('profile')
+
+        self.assertEqual(self._count_queries('profile'), first - 1)
+
+    def test_profile_shows_due_forecast(self):
+        self._add_decks(2)
+
+        response = self.client.get(reverse('profile'))
+
+        forecast_data = response.context['forecast_data']
+        self.assertEqual(len(forecast_data), 30)
+        self.assertEqual(forecast_data[0]['due'], 2)
+        self.assertEqual(forecast_data[0]['height'], 100)
+        self.assertContains(response, '2 due')
+
+    def test_home_lists_only_decks_with_due_cards(self):
+        self._add_decks(2)
+        Deck.objects.create(user=self.user, name='Empty')
+
+        response = self.client.get(reverse('home'))
+
+        due_decks_data = response.context['due_decks_data']
+        self.assertEqual(len(due_decks_data), 2)
+        self.assertEqual(due_decks_data[0]['due_cards_count'], 1)
+
+    def test_deck_list_fragment_is_cached_per_stats_version(self):
+        self._add_decks(1)
+        self.client.get(reverse('home'))
+        # Bypasses the signals, so the stats version stays the same.
+        Deck.objects.update(name='Renamed')
+
+        cached = self.client.get(reverse('due-decks'))
+        Card.objects.create(
+            deck=Deck.objects.get(),
+            note=Note.objects.intern('新', 'xīn', 'new'),
+        )
+        refreshed = self.client.get(reverse('due-decks'))
+
+        self.assertContains(cached, 'Deck 0')
+        self.assertContains(refreshed, 'Renamed')
+        self.assertContains(refreshed, '2 total cards')
+
+
+
+class UploadDeckViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('learner', password='pw')
+        self.client.force_login(self.user)
+
+    def test_upload_returns_immediately_with_pollable_job(self):
+        upload = make_apkg([('字', 'zì', 'character')])
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(reverse('upload'), {'anki_file': upload})
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(len(callbacks), 1)
+        job = ImportJob.objects.get(user=self.user)
+        self.assertContains(
+            response,
+            reverse('import_job_status', args=[job.id]),
+            status_code=202,
+        )
+
+    def test_upload_can_target_an_owned_deck(self):
+        deck = Deck.objects.create(user=self.user, name='HSK 1')
+        foreign = Deck.objects.create(
+            user=User.objects.create_user('other', password='pw'), name='X'
+        )
+
+        response = self.client.post(
+            reverse('upload'),
+            {
+                'anki_file': make_apkg([('字', 'zì', 'character')]),
+                'sync_deck': foreign.id,
+            },
+        )
+        self.assertEqual(response.status_code, 400)
+
+        self.client.post(
+            reverse('upload'),
+            {
+                'anki_file': make_apkg([('字', 'zì', 'character')]),
+                'sync_deck': deck.id,
+                'retire_missing': '1',
+            },
+        )
+        job = ImportJob.objects.get(user=self.user)
+        self.assertTrue(job.is_sync)
+        self.assertTrue(job.retire_missing)
+        self.assertEqual(job.deck, deck)
+
+    def test_upload_accepts_several_files(self):
+        uploads = [
+            make_apkg([('一', 'yī', 'one')], name='a.apkg'),
+            make_apkg([('二', 'èr', 'two')], name='b.apkg'),
+        ]
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(
+                reverse('upload'), {'anki_file': uploads}
+            )
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(
+            list(
+                ImportJob.objects.order_by('pk').values_list(
+                    'file_name', flat=True
+                )
+            ),
+            ['a.apkg', 'b.apkg'],
+        )
+
+    def test_job_status_is_private(self):
+        other = User.objects.create_user('other', password='pw')
+        job = ImportJob.objects.create(user=other, file_name='x.apkg')
+
+        response = self.client.get(reverse('import_job_status', args=[job.id]))
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_finished_job_stops_polling(self):
+        job = ImportJob.objects.create(
+            user=self.user, file_name='x.apkg', status=ImportJob.FAILED,
+            error='Broken package',
+        )
+
+        response = self.client.get(reverse('import_job_status', args=[job.id]))
+
+        self.assertContains(response, 'Broken package')
+        self.assertNotContains(response, 'hx-trigger')
+
+
+@override_settings(REVIEW_WRITE_BEHIND=True, REVIEW_FLUSH_INTERVAL=None)
+class StudySessionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('learner', password='pw')
+        self.client.force_login(self.user)
+        self.deck = Deck.objects.create(user=self.user, name='HSK 1')
+        for i in range(3):
+            Card.objects.create(
+                deck=self.deck,
+                note=Note.objects.intern(f'字{i}', 'zì', 'character'),
+            )
+
+    def _start(self):
+        response = self.client.get(reverse('start_session', args=[self.deck.id]))
+        self.assertEqual(response.status_code, 200)
+        return response.context['card']
+
+    def test_answers_render_from_the_session_queue(self):
+        card = self._start()
+        seen = [card['character']]
+
+        while card:
+            # Session, user, the already-graded check, review-log INSERT
+            # and the next card; the queue is carried in the signed cookie.
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(
+                    reverse('update_card', args=[card['id']]),
+                    {'is_correct': 'true'},
+                )
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(queries), 5)
+            writes = [
+                query['sql']
+                for query in queries
+                if not query['sql'].startswith('SELECT')
+            ]
+            self.assertEqual(len(writes), 1)
+            self.assertIn('flashcards_reviewlog', writes[0])
+            card = response.context.get('card')
+            if card:
+                seen.append(card['character'])
+
+        self.assertEqual(sorted(seen), ['字0', '字1', '字2'])
+        self.assertFalse(self.deck.cards.filter(seen=True).exists())
+
+        self.assertEqual(flush_review_log(), 3)
+        self.assertEqual(self.deck.cards.filter(seen=True).count(), 3)
+
+    def test_card_outside_the_queue_is_rejected(self):
+        self._start()
+        other = Card.objects.create(
+            deck=Deck.objects.create(user=self.user, name='HSK 2'),
+            note=Note.objects.intern('外', 'wài', 'outside'),
+        )
+
+        response = self.client.post(
+            reverse('update_card', args=[other.id]), {'is_correct': 'true'}
+        )
+        graded = self.client.post(
+            reverse('grade_card', args=[other.id]), {'is_correct': 'true'}
+        )
+
+        self.assertRedirects(
+            response,
+            reverse('start_session', args=[self.deck.id]),
+            fetch_redirect_response=False,
+        )
+        self.assertEqual(graded.status_code, 409)
+        self.assertFalse(ReviewLog.objects.exists())
+
+    @override_settings(REVIEW_WRITE_BEHIND=True, REVIEW_FLUSH_INTERVAL=None)
+    def test_prefetched_cards_are_graded_in_the_background(self):
+        response = self.client.get(
+            reverse('start_session', args=[self.deck.id])
+        )
+        steps = response.context['steps']
+        self.assertEqual(len(steps), 3)
+        self.assertTrue(response.context['finished'])
+        self.assertContains(
+            response, reverse('grade_card', args=[steps[0]['card']['id']])
+        )
+
+        for step in steps[:2]:
+            with CaptureQueriesContext(connection) as queries:
+                graded = self.client.post(
+                    reverse('grade_card', args=[step['card']['id']]),
+                    {'is_correct': 'true'},
+                )
+            self.assertEqual(graded.status_code, 204)
+            # Session, user, the already-graded check and the review-log
+            # INSERT.
+            self.assertEqual(len(queries), 4)
+
+        resumed = self.client.get(
+            reverse('start_session', args=[self.deck.id])
+        )
+        self.assertEqual(resumed.context['card'], steps[2]['card'])
+        self.assertEqual(resumed.context['cards_done'], 2)
+
+    def test_card_cannot_be_graded_twice(self):
+        first = self._start()
+        url = reverse('update_card', args=[first['id']])
+
+        self.client.post(url, {'is_correct': 'true'})
+        again = self.client.post(url, {'is_correct': 'false'})
+        graded = self.client.post(
+            reverse('grade_card', args=[first['id']]), {'is_correct': 'false'}
+        )
+
+        self.assertEqual(again.status_code, 409)
+        self.assertEqual(graded.status_code, 409)
+        self.assertEqual(ReviewLog.objects.filter(card_id=first['id']).count(), 1)
+
+    def test_reload_resumes_the_queue(self):
+        first = self._start()
+        self.client.post(
+            reverse('update_card', args=[first['id']]), {'is_correct': 'true'}
+        )
+
+        second = self._start()
+
+        self.assertNotEqual(second['id'], first['id'])
+        response = self.client.post(
+            reverse('update_card', args=[second['id']]), {'is_correct': 'true'}
+        )
+        self.assertEqual(response.context['cards_done'], 2)
+
+    def test_tampered_or_foreign_cookie_is_ignored(self):
+        self._start()
+        cookie = self.client.cookies['study_session'].value
+        other = User.objects.create_user('other', password='pw')
+        self.client.force_login(other)
+        self.client.cookies['study_session'] = cookie
+
+        response = self.client.post(
+            reverse('update_card', args=[self.deck.cards.first().id]),
+            {'is_correct': 'true'},
+        )
+
+        self.assertRedirects(
+            response, reverse('due-decks'), fetch_redirect_response=False
+        )
+        self.assertFalse(ReviewLog.objects.exists())
+
+        self.client.cookies['study_session'] = cookie[:-2] + 'xx'
+        self.client.force_login(self.user)
+        response = self.client.post(
+            reverse('update_card', args=[self.deck.cards.first().id]),
+            {'is_correct': 'true'},
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(ReviewLog.objects.exists())
+
+    def test_empty_deck_shows_caught_up_message(self):
+        empty = Deck.objects.create(user=self.user, name='Empty')
+
+        response = self.client.get(reverse('start_session', args=[empty.id]))
+
+        self.assertContains(response, 'All caught up!')
+
+
+@override_settings(REVIEW_WRITE_BEHIND=True, REVIEW_FLUSH_INTERVAL=None)
+class StudyAllTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('learner', password='pw')
+        self.client.force_login(self.user)
+        self.decks = []
+        for i in range(2):
+            deck = Deck.objects.create(user=self.user, name=f'HSK {i}')
+            Card.objects.create(
+                deck=deck, note=Note.objects.intern(f'字{i}', 'zì', 'c')
+            )
+            self.decks.append(deck)
+
+    def test_session_covers_all_decks(self):
+        response = self.client.get(reverse('study_all'))
+
+        self.assertContains(response, 'All Due Decks')
+        steps = response.context['steps']
+        self.assertEqual(
+            {Card.objects.get(pk=step['card']['id']).deck for step in steps},
+            set(self.decks),
+        )
+        graded = self.client.post(
+            reverse('grade_card', args=[steps[0]['card']['id']]),
+            {'is_correct': 'true'},
+        )
+        self.assertEqual(graded.status_code, 204)
+        resumed = self.client.get(reverse('study_all'))
+        self.assertEqual(resumed.context['card'], steps[1]['card'])
+
+    def test_deck_session_does_not_resume_the_global_queue(self):
+        self.client.get(reverse('study_all'))
+
+        response = self.client.get(
+            reverse('start_session', args=[self.decks[0].id])
+        )
+
+        self.assertEqual(len(response.context['steps']), 1)
+
+
+PROFILED_MIDDLEWARE = [
+    'flashcards.middleware.QueryProfilingMiddleware',
+    *settings.MIDDLEWARE,
+]
+
+# Most queries each view may run for a user with several decks; raise a
+# budget only together with the change that needs it.
+QUERY_BUDGETS = {
+    'home': 3,
+    'due-decks': 3,
+    'profile': 4,
+    'upload': 4,
+    'import_job_status': 3,
+    'start_session': 8,
+    'update_card': 5,
+    'grade_card': 4,
+    'study_all': 10,
+    'due-flashcards': 3,
+    'due-forecast': 3,
+    'update-performance': 5,
+    'review-batch': 11,
+    'deck-list': 3,
+    'deck-detail': 3,
+    'deck-cards': 4,
+    'login': 0,
+    'flashcards_deck_changelist': 6,
+}
+
+
+@override_settings(
+    MIDDLEWARE=PROFILED_MIDDLEWARE,
+    QUERY_BUDGETS=QUERY_BUDGETS,
+    QUERY_BUDGET_STRICT=True,
+    REVIEW_WRITE_BEHIND=True,
+    REVIEW_FLUSH_INTERVAL=None,
+)
+class QueryBudgetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('learner', password='pw')
+        self.client.force_login(self.user)
+        past = timezone.now() - timedelta(hours=1)
+        self.decks = []
+        for i in range(3):
+            deck = Deck.objects.create(user=self.user, name=f'Deck {i}')
+            Card.objects.bulk_create(
+                [
+                    Card(
+                        deck=deck,
+                        note=Note.objects.intern(f'字{n}', 'zì', 'c'),
+                        next_review=past,
+                    )
+                    for n in range(5)
+                ]
+            )
+            self.decks.append(deck)
+        self.card = self.decks[0].cards.first()
+
+    def _request(self, method, url_name, *args, **kwargs):
+        response = getattr(self.client, method)(
+            reverse(url_name, args=args), **kwargs
+        )
+        self.assertLess(response.status_code, 400)
+        self.assertIn('queries', response['Server-Timing'])
+        return response
+
+    def test_home(self):
+        self._request('get', 'home')
+
+    def test_due_decks(self):
+        self._request('get', 'due-decks')
+
+    def test_profile(self):
+        self._request('get', 'profile')
+
+    def test_upload(self):
+        self._request('get', 'upload')
+
+    def test_import_job_status(self):
+        job = ImportJob.objects.create(user=self.user, file_name='x.apkg')
+        self._request('get', 'import_job_status', job.id)
+
+    def test_study_session(self):
+        response = self._request('get', 'start_session', self.decks[0].id)
+        first, second = response.context['steps'][:2]
+        self._request(
+            'post',
+            'grade_card',
+            first['card']['id'],
+            data={'is_correct': 'true'},
+        )
+        self._request(
+            'post',
+            'update_card',
+            second['card']['id'],
+            data={'is_correct': 'true'},
+        )
+
+    def test_study_all(self):
+        self._request('get', 'study_all')
+
+    def test_due_flashcards_api(self):
+        self._request('get', 'due-flashcards', data={'limit': 20})
+
+    def test_due_forecast_api(self):
+        self._request('get', 'due-forecast', data={'days': 90})
+
+    def test_update_performance_api(self):
+        self._request(
+            'post',
+            'update-performance',
+            self.card.id,
+            data={'is_correct': 'true'},
+        )
+
+    def test_deck_api(self):
+        self._request('get', 'deck-list')
+        self._request('get', 'deck-detail', self.decks[0].id)
+        self._request('get', 'deck-cards', self.decks[0].id)
+
+    def test_review_batch_api(self):
+        reviewed_at = timezone.now().isoformat()
+        self._request(
+            'post',
+            'review-batch',
+            data={
+                'reviews': [
+                    {
+                        'card_id': card.id,
+                        'is_correct': True,
+                        'reviewed_at': reviewed_at,
+                    }
+                    for card in Card.objects.all()
+                ]
+            },
+            content_type='application/json',
+        )
+
+    def test_login_page(self):
+        self.client.logout()
+        self._request('get', 'login')
+
+    def test_deck_admin_changelist(self):
+        self.user.is_staff = self.user.is_superuser = True
+        self.user.save()
+        self._request('get', 'admin:flashcards_deck_changelist')
+
+    @override_settings(QUERY_BUDGETS={'profile': 0})
+    def test_strict_budget_fails_the_request(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.get(reverse('profile'))
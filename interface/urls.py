@@ -2,9 +2,12 @@ from django.urls import path
 from .views import (
     ProfileView,
     UploadDeckView,
+    ImportJobStatusView,
     HomeView,
     deck_session_view,
+    study_all_view,
     update_card_view,
+    grade_card_view,
     DueDecksHTMLView,
     login_view,
     register_view,
@@ -17,8 +20,11 @@ urlpatterns = [
     path('register/', register_view, name='register'),
     path('logout/', logout_view, name='logout'),
     path('decks/<int:deck_id>/session/', deck_session_view, name='start_session'),
+    path('study/', study_all_view, name='study_all'),
     path('cards/<int:pk>/update/', update_card_view, name='update_card'),
+    path('cards/<int:pk>/grade/', grade_card_view, name='grade_card'),
     path('profile/', ProfileView.as_view(), name='profile'),
     path('upload/', UploadDeckView.as_view(), name='upload'),
+    path('upload/jobs/<int:job_id>/', ImportJobStatusView.as_view(), name='import_job_status'),
     path('due-decks/', DueDecksHTMLView.as_view(), name='due-decks')
 ]
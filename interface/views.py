@@ -1,22 +1,43 @@
 import os
 import logging 
+from datetime import datetime, timezone as dt_timezone
+from itertools import accumulate
+from django.conf import settings
+from django.core import signing
+from django.db.models import F
+from django.http import HttpResponse
+from django.utils import timezone
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, logout
 from django.contrib.auth.decorators import login_required
 from django.utils.decorators import method_decorator
 from django.views.decorators.http import require_http_methods
 from django.urls import reverse_lazy
+from django.db import IntegrityError
 from rest_framework.views import APIView
 from rest_framework import status
-from flashcards.models import Deck, Card
+from flashcards.models import Deck, Card, ImportJob, ReviewLog
 from .forms import LoginForm, RegisterForm
-from flashcards.services import AnkiImporterService, AnkiImportError
+from flashcards.deck_stats import get_versioned_deck_stats
+from flashcards.due_forecast import get_due_forecast
+from flashcards.jobs import create_import_batch, create_import_job
+from flashcards.metrics import timed
+from flashcards.reviews import record_review
+from flashcards.study_queue import global_queue
 
 logger = logging.getLogger(__name__)
 
-FLASHCARD_SESSION_DECK_ID = 'flashcard_session_deck_id'
-FLASHCARD_SESSION_CARD_IDS = 'flashcard_session_card_ids'
-FLASHCARD_SESSION_CURRENT_CARD_INDEX = 'flashcard_session_current_card_index'
+# The study-session queue (deck, card ids and start time) is kept in a
+# signed cookie, so grading a card does not write the session row.
+STUDY_SESSION_COOKIE = 'study_session'
+STUDY_SESSION_SALT = 'interface.study_session'
+STUDY_SESSION_MAX_AGE = 12 * 60 * 60
+# Cards rendered ahead of the current one in the study session.
+SESSION_PREFETCH_CARDS = 5
+# Deck id of the session over all decks in the study-session cookie.
+ALL_DECKS = 0
+# Days shown in the due forecast on the profile page.
+PROFILE_FORECAST_DAYS = 30
 
 
 def login_view(request):
@@ -50,187 +71,326 @@ def logout_view(request):
     logout(request)
     return redirect('login') 
 
+def _due_decks_context(user):
+    # The deck list fragment is cached per stats version; the version is
+    # part of the cached stats, so a cache hit costs no query.
+    decks, version = get_versioned_deck_stats(user.id)
+    return {
+        'due_decks_data': [
+            {
+                'deck': deck,
+                'due_cards_count': deck['due_cards'],
+                'total_cards': deck['total_cards'],
+            }
+            for deck in decks
+            if deck['due_cards'] > 0
+        ],
+        'deck_stats_version': version,
+    }
+
 @method_decorator(login_required, name='dispatch')
 class HomeView(APIView):
     def get(self, request):
-        due_decks_context = []
-        decks = Deck.objects.filter(user=request.user)
-        for deck in decks:
-            due_cards_for_deck = deck.get_due_cards() 
-            if due_cards_for_deck.exists():
-                due_decks_context.append({
-                    'deck': deck,
-                    'due_cards_count': due_cards_for_deck.count(),
-                    'total_cards': deck.card_count 
-                })
-        return render(request, 'index.html', {"due_decks_data": due_decks_context})
+        return render(request, 'index.html', _due_decks_context(request.user))
 
 @method_decorator(login_required, name='dispatch')
 class DueDecksHTMLView(APIView):
     def get(self, request):
-        due_decks_context = []
-        decks = Deck.objects.filter(user=request.user)
-        for deck in decks:
-            due_cards_for_deck = deck.get_due_cards() 
-            if due_cards_for_deck.exists():
-                due_decks_context.append({
-                    'deck': deck,
-                    'due_cards_count': due_cards_for_deck.count(),
-                    'total_cards': deck.card_count 
-                })
-        return render(request, 'due_decks.html', {'due_decks_data': due_decks_context})
-
-def _clear_flashcard_session(session):
-    session.pop(FLASHCARD_SESSION_DECK_ID, None)
-    session.pop(FLASHCARD_SESSION_CARD_IDS, None)
-    session.pop(FLASHCARD_SESSION_CURRENT_CARD_INDEX, None)
-
-def _initialize_or_reset_deck_session(session, deck: Deck):
-    session_cards_qs = deck.next_session(max_new_cards=10, max_review_cards=20)
-    session[FLASHCARD_SESSION_CARD_IDS] = [card.id for card in session_cards_qs]
-    session[FLASHCARD_SESSION_CURRENT_CARD_INDEX] = 0
-    session[FLASHCARD_SESSION_DECK_ID] = deck.id
-    session.modified = True
+        return render(request, 'due_decks.html', _due_decks_context(request.user))
+
+def _encode_study_session(user_id, deck_id, card_ids, started_at):
+    # Card ids are stored as deltas: cards of a deck are mostly created
+    # together, so the deltas are small and compress well.
+    deltas = [card_id - previous for previous, card_id in zip([0] + card_ids, card_ids)]
+    return signing.dumps([user_id, deck_id, int(started_at.timestamp()), deltas], salt=STUDY_SESSION_SALT, compress=True)
+
+def _load_study_session(request):
+    """
+    Returns ``(deck_id, card_ids, started_at)`` from the signed
+    study-session cookie, or None if it is missing, tampered with,
+    expired or belongs to another user.
+    """
+    value = request.COOKIES.get(STUDY_SESSION_COOKIE)
+    if not value:
+        return None
+    try:
+        user_id, deck_id, started_at, deltas = signing.loads(value, salt=STUDY_SESSION_SALT, max_age=STUDY_SESSION_MAX_AGE)
+    except (signing.BadSignature, TypeError, ValueError):
+        return None
+    if user_id != request.user.id:
+        return None
+    return deck_id, list(accumulate(deltas)), datetime.fromtimestamp(started_at, dt_timezone.utc)
+
+def _store_study_session(response, user_id, deck_id, card_ids, started_at):
+    response.set_cookie(
+        STUDY_SESSION_COOKIE,
+        _encode_study_session(user_id, deck_id, card_ids, started_at),
+        max_age=STUDY_SESSION_MAX_AGE,
+        secure=settings.SESSION_COOKIE_SECURE,
+        httponly=True,
+        samesite='Lax',
+    )
+
+def _session_cards(card_ids):
+    """The content of ``card_ids`` in queue order, skipping deleted cards."""
+    rows = Card.objects.filter(pk__in=card_ids).values(
+        'id',
+        character=F('note__character'),
+        pinyin=F('note__pinyin'),
+        translation=F('note__translation'),
+    )
+    by_id = {row['id']: row for row in rows}
+    return [by_id[card_id] for card_id in card_ids if card_id in by_id]
+
+def _render_session_step(request, template, context, upcoming_ids, cards_done, total_cards, cards=None):
+    """
+    Renders the next card of the queue together with up to
+    SESSION_PREFETCH_CARDS following ones. The page flips through the
+    prefetched cards without waiting for the server and grades them
+    through ``grade_card_view``; answering the last one posts to
+    ``update_card_view``, which renders the next window.
+    """
+    window = upcoming_ids[:SESSION_PREFETCH_CARDS + 1]
+    if cards is None:
+        cards = _session_cards(window) if window else []
+    steps = [
+        {
+            'card': card,
+            'cards_done': cards_done + i,
+            'progress_percent': int(((cards_done + i) / total_cards) * 100),
+        }
+        for i, card in enumerate(cards)
+    ]
+    finished = len(window) == len(upcoming_ids)
+    response = render(request, template, {
+        **context,
+        'card': steps[0]['card'] if steps else None,
+        'steps': steps,
+        'finished': finished,
+        'progress_percent': steps[0]['progress_percent'] if steps else 100,
+        'cards_done': cards_done,
+        'total_cards': total_cards,
+    })
+    if not steps:
+        response.delete_cookie(STUDY_SESSION_COOKIE)
+    return response
+
+def _study_session(request, deck_id, build_queue, context):
+    """
+    Resumes the queue in the study-session cookie if it belongs to
+    ``deck_id`` (0 for the all-decks session) and has cards left, or
+    starts a new one from ``build_queue()``.
+    """
+    state = _load_study_session(request)
+    if state is not None and state[0] == deck_id:
+        _, card_ids, started_at = state
+        # Grades are sent without waiting for a reply, so the position is
+        # taken from the review log rather than kept in the cookie.
+        answered = set(ReviewLog.objects.filter(
+            user=request.user, card_id__in=card_ids, reviewed_at__gte=started_at,
+        ).values_list('card_id', flat=True))
+        upcoming_ids = [card_id for card_id in card_ids if card_id not in answered]
+        if upcoming_ids:
+            return _render_session_step(request, 'session.html', context, upcoming_ids, len(card_ids) - len(upcoming_ids), len(card_ids))
+
+    started_at = timezone.now()
+    session_cards = build_queue()
+    card_ids = [card.id for card in session_cards]
+    cards = [
+        {
+            'id': card.id,
+            'character': card.character,
+            'pinyin': card.pinyin,
+            'translation': card.translation,
+        }
+        for card in session_cards[:SESSION_PREFETCH_CARDS + 1]
+    ]
+    response = _render_session_step(request, 'session.html', context, card_ids, 0, len(card_ids), cards)
+    if card_ids:
+        _store_study_session(response, request.user.id, deck_id, card_ids, started_at)
+    return response
+
+def _already_graded(request, card_id, started_at):
+    """Whether ``card_id`` was answered since the session started."""
+    return ReviewLog.objects.filter(
+        user=request.user, card_id=card_id, reviewed_at__gte=started_at,
+    ).exists()
+
+def _restart_session(deck_id):
+    if deck_id == ALL_DECKS:
+        return redirect('study_all')
+    return redirect('start_session', deck_id=deck_id)
 
 @login_required
+@timed('http_view', view='deck_session')
 def deck_session_view(request, deck_id):
     deck = get_object_or_404(Deck, id=deck_id, user=request.user)
+    return _study_session(
+        request, deck.id,
+        lambda: list(deck.next_session(max_new_cards=10, max_review_cards=20)),
+        {'deck': deck},
+    )
 
-    session_deck_id = request.session.get(FLASHCARD_SESSION_DECK_ID)
-    session_card_ids = request.session.get(FLASHCARD_SESSION_CARD_IDS, [])
-
-    if session_deck_id != deck_id or not session_card_ids:
-        _initialize_or_reset_deck_session(request.session, deck)
-        session_card_ids = request.session.get(FLASHCARD_SESSION_CARD_IDS, [])
-
-    current_card_index = request.session.get(FLASHCARD_SESSION_CURRENT_CARD_INDEX, 0)
-
-    if not session_card_ids or current_card_index >= len(session_card_ids):
-        _clear_flashcard_session(request.session)
-        return render(request, 'session_finished.html', {'deck': deck})
 
-    try:
-        current_card_id = session_card_ids[current_card_index]
-        card = get_object_or_404(Card, id=current_card_id, deck=deck)
-    except (IndexError, Card.DoesNotExist):
-        logger.warning(f"Session inconsistency for user {request.user.id}, deck {deck_id}. Resetting session.")
-        _clear_flashcard_session(request.session)
-        return render(request, 'session_error.html', {'deck': deck, 'error_message': "Session error. Please try again."})
-
-    total_cards = len(session_card_ids)
-    progress_percent = int((current_card_index / total_cards) * 100)
-
-    return render(request, 'session.html', {
-        'deck': deck,
-        'card': card,
-        'progress_percent': progress_percent,
-        'cards_done': current_card_index,
-        'total_cards': total_cards
-    })
+@login_required
+@timed('http_view', view='study_all')
+def study_all_view(request):
+    """A session over the due cards of all of the user's decks."""
+    return _study_session(request, ALL_DECKS, lambda: global_queue(request.user), {})
 
 
 @login_required
 @require_http_methods(["POST"])
+@timed('http_view', view='update_card')
 def update_card_view(request, pk): 
-    session_deck_id = request.session.get(FLASHCARD_SESSION_DECK_ID)
-    if not session_deck_id:
-        return redirect('due_decks')
-
-    deck = get_object_or_404(Deck, id=session_deck_id, user=request.user)
-    card = get_object_or_404(Card, pk=pk, deck=deck)
-
-    session_card_ids = request.session.get(FLASHCARD_SESSION_CARD_IDS, [])
-    current_card_index = request.session.get(FLASHCARD_SESSION_CURRENT_CARD_INDEX)
-
-    if current_card_index is None or not session_card_ids or \
-       current_card_index >= len(session_card_ids) or \
-       session_card_ids[current_card_index] != card.id:
+    # The queue lives in a signed cookie rather than the session, so
+    # answering a card never writes to the session table.
+    state = _load_study_session(request)
+    if state is None:
+        return redirect('due-decks')
+    deck_id, card_ids, started_at = state
+
+    if pk not in card_ids:
         logger.warning(f"Card update attempt with inconsistent session for user {request.user.id}, card {pk}.")
-        return redirect('deck_session', deck_id=deck.id)
-
+        return _restart_session(deck_id)
+    # A replayed or double-submitted answer would schedule the card twice.
+    if _already_graded(request, pk, started_at):
+        logger.warning(f"Card {pk} graded twice in the study session of user {request.user.id}.")
+        return HttpResponse(status=status.HTTP_409_CONFLICT)
+
+    # The signed queue was built from the user's own deck, so the card id
+    # is trusted and answering is a single review-log INSERT.
     is_correct = request.POST.get('is_correct', 'false').lower() in ['true', '1', 'yes']
-    card.update_performance(is_correct)
+    try:
+        record_review(pk, request.user, is_correct)
+    except IntegrityError:
+        logger.warning(f"Card {pk} vanished during a session for user {request.user.id}.")
+        response = _restart_session(deck_id)
+        response.delete_cookie(STUDY_SESSION_COOKIE)
+        return response
 
-    request.session[FLASHCARD_SESSION_CURRENT_CARD_INDEX] = current_card_index + 1
-    request.session.modified = True
-    next_card_index = request.session[FLASHCARD_SESSION_CURRENT_CARD_INDEX]
+    cards_done = card_ids.index(pk) + 1
+    return _render_session_step(request, 'partials/card_container.html', {}, card_ids[cards_done:], cards_done, len(card_ids))
 
-    total_cards = len(session_card_ids)
 
-    if next_card_index >= total_cards:
-        _clear_flashcard_session(request.session)
-        return render(request, 'partials/card_container.html')  # Optional: pass final progress here
+@login_required
+@require_http_methods(["POST"])
+@timed('http_view', view='grade_card')
+def grade_card_view(request, pk):
+    """
+    Records the grade of a prefetched card and returns an empty 204; the
+    page has already moved on to the next card.
+    """
+    state = _load_study_session(request)
+    if state is None or pk not in state[1]:
+        logger.warning(f"Grade for card {pk} outside the study session of user {request.user.id}.")
+        return HttpResponse(status=status.HTTP_409_CONFLICT)
+    if _already_graded(request, pk, state[2]):
+        logger.warning(f"Card {pk} graded twice in the study session of user {request.user.id}.")
+        return HttpResponse(status=status.HTTP_409_CONFLICT)
 
+    is_correct = request.POST.get('is_correct', 'false').lower() in ['true', '1', 'yes']
     try:
-        next_card_id = session_card_ids[next_card_index]
-        next_card = get_object_or_404(Card, id=next_card_id, deck=deck)
-    except (IndexError, Card.DoesNotExist):
-        logger.error(f"Failed to fetch next card for user {request.user.id}, deck {deck.id} after advancing index.")
-        _clear_flashcard_session(request.session)
-        return render(request, 'partials/session_error_partial.html', {'deck': deck, 'error_message': "Error loading next card."})
-
-    progress_percent = int((next_card_index / total_cards) * 100)
-
-    return render(request, 'partials/card_container.html', {
-        'card': next_card,
-        'deck': deck,
-        'progress_percent': progress_percent,
-        'cards_done': next_card_index,
-        'total_cards': total_cards
-    })
+        record_review(pk, request.user, is_correct)
+    except IntegrityError:
+        logger.warning(f"Card {pk} vanished during a session for user {request.user.id}.")
+        return HttpResponse(status=status.HTTP_404_NOT_FOUND)
+    return HttpResponse(status=status.HTTP_204_NO_CONTENT)
 
 
 @method_decorator(login_required, name='dispatch')
 class ProfileView(APIView):
     def get(self, request):
-        decks = Deck.objects.filter(user=request.user)
         decks_data = []
         total_progress_sum = 0
 
+        decks, version = get_versioned_deck_stats(request.user.id)
         for deck in decks:
-            progress = deck.get_progress() 
             decks_data.append({
-                'id': deck.id,
-                'name': deck.name,
-                'total_cards': deck.card_count, 
-                'due_cards': deck.due_cards_count, 
-                'progress': progress,
+                'id': deck['id'],
+                'name': deck['name'],
+                'created_at': deck['created_at'],
+                'total_cards': deck['total_cards'],
+                'due_cards': deck['due_cards'],
+                'progress': deck['progress'],
             })
-            total_progress_sum += progress
-        
+            total_progress_sum += deck['progress']
+
         overall_progress = 0
-        if decks.exists():
-            overall_progress = round(total_progress_sum / decks.count())
+        if decks_data:
+            overall_progress = round(total_progress_sum / len(decks_data))
+
+        forecast = get_due_forecast(request.user.id, PROFILE_FORECAST_DAYS)
+        busiest = max((count for _, count in forecast), default=0)
+        forecast_data = [
+            {'day': day, 'due': count, 'height': count * 100 // busiest if busiest else 0}
+            for day, count in forecast
+        ]
 
         return render(request, 'profile.html', {
             'user': request.user,
             'decks_data': decks_data,
             'overall_progress': overall_progress,
+            'deck_stats_version': version,
+            'forecast_data': forecast_data,
         })
 
 @method_decorator(login_required, name='dispatch')
 class UploadDeckView(APIView):
     template_name = 'upload.html' 
 
-    def get(self, request):
-        return render(request, self.template_name)
+    def _active_jobs(self, request):
+        return ImportJob.objects.filter(
+            user=request.user,
+            status__in=[ImportJob.PENDING, ImportJob.RUNNING],
+        )
 
-    def post(self, request):
-        anki_file = request.FILES.get('anki_file')
-        if not anki_file:
-            return render(request, self.template_name, {'error': 'No file uploaded.'}, status=status.HTTP_400_BAD_REQUEST)
+    def _context(self, request, **extra):
+        return {
+            'jobs': self._active_jobs(request),
+            'decks': Deck.objects.filter(user=request.user).only('id', 'name'),
+            **extra,
+        }
 
-        if not anki_file.name.endswith('.apkg'):
-             return render(request, self.template_name, {'error': 'Invalid file type. Please upload an .apkg file.'}, status=status.HTTP_400_BAD_REQUEST)
+    def get(self, request):
+        return render(request, self.template_name, self._context(request))
 
+    def post(self, request):
+        anki_files = request.FILES.getlist('anki_file')
+        if not anki_files:
+            return render(request, self.template_name, self._context(request, error='No file uploaded.'), status=status.HTTP_400_BAD_REQUEST)
+
+        if not all(anki_file.name.endswith('.apkg') for anki_file in anki_files):
+             return render(request, self.template_name, self._context(request, error='Invalid file type. Please upload an .apkg file.'), status=status.HTTP_400_BAD_REQUEST)
+
+        # Optionally update one of the user's decks instead of creating one.
+        sync_deck = None
+        sync_deck_id = request.POST.get('sync_deck')
+        if sync_deck_id:
+            sync_deck = Deck.objects.filter(user=request.user, id=sync_deck_id).first() if sync_deck_id.isdigit() else None
+            if sync_deck is None:
+                return render(request, self.template_name, self._context(request, error='Deck to update not found.'), status=status.HTTP_400_BAD_REQUEST)
+            if len(anki_files) > 1:
+                return render(request, self.template_name, self._context(request, error='A deck can only be updated from a single file.'), status=status.HTTP_400_BAD_REQUEST)
 
-        importer = AnkiImporterService(user=request.user)
         try:
-            importer.import_deck_from_file(anki_file)
-            return redirect(reverse_lazy('profile'))
-        except AnkiImportError as e:
-            logger.warning(f"Anki import failed for user {request.user.id}: {e}")
-            return render(request, self.template_name, {'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            if sync_deck is not None:
+                create_import_job(
+                    request.user, anki_files[0], sync_deck=sync_deck,
+                    retire_missing=bool(request.POST.get('retire_missing')),
+                )
+            else:
+                create_import_batch(request.user, anki_files)
         except Exception as e: 
             logger.error(f"Unexpected error during Anki deck upload for user {request.user.id}: {e}", exc_info=True)
-            return render(request, self.template_name, {'error': 'An unexpected server error occurred. Please try again.'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+            return render(request, self.template_name, self._context(request, error='An unexpected server error occurred. Please try again.'), status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        return render(request, self.template_name, self._context(request), status=status.HTTP_202_ACCEPTED)
+
+@method_decorator(login_required, name='dispatch')
+class ImportJobStatusView(APIView):
+    """HTMX-polled partial showing the progress of one import job."""
+
+    def get(self, request, job_id):
+        job = get_object_or_404(ImportJob, id=job_id, user=request.user)
+        return render(request, 'partials/_import_job.html', {'job': job})
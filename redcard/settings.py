@@ -78,13 +78,22 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Opt-in per-request profiling: query count, DB, template and wall time in
+# a Server-Timing header. QUERY_BUDGETS maps URL names to the most queries
+# each view may run; overruns are logged, or raised with
+# QUERY_BUDGET_STRICT.
+if os.environ.get('QUERY_PROFILING') == '1':
+    MIDDLEWARE.insert(0, 'flashcards.middleware.QueryProfilingMiddleware')
+QUERY_BUDGETS = {}
+QUERY_BUDGET_DEFAULT = None
+QUERY_BUDGET_STRICT = False
+
 ROOT_URLCONF = 'redcard.urls'
 
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
@@ -92,6 +101,17 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            # Compiled templates are kept in memory; the development server
+            # still picks up edits, as it resets this cache on reload.
+            'loaders': [
+                (
+                    'django.template.loaders.cached.Loader',
+                    [
+                        'django.template.loaders.filesystem.Loader',
+                        'django.template.loaders.app_directories.Loader',
+                    ],
+                ),
+            ],
         },
     },
 ]
@@ -102,13 +122,76 @@ WSGI_APPLICATION = 'redcard.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
-DATABASES = {
+# Configured from the environment:
+#   DB_ENGINE        'sqlite' (default) or 'postgresql' (needs psycopg)
+#   DB_NAME          SQLite file path or PostgreSQL database name
+#   DB_USER, DB_PASSWORD, DB_HOST, DB_PORT   PostgreSQL only
+#   DB_CONN_MAX_AGE  seconds to keep a connection open between requests
+#   SQLITE_TUNED     set to 0 to use SQLite's stock settings
+#   SQLITE_BUSY_TIMEOUT  ms to wait for the write lock (default 20000)
+#
+# SQLite runs in WAL mode so readers never block the writer, waits up to
+# SQLITE_BUSY_TIMEOUT ms for the write lock instead of failing with
+# "database is locked", and starts transactions IMMEDIATE so a read that
+# later writes cannot deadlock against another writer.
+
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'redcard'),
+            'USER': os.environ.get('DB_USER', ''),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', ''),
+            'PORT': os.environ.get('DB_PORT', ''),
+        }
+    }
+elif DB_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+        }
+    }
+    if os.environ.get('SQLITE_TUNED', '1') != '0':
+        busy_timeout = int(os.environ.get('SQLITE_BUSY_TIMEOUT', 20000))
+        DATABASES['default']['OPTIONS'] = {
+            'timeout': busy_timeout / 1000,
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                f'PRAGMA busy_timeout={busy_timeout};'
+                'PRAGMA synchronous=NORMAL;'
+                f'PRAGMA mmap_size={2 ** 28};'
+                'PRAGMA cache_size=-20000;'
+            ),
+        }
+else:
+    raise ValueError(f'Unsupported DB_ENGINE {DB_ENGINE!r}.')
+
+DATABASES['default']['CONN_MAX_AGE'] = int(
+    os.environ.get('DB_CONN_MAX_AGE', 60)
+)
+DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+
+
+# Cache
+# Local memory is per process; point this at FileBasedCache (or any shared
+# backend) when running several worker processes so invalidations are seen
+# by all of them.
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'redcard',
     }
 }
 
+# Upper bound, in seconds, on how long dashboard deck counts are cached.
+DECK_STATS_CACHE_TIMEOUT = 300
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
@@ -129,6 +212,46 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Number of threads that run Anki imports in the background. Each one
+# imports a whole batch of uploaded packages, so with two a large upload
+# does not hold up every other user's import; their write batches are
+# short transactions that wait on the busy timeout for each other.
+IMPORT_JOB_WORKERS = 2
+# Processes that unpack and parse Anki packages for the import threads
+# (None: one per CPU; 0: parse in the importing thread).
+IMPORT_PARSE_WORKERS = None
+# Import jobs not updated for this many seconds are taken as abandoned by a
+# stopped process when a server process starts: running ones are failed
+# and pending ones resubmitted.
+IMPORT_JOB_STALE_AFTER = 600
+
+# Extra Anki field names accepted for each card field, e.g.
+# {'translation': ['gloss']}. Field names that are not aliases but score at
+# least ANKI_FIELD_FUZZY_CUTOFF (0-100) against one are matched too; None
+# turns fuzzy matching off.
+ANKI_FIELD_ALIASES = {}
+ANKI_FIELD_FUZZY_CUTOFF = 85
+
+# In-process counters and timing histograms, served at /metrics in the
+# Prometheus text format. The endpoint takes "Authorization: Bearer
+# <METRICS_TOKEN>" when a token is set and a staff login otherwise.
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN') or None
+
+# Graded answers are appended to the review log and folded into card rows
+# by a background flusher every REVIEW_FLUSH_INTERVAL seconds. Set
+# REVIEW_WRITE_BEHIND to False to update cards synchronously instead.
+# Server processes start the flusher on their first request; elsewhere
+# run "manage.py flush_reviews" (e.g. from cron).
+REVIEW_WRITE_BEHIND = True
+REVIEW_FLUSH_INTERVAL = 2.0
+REVIEW_FLUSH_BATCH_SIZE = 1000
+
+# Most cards the all-decks study session hands out per day, counting the
+# answers already given today; None for no limit.
+STUDY_DAILY_LIMIT = 200
+
+
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'home'
 LOGOUT_REDIRECT_URL = 'login'
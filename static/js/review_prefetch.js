@@ -0,0 +1,36 @@
+// Study-session cards that have a prefetched successor carry a
+// data-grade-url. Their grade is posted in the background and the next
+// card is shown right away; the last prefetched card is submitted through
+// htmx as usual, which swaps in the next cards.
+document.addEventListener('submit', function (event) {
+    var form = event.target;
+    var url = form.dataset.gradeUrl;
+    if (!url) {
+        return;
+    }
+    // Runs in the capture phase, before htmx sees the event.
+    event.preventDefault();
+    event.stopPropagation();
+
+    var data = new FormData(form);
+    if (event.submitter && event.submitter.name) {
+        data.append(event.submitter.name, event.submitter.value);
+    }
+    fetch(url, {
+        method: 'POST',
+        body: data,
+        credentials: 'same-origin',
+        keepalive: true,
+    }).then(function (response) {
+        // The queue changed on the server; reload to resume from it.
+        if (!response.ok) {
+            window.location.reload();
+        }
+    }).catch(function (error) {
+        console.error('Grading failed', error);
+    });
+
+    var step = form.closest('.review-step');
+    step.hidden = true;
+    step.nextElementSibling.hidden = false;
+}, true);